@@ -21,13 +21,14 @@ app.register_error_handler(Exception, handle_mta_error)
 mta_factory = MTAServiceFactory()
 
 # import routes
-from backend.api.routes import subway, lirr, mnr, alerts
+from backend.api.routes import subway, lirr, mnr, alerts, metrics
 
 # register blueprints
 app.register_blueprint(subway.bp)
 app.register_blueprint(lirr.bp)
 app.register_blueprint(mnr.bp)
 app.register_blueprint(alerts.bp)
+app.register_blueprint(metrics.bp)
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
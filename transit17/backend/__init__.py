@@ -1,15 +1,29 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from backend.config.settings import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS
+from backend.config.settings import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SQLITE_STORAGE_MODE
 
 db = SQLAlchemy()
 
-def create_app():
+def create_app(config=None, readonly=False):
+    """
+    create the Flask app; serving processes pass readonly=True to read through
+    a pool of read-only connections, writers (collector, cleanup, imports) don't
+    """
     app = Flask(__name__)
     
     # Configure database
     app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = SQLALCHEMY_TRACK_MODIFICATIONS
+    app.config['SQLITE_STORAGE_MODE'] = SQLITE_STORAGE_MODE
+    if config:
+        app.config.update(config)
+    
+    from backend.services.data.storage import engine_options
+    engine_config = engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'], readonly=readonly, mode=app.config['SQLITE_STORAGE_MODE']
+    )
+    engine_config.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_config
     
     # Initialize extensions
     db.init_app(app)
@@ -1,3 +1,3 @@
-from . import subway, lirr, mnr, alerts
+from . import subway, lirr, mnr, alerts, metrics
 
-__all__ = ['subway', 'lirr', 'mnr', 'alerts'] 
\ No newline at end of file
+__all__ = ['subway', 'lirr', 'mnr', 'alerts', 'metrics'] 
\ No newline at end of file
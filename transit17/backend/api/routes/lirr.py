@@ -8,7 +8,7 @@ def get_realtime_data():
     """get LIRR real-time data"""
     try:
         service = MTAServiceFactory.get_service('lirr')
-        data = service.get_realtime_data()
+        data = service.get_realtime_data(use_cache=True)
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,34 @@
+import json
+from flask import Blueprint, jsonify
+from backend.config.settings import COLLECTOR_STATS_FILE
+from backend.services.mta.session import get_connection_stats
+from backend.services.mta.cache import feed_cache
+
+bp = Blueprint('metrics', __name__, url_prefix='/api/metrics')
+
+@bp.route('/http')
+def get_http_metrics():
+    """get MTA API connection reuse counts and handshake time"""
+    try:
+        return jsonify(get_connection_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/cache')
+def get_cache_metrics():
+    """get shared feed cache hit/miss counters"""
+    try:
+        return jsonify(feed_cache.get_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/collector')
+def get_collector_metrics():
+    """get the latest statistics written by the data collector (feed skip counts etc.)"""
+    try:
+        with open(COLLECTOR_STATS_FILE) as f:
+            return jsonify(json.load(f))
+    except FileNotFoundError:
+        return jsonify({'error': 'No collector statistics available'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
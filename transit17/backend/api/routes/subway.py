@@ -28,7 +28,7 @@ def get_line_feed(line):
     """get specified subway line real-time data"""
     try:
         service = MTAServiceFactory.get_service('subway')
-        feed = service.get_line_feed(line)
+        feed = service.get_line_feed(line, use_cache=True)
         return jsonify(feed)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -38,7 +38,7 @@ def get_all_feeds():
     """get all subway line real-time data"""
     try:
         service = MTAServiceFactory.get_service('subway')
-        feeds = service.get_all_feeds()
+        feeds = service.get_all_feeds(use_cache=True)
         return jsonify(feeds)
     except Exception as e:
         return jsonify({'error': str(e)}), 500 
\ No newline at end of file
@@ -1,9 +1,10 @@
 """
 MTA API endpoints configuration
 """
+import os
 
-# Base URL for all MTA API endpoints
-BASE_URL = "https://api-endpoint.mta.info/Dataservice/mtagtfsfeeds"
+# Base URL for all MTA API endpoints, MTA_BASE_URL points it at a local stand-in (see scripts/replay_feeds.py)
+BASE_URL = os.environ.get('MTA_BASE_URL', "https://api-endpoint.mta.info/Dataservice/mtagtfsfeeds")
 
 # Subway Realtime Feeds
 SUBWAY_FEEDS = {
@@ -60,7 +61,7 @@ ELEVATOR_ESCALATOR_JSON = {
 }
 
 # Subway Status URL
-SUBWAY_STATUS_URL = "https://api-endpoint.mta.info/status/subway"
+SUBWAY_STATUS_URL = os.environ.get('MTA_STATUS_URL', "https://api-endpoint.mta.info/status/subway")
 
 def get_feed_url(feed_type, feed_id):
     """
@@ -5,15 +5,105 @@ from datetime import timedelta
 SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.abspath("backend/data/mta_data.db")}'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# SQLite storage mode: 'wal' lets readers run while the collector writes (one
+# pooled writer connection per process, read-only reader pool for serving),
+# 'rollback' keeps the SQLite defaults
+SQLITE_STORAGE_MODE = os.environ.get('SQLITE_STORAGE_MODE', 'wal')
+
+# pragmas applied to every connection in 'wal' mode
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',      # WAL stays consistent, only the last commits can be lost on power failure
+    'cache_size': -64000,         # KiB of page cache per connection
+    'mmap_size': 268435456,       # bytes of the database file read through mmap
+    'busy_timeout': 10000,        # ms to wait for the other process' write lock
+    'temp_store': 'MEMORY',
+    'journal_size_limit': 67108864
+}
+
+# read-only connections per serving process in 'wal' mode
+SQLITE_READER_POOL_SIZE = 8
+
 # data retention period (hours)
 DATA_RETENTION_HOURS = 24
 
+# hours of realtime data per table partition, should divide 24; retention drops whole partitions
+REALTIME_PARTITION_HOURS = 1
+
 # data cleanup interval (minutes)
 CLEANUP_INTERVAL_MINUTES = 60
 
 # API polling interval (seconds)
 API_POLL_INTERVAL = 30
 
+# per-feed adaptive polling (collector)
+FEED_POLL_MIN_INTERVAL = 5  # seconds, also the probe interval while a feed's period is unknown
+FEED_POLL_MAX_INTERVAL = 120  # seconds
+FEED_POLL_DELAY = 2  # seconds after a feed's expected update to poll it
+FEED_POLL_JITTER = 1.5  # max random seconds added to every poll
+FEED_POLL_RETRY_INTERVAL = 5  # seconds before polling again when no new data was found
+
+# per-feed circuit breaker (collector)
+BREAKER_FAILURE_THRESHOLD = 3  # consecutive failures that open the breaker
+BREAKER_RESET_TIMEOUT = 30  # seconds the breaker stays open the first time
+BREAKER_MAX_BACKOFF = 300  # seconds, cap for the doubling open period
+
+# concurrent feed fetching
+FEED_FETCH_CONCURRENCY = 8  # max feeds fetched at the same time
+FEED_FETCH_TIMEOUT = 10  # seconds allowed for each feed
+
+# HTTP connection pooling for MTA API requests
+HTTP_CONNECT_TIMEOUT = 3.05  # seconds
+HTTP_READ_TIMEOUT = 10  # seconds
+HTTP_POOL_CONNECTIONS = 4  # number of hosts with a cached connection pool
+HTTP_POOL_MAXSIZE = 8  # keep-alive connections kept per host
+
+# scripts/serve_data.py
+SERVE_WORKERS = SQLITE_READER_POOL_SIZE  # threads handling requests, one reader connection each
+SERVE_BACKLOG = 64  # accepted connections waiting for a worker, more are answered 503
+SERVE_REQUEST_TIMEOUT = 10  # seconds from accept to response, socket I/O and queries included
+
+# dashboard payloads (/api/status) materialized once per live state generation
+PAYLOAD_MAX_AGE = 30  # seconds, rebuilt after this even without a new generation (time windows move)
+PAYLOAD_GZIP_LEVEL = 6
+
+# server-sent event stream of live state changes (/api/stream of serve_data.py)
+STREAM_MAX_CLIENTS = 1000  # connected clients per serving process, more are answered 503
+STREAM_MAX_BUFFER = 1048576  # bytes of events waiting for a client before they are dropped for a new snapshot
+STREAM_CLIENT_TIMEOUT = 60  # seconds a client may read nothing of what is queued for it before it is dropped
+STREAM_KEEPALIVE_INTERVAL = 15  # seconds without events before a comment line is sent
+
+# shared in-process cache for upstream MTA feeds (API endpoints)
+FEED_CACHE_TTL = 15  # seconds a cached feed is served as fresh
+FEED_CACHE_STALE_TTL = 60  # seconds an expired feed may still be served while it refreshes
+
+# collector statistics (feed skip counts etc.), rewritten after every collection cycle
+COLLECTOR_STATS_FILE = os.path.abspath("backend/data/collector_stats.json")
+
+# live state of the realtime feeds (latest trips, vehicles and arrivals), kept in
+# memory by the collector and published to the serving processes after every cycle
+LIVE_STATE_ENABLED = True
+LIVE_STATE_FILE = os.path.abspath("backend/data/live_state.pickle")
+LIVE_STATE_MAX_AGE = 300  # seconds; older feeds are left out, an older snapshot is not served
+LIVE_STATE_CHECK_INTERVAL = 1  # seconds between checks of a serving process for a new snapshot
+
+# realtime ingest writes only new or changed trips and vehicles, plus end markers
+REALTIME_CHANGE_CAPTURE = True
+
+# string ids of the realtime tables are stored as codes of interned_ids; codes the
+# collector resolved are cached, the cache is cleared once it holds this many ids
+INTERNED_ID_CACHE_SIZE = 200000
+
+# append-only raw feed archive (long-term history of every fetched FeedMessage)
+FEED_ARCHIVE_ENABLED = True
+FEED_ARCHIVE_DIR = os.path.abspath("backend/data/archive")
+FEED_ARCHIVE_RETENTION_DAYS = 90  # whole day segments older than this are deleted
+FEED_ARCHIVE_MAX_PENDING_SECONDS = 300  # snapshots wait at most this long for their chunk to fill
+
+# columnar vehicle position history (memory-mapped day segments for analytics)
+POSITION_HISTORY_ENABLED = True
+POSITION_HISTORY_DIR = os.path.abspath("backend/data/history")
+POSITION_HISTORY_RETENTION_DAYS = 90  # whole days older than this are deleted
+
 # logging configuration
 LOG_LEVEL = 'INFO'
 LOG_FILE = 'app.log'
@@ -29,12 +119,22 @@ GTFS_URLS = {
     'mnr': 'http://web.mta.info/developers/data/mnr/google_transit.zip'
 }
 
+# rows per insert statement of the GTFS static importer
+GTFS_IMPORT_CHUNK_SIZE = 20000
+
+# worker processes of the parallel GTFS static import
+GTFS_IMPORT_WORKERS = os.cpu_count() or 1
+
+# rows per insert statement of the batched realtime ingest
+REALTIME_INGEST_BATCH_SIZE = 1000
+
 # data storage configuration
 class StorageConfig:
-    # data chunk size (amount of data each chunk can store)
+    # data chunk size (amount of data each chunk can store), in feed entities
+    # for the raw feed archive
     CHUNK_SIZE = 1000
     
-    # enable data compression
+    # enable data compression (raw feed archive chunks)
     ENABLE_COMPRESSION = True
     
     # API polling interval (seconds)
@@ -1,9 +1,12 @@
 from .base import BaseModel
+from .interned import InternedString, interned_ids
 from .realtime import TripUpdate, StopTimeUpdate, VehiclePosition, ServiceAlert
-from .static import Route, Stop, Trip, StopTime, route_stops
+from .static import Route, Stop, Trip, StopTime, route_stops, FeedVersion, feed_row_hashes
 
 __all__ = [
     'BaseModel',
+    'InternedString',
+    'interned_ids',
     'TripUpdate',
     'StopTimeUpdate',
     'VehiclePosition',
@@ -12,5 +15,7 @@ __all__ = [
     'Stop',
     'Trip',
     'StopTime',
-    'route_stops'
+    'route_stops',
+    'FeedVersion',
+    'feed_row_hashes'
 ] 
\ No newline at end of file
@@ -0,0 +1,37 @@
+from sqlalchemy import select
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import ClauseElement
+from sqlalchemy.types import TypeDecorator
+from backend import db
+
+# dictionary of the string ids of the realtime tables, every distinct id is stored once
+interned_ids = db.Table(
+    'interned_ids',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('value', db.String(100), nullable=False, unique=True)
+)
+
+class InternedString(TypeDecorator):
+    """
+    A string id stored as its integer code in interned_ids
+
+    The translation happens in SQL: selected columns are looked up by code,
+    compared values by string, so models and queries keep using strings.
+    Writers store codes (RealtimeImporter through IdResolver); a string that
+    was never interned matches nothing.
+    """
+    impl = db.Integer
+    cache_ok = True
+
+    class comparator_factory(TypeDecorator.Comparator):
+        def operate(self, op, *other, **kwargs):
+            # IN takes a list of strings, looked up in one subquery
+            if op in (operators.in_op, operators.not_in_op) and not isinstance(other[0], ClauseElement):
+                other = (select(interned_ids.c.id).where(interned_ids.c.value.in_(other[0])),)
+            return super().operate(op, *other, **kwargs)
+
+    def bind_expression(self, bindvalue):
+        return select(interned_ids.c.id).where(interned_ids.c.value == bindvalue).scalar_subquery()
+
+    def column_expression(self, column):
+        return select(interned_ids.c.value).where(interned_ids.c.id == column).scalar_subquery()
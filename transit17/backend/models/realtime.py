@@ -1,19 +1,27 @@
 from datetime import datetime
 from backend.models.base import BaseModel
+from backend.models.interned import InternedString
 from backend import db
 
 class TripUpdate(BaseModel):
     """Model for GTFS trip updates"""
     __tablename__ = 'trip_updates'
+    __table_args__ = (
+        # latest trips of a route, route state at a time
+        db.Index('ix_trip_updates_route_id_feed_timestamp', 'route_id', 'feed_timestamp'),
+    )
 
-    trip_id = db.Column(db.String(50), nullable=False, index=True)
-    route_id = db.Column(db.String(10), nullable=False, index=True)
+    trip_id = db.Column(InternedString(), nullable=False, index=True)
+    route_id = db.Column(InternedString(), nullable=False)
     direction_id = db.Column(db.Integer, nullable=False)
     start_time = db.Column(db.String(8))  # HH:MM:SS format
     start_date = db.Column(db.String(8))  # YYYYMMDD format
     schedule_relationship = db.Column(db.String(20))
     feed_timestamp = db.Column(db.DateTime, nullable=False, index=True)
-    agency_id = db.Column(db.String(10), nullable=False)  # subway, lirr, mnr
+    agency_id = db.Column(InternedString(), nullable=False)  # subway, lirr, mnr
+    feed_id = db.Column(InternedString())  # feed of the agency the trip was read from
+    content_hash = db.Column(db.String(16))  # hash of the trip and its stop time updates
+    end_marker = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # trip left the feed
 
     # Relationship with stop time updates
     stop_time_updates = db.relationship('StopTimeUpdate', backref='trip', lazy=True, cascade='all, delete-orphan')
@@ -24,13 +32,19 @@ class TripUpdate(BaseModel):
 class StopTimeUpdate(BaseModel):
     """Model for GTFS stop time updates"""
     __tablename__ = 'stop_time_updates'
+    __table_args__ = (
+        # next arrivals at a stop
+        db.Index('ix_stop_time_updates_stop_id_arrival_time', 'stop_id', 'arrival_time'),
+    )
 
     trip_update_id = db.Column(db.Integer, db.ForeignKey('trip_updates.id'), nullable=False)
-    stop_id = db.Column(db.String(50), nullable=False, index=True)
+    stop_id = db.Column(InternedString(), nullable=False)
     stop_sequence = db.Column(db.Integer)
-    arrival_time = db.Column(db.DateTime)
+    arrival_time = db.Column(db.DateTime, index=True)
     departure_time = db.Column(db.DateTime)
     schedule_relationship = db.Column(db.String(20))
+    route_id = db.Column(InternedString())  # copied from the trip update at ingest
+    agency_id = db.Column(InternedString())  # copied from the trip update at ingest
 
     def __repr__(self):
         return f'<StopTimeUpdate {self.stop_id}>'
@@ -38,9 +52,14 @@ class StopTimeUpdate(BaseModel):
 class VehiclePosition(BaseModel):
     """Model for GTFS vehicle positions"""
     __tablename__ = 'vehicle_positions'
+    __table_args__ = (
+        # latest vehicles of a route
+        db.Index('ix_vehicle_positions_route_id_feed_timestamp', 'route_id', 'feed_timestamp'),
+    )
 
-    vehicle_id = db.Column(db.String(50), nullable=False, index=True)
-    trip_id = db.Column(db.String(50), nullable=True, index=True)
+    vehicle_id = db.Column(InternedString(), nullable=False, index=True)
+    trip_id = db.Column(InternedString(), nullable=True, index=True)
+    route_id = db.Column(InternedString())  # route of the trip, resolved at ingest
     label = db.Column(db.String(50))
     license_plate = db.Column(db.String(20))
     current_stop_sequence = db.Column(db.Integer)
@@ -54,7 +73,10 @@ class VehiclePosition(BaseModel):
     bearing = db.Column(db.Float)
     odometer = db.Column(db.Float)
     feed_timestamp = db.Column(db.DateTime, nullable=False, index=True)
-    agency_id = db.Column(db.String(10), nullable=False)  # subway, lirr, mnr
+    agency_id = db.Column(InternedString(), nullable=False)  # subway, lirr, mnr
+    feed_id = db.Column(InternedString())  # feed of the agency the vehicle was read from
+    content_hash = db.Column(db.String(16))  # hash of the position, status and trip
+    end_marker = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # vehicle left the feed
 
     def __repr__(self):
         return f'<VehiclePosition {self.vehicle_id}>'
@@ -62,11 +84,16 @@ class VehiclePosition(BaseModel):
 class ServiceAlert(BaseModel):
     """Model for GTFS service alerts"""
     __tablename__ = 'service_alerts'
+    __table_args__ = (
+        # active alerts: active_period_start <= now and (active_period_end >= now or no end)
+        db.Index('ix_service_alerts_active_period', 'active_period_start', 'active_period_end'),
+        db.Index('ix_service_alerts_entity_active_period', 'informed_entity_id', 'active_period_start'),
+    )
 
     active_period_start = db.Column(db.DateTime)
     active_period_end = db.Column(db.DateTime)
     informed_entity_type = db.Column(db.String(20))
-    informed_entity_id = db.Column(db.String(50), index=True)
+    informed_entity_id = db.Column(db.String(50))
     cause = db.Column(db.String(20))
     effect = db.Column(db.String(20))
     url = db.Column(db.String(500))
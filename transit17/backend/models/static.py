@@ -69,11 +69,18 @@ class Trip(BaseModel):
 class StopTime(BaseModel):
     """Model for scheduled stop times"""
     __tablename__ = 'stop_times'
+    __table_args__ = (
+        # next departures at a stop
+        db.Index('ix_stop_times_stop_id_departure_seconds', 'stop_id', 'departure_seconds'),
+    )
 
-    trip_id = db.Column(db.String(50), db.ForeignKey('trips.trip_id'), nullable=False)
+    trip_id = db.Column(db.String(50), db.ForeignKey('trips.trip_id'), nullable=False, index=True)
     stop_id = db.Column(db.String(50), db.ForeignKey('stops.stop_id'), nullable=False)
     arrival_time = db.Column(db.String(8))  # HH:MM:SS format
     departure_time = db.Column(db.String(8))  # HH:MM:SS format
+    # seconds since the start of the service day, past 86400 for trips running after midnight
+    arrival_seconds = db.Column(db.Integer)
+    departure_seconds = db.Column(db.Integer)
     stop_sequence = db.Column(db.Integer, nullable=False)
     stop_headsign = db.Column(db.String(100))
     pickup_type = db.Column(db.Integer)
@@ -87,5 +94,29 @@ class StopTime(BaseModel):
 # Association table for routes and stops
 route_stops = db.Table('route_stops',
     db.Column('route_id', db.String(10), db.ForeignKey('routes.route_id'), primary_key=True),
-    db.Column('stop_id', db.String(50), db.ForeignKey('stops.stop_id'), primary_key=True)
-) 
\ No newline at end of file
+    db.Column('stop_id', db.String(50), db.ForeignKey('stops.stop_id'), primary_key=True),
+    db.Index('ix_route_stops_stop_id', 'stop_id')  # routes of a stop
+) 
+
+class FeedVersion(BaseModel):
+    """Model for imported versions of an agency's GTFS static feed"""
+    __tablename__ = 'feed_versions'
+
+    agency_id = db.Column(db.String(10), nullable=False, index=True)  # subway, lirr, mnr
+    file_hashes = db.Column(db.Text, nullable=False)  # JSON: GTFS file name -> content hash
+    changes = db.Column(db.Text)  # JSON: GTFS file name -> rows inserted, updated and deleted
+    active = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    def __repr__(self):
+        return f'<FeedVersion {self.agency_id} {self.id}>'
+
+# Hash of every row imported for an agency, by GTFS file and key (stop times by trip).
+# Keys are unique across agencies; owned is false when another agency imported
+# the key first and the row in the table is theirs.
+feed_row_hashes = db.Table('feed_row_hashes',
+    db.Column('agency_id', db.String(10), primary_key=True),
+    db.Column('file_name', db.String(30), primary_key=True),
+    db.Column('row_key', db.String(100), primary_key=True),
+    db.Column('row_hash', db.String(16), nullable=False),
+    db.Column('owned', db.Boolean, nullable=False, default=True, server_default=db.true())
+)
@@ -0,0 +1,367 @@
+"""
+Append-only archive of raw GTFS-rt feed snapshots
+
+Every feed gets one segment file per UTC day, `<root>/<feed_type>/<feed_id>/<YYYYMMDD>.seg`.
+Snapshots are grouped into chunks of about StorageConfig.CHUNK_SIZE feed
+entities, or of the snapshots of FEED_ARCHIVE_MAX_PENDING_SECONDS for quiet
+feeds; each chunk is zlib-compressed on its own (StorageConfig.ENABLE_COMPRESSION)
+and appended to the segment. A fixed-size index next to it (`.idx`) maps every
+snapshot's header timestamp to its chunk and its position inside the chunk,
+so a single snapshot is read by decompressing one chunk. Segments of past
+days never change again and are read through mmap.
+"""
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+from google.transit import gtfs_realtime_pb2
+from backend.config.settings import (
+    StorageConfig, FEED_ARCHIVE_DIR, FEED_ARCHIVE_RETENTION_DAYS, FEED_ARCHIVE_MAX_PENDING_SECONDS
+)
+
+# chunk header: magic, flags, compressed length, raw length
+_CHUNK = struct.Struct('<4sBII')
+_CHUNK_MAGIC = b'FSC1'
+_FLAG_ZLIB = 1
+
+# index entry: header timestamp, chunk offset in the segment, offset and length inside the chunk
+_INDEX_ENTRY = struct.Struct('<qQII')
+
+logger = logging.getLogger(__name__)
+
+def _segment_day(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y%m%d')
+
+def _repair(path: str) -> None:
+    """
+    cut what a crash in the middle of a write left behind in a segment: a
+    partial index entry, so appended entries stay aligned, and segment data
+    past the end of the last indexed chunk
+    """
+    index_path, segment_path = f"{path}.idx", f"{path}.seg"
+    if not os.path.exists(index_path):
+        return
+    index_size = os.path.getsize(index_path)
+    entries = index_size // _INDEX_ENTRY.size
+    if index_size > entries * _INDEX_ENTRY.size:
+        os.truncate(index_path, entries * _INDEX_ENTRY.size)
+        logger.warning(f"Truncated a partial entry of {index_path}")
+    if not os.path.exists(segment_path):
+        return
+    end = 0
+    if entries:
+        with open(index_path, 'rb') as f:
+            f.seek((entries - 1) * _INDEX_ENTRY.size)
+            chunk_offset = _INDEX_ENTRY.unpack(f.read(_INDEX_ENTRY.size))[1]
+        with open(segment_path, 'rb') as f:
+            f.seek(chunk_offset)
+            length = _CHUNK.unpack(f.read(_CHUNK.size))[2]
+        end = chunk_offset + _CHUNK.size + length
+    if os.path.getsize(segment_path) > end:
+        os.truncate(segment_path, end)
+        logger.warning(f"Truncated {segment_path} to its last indexed chunk")
+
+class _SegmentWriter:
+    """Pending chunk and open files of the segment a feed is currently written to"""
+
+    def __init__(self, path: str, day: str):
+        self.day = day
+        _repair(path)
+        self.segment = open(f"{path}.seg", 'ab')
+        self.index = open(f"{path}.idx", 'ab')
+        self.pending: List[Tuple[int, bytes]] = []
+        self.pending_entities = 0
+        self.pending_since = 0.0  # time.monotonic() of the oldest pending snapshot
+
+    def close(self) -> None:
+        self.segment.close()
+        self.index.close()
+
+class _SegmentReader:
+    """Index and data of one segment; past segments are immutable and mapped into memory"""
+
+    def __init__(self, path: str, sealed: bool):
+        self.path = path
+        self.sealed = sealed
+        with open(f"{path}.idx", 'rb') as f:
+            data = f.read()
+        count = len(data) // _INDEX_ENTRY.size
+        self.entries = [_INDEX_ENTRY.unpack_from(data, i * _INDEX_ENTRY.size) for i in range(count)]
+        self.timestamps = [entry[0] for entry in self.entries]
+        self._file = open(f"{path}.seg", 'rb')
+        self._map = None
+        if sealed and os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._chunk_cache: Tuple[int, bytes] = (-1, b'')
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if self._map is not None:
+            return self._map[offset:offset + length]
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def chunk(self, offset: int) -> bytes:
+        """get the decompressed chunk starting at offset, the last one is cached"""
+        if self._chunk_cache[0] == offset:
+            return self._chunk_cache[1]
+        magic, flags, length, raw_length = _CHUNK.unpack(self._read(offset, _CHUNK.size))
+        if magic != _CHUNK_MAGIC:
+            raise ValueError(f"Corrupt archive segment {self.path}.seg at offset {offset}")
+        data = self._read(offset + _CHUNK.size, length)
+        if flags & _FLAG_ZLIB:
+            data = zlib.decompress(data)
+        self._chunk_cache = (offset, data)
+        return data
+
+    def snapshot(self, position: int) -> Tuple[int, bytes]:
+        timestamp, chunk_offset, offset, length = self.entries[position]
+        return timestamp, self.chunk(chunk_offset)[offset:offset + length]
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+class RawFeedArchive:
+    """Write and read the raw feed archive"""
+
+    def __init__(self, root: str = FEED_ARCHIVE_DIR, chunk_size: int = StorageConfig.CHUNK_SIZE,
+                 compress: bool = StorageConfig.ENABLE_COMPRESSION,
+                 max_pending_seconds: float = FEED_ARCHIVE_MAX_PENDING_SECONDS):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.max_pending_seconds = max_pending_seconds
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._writers: Dict[Tuple[str, str], _SegmentWriter] = {}
+        self._readers: Dict[str, _SegmentReader] = {}
+
+    def _feed_dir(self, feed_type: str, feed_id: str) -> str:
+        return os.path.join(self.root, feed_type, feed_id)
+
+    # writing
+
+    def append(self, feed_type: str, feed_id: str, feed) -> None:
+        """
+        Append a fetched feed snapshot
+
+        Args:
+            feed (FeedMessage): parsed feed; its header timestamp keys the snapshot
+        """
+        timestamp = feed.header.timestamp or int(datetime.now(tz=timezone.utc).timestamp())
+        day = _segment_day(timestamp)
+        data = feed.SerializeToString()
+        key = (feed_type, feed_id)
+
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is not None and writer.day != day:
+                self._flush_writer(writer)
+                writer.close()
+                writer = None
+            if writer is None:
+                feed_dir = self._feed_dir(feed_type, feed_id)
+                os.makedirs(feed_dir, exist_ok=True)
+                writer = self._writers[key] = _SegmentWriter(os.path.join(feed_dir, day), day)
+
+            now = time.monotonic()
+            if not writer.pending:
+                writer.pending_since = now
+            writer.pending.append((timestamp, data))
+            writer.pending_entities += len(feed.entity)
+            if writer.pending_entities >= self.chunk_size:
+                self._flush_writer(writer)
+            # small or quiet feeds would keep their snapshots in memory for hours otherwise
+            for other in self._writers.values():
+                if other.pending and now - other.pending_since >= self.max_pending_seconds:
+                    self._flush_writer(other)
+
+    def _flush_writer(self, writer: _SegmentWriter) -> None:
+        """write the pending snapshots of a feed as one chunk, then their index entries"""
+        if not writer.pending:
+            return
+        raw = b''.join(data for _, data in writer.pending)
+        flags = 0
+        data = raw
+        if self.compress:
+            data = zlib.compress(raw, 6)
+            flags |= _FLAG_ZLIB
+
+        writer.segment.seek(0, os.SEEK_END)
+        chunk_offset = writer.segment.tell()
+        writer.segment.write(_CHUNK.pack(_CHUNK_MAGIC, flags, len(data), len(raw)))
+        writer.segment.write(data)
+        writer.segment.flush()
+
+        # the index only ever points at chunks that are completely written
+        offset = 0
+        for timestamp, snapshot in writer.pending:
+            writer.index.write(_INDEX_ENTRY.pack(timestamp, chunk_offset, offset, len(snapshot)))
+            offset += len(snapshot)
+        writer.index.flush()
+
+        writer.pending = []
+        writer.pending_entities = 0
+
+    def flush(self) -> None:
+        """Write all pending snapshots to disk, e.g. before shutdown"""
+        with self._lock:
+            for writer in self._writers.values():
+                self._flush_writer(writer)
+
+    def close(self) -> None:
+        """Flush pending snapshots and close all segments"""
+        with self._lock:
+            for writer in self._writers.values():
+                self._flush_writer(writer)
+                writer.close()
+            self._writers.clear()
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+
+    # reading
+
+    def feeds(self) -> List[Tuple[str, str]]:
+        """Get (feed_type, feed_id) of every archived feed"""
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            (feed_type, feed_id)
+            for feed_type in sorted(os.listdir(self.root))
+            if os.path.isdir(os.path.join(self.root, feed_type))
+            for feed_id in sorted(os.listdir(os.path.join(self.root, feed_type)))
+        ]
+
+    def segments(self, feed_type: str, feed_id: str) -> List[str]:
+        """Get the days (YYYYMMDD) archived for a feed, oldest first"""
+        feed_dir = self._feed_dir(feed_type, feed_id)
+        if not os.path.isdir(feed_dir):
+            return []
+        return sorted(name[:-4] for name in os.listdir(feed_dir) if name.endswith('.idx'))
+
+    def _reader(self, feed_type: str, feed_id: str, day: str) -> _SegmentReader:
+        path = os.path.join(self._feed_dir(feed_type, feed_id), day)
+        # yesterday's segment may still get its last chunk until the first snapshot of today arrives
+        sealed = day < _segment_day(int((datetime.now(tz=timezone.utc) - timedelta(days=1)).timestamp()))
+        with self._lock:
+            reader = self._readers.get(path)
+            if reader is not None and reader.sealed:
+                return reader
+            # the current day's segment is still growing, reload its index
+            if reader is not None:
+                reader.close()
+            reader = self._readers[path] = _SegmentReader(path, sealed)
+            return reader
+
+    def _parse(self, data: bytes):
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(data)
+        return feed
+
+    def snapshot_at(self, feed_type: str, feed_id: str, timestamp: int):
+        """
+        Get the archived snapshot nearest to a timestamp
+
+        Only the index of the segments around the timestamp is searched and
+        only the chunk holding the snapshot is decompressed.
+
+        Returns:
+            tuple: (header timestamp, FeedMessage), or None if nothing is archived
+        """
+        days = self.segments(feed_type, feed_id)
+        if not days:
+            return None
+        position = bisect.bisect_left(days, _segment_day(int(timestamp)))
+        best = None
+        for day in days[max(0, position - 1):position + 2]:
+            reader = self._reader(feed_type, feed_id, day)
+            index = bisect.bisect_left(reader.timestamps, timestamp)
+            for candidate in (index - 1, index):
+                if 0 <= candidate < len(reader.timestamps):
+                    distance = abs(reader.timestamps[candidate] - timestamp)
+                    if best is None or distance < best[0]:
+                        best = (distance, reader, candidate)
+        if best is None:
+            return None
+        snapshot_timestamp, data = best[1].snapshot(best[2])
+        return snapshot_timestamp, self._parse(data)
+
+    def iter_snapshots(self, feed_type: str, feed_id: str, start: Optional[int] = None,
+                       end: Optional[int] = None) -> Iterator[Tuple[int, object]]:
+        """Yield (header timestamp, FeedMessage) of every snapshot in [start, end], oldest first"""
+        start_day = _segment_day(int(start)) if start is not None else None
+        end_day = _segment_day(int(end)) if end is not None else None
+        for day in self.segments(feed_type, feed_id):
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            reader = self._reader(feed_type, feed_id, day)
+            first = bisect.bisect_left(reader.timestamps, start) if start is not None else 0
+            last = bisect.bisect_right(reader.timestamps, end) if end is not None else len(reader.timestamps)
+            for position in range(first, last):
+                snapshot_timestamp, data = reader.snapshot(position)
+                yield snapshot_timestamp, self._parse(data)
+
+    # retention
+
+    def prune(self, retention_days: int = FEED_ARCHIVE_RETENTION_DAYS) -> int:
+        """
+        Delete whole segments older than the retention period
+
+        Returns:
+            int: number of segments deleted
+        """
+        cutoff = (datetime.now(tz=timezone.utc) - timedelta(days=retention_days)).strftime('%Y%m%d')
+        removed = 0
+        for feed_type, feed_id in self.feeds():
+            for day in self.segments(feed_type, feed_id):
+                if day >= cutoff:
+                    break
+                path = os.path.join(self._feed_dir(feed_type, feed_id), day)
+                with self._lock:
+                    reader = self._readers.pop(path, None)
+                    if reader is not None:
+                        reader.close()
+                for suffix in ('.seg', '.idx'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                removed += 1
+        if removed:
+            self.logger.info(f"Pruned {removed} archive segments older than {cutoff}")
+        return removed
+
+    def get_stats(self) -> Dict[str, Dict[str, object]]:
+        """Get segment count, snapshot count and sizes per feed, keyed by 'feed_type/feed_id'"""
+        stats = {}
+        for feed_type, feed_id in self.feeds():
+            feed_dir = self._feed_dir(feed_type, feed_id)
+            days = self.segments(feed_type, feed_id)
+            stored = raw = snapshots = 0
+            for day in days:
+                path = os.path.join(feed_dir, day)
+                stored += os.path.getsize(f"{path}.seg") if os.path.exists(f"{path}.seg") else 0
+                size = os.path.getsize(f"{path}.idx")
+                snapshots += size // _INDEX_ENTRY.size
+                with open(f"{path}.idx", 'rb') as f:
+                    data = f.read()
+                raw += sum(
+                    _INDEX_ENTRY.unpack_from(data, i * _INDEX_ENTRY.size)[3]
+                    for i in range(len(data) // _INDEX_ENTRY.size)
+                )
+            stats[f"{feed_type}/{feed_id}"] = {
+                'segments': len(days),
+                'first_day': days[0] if days else None,
+                'last_day': days[-1] if days else None,
+                'snapshots': snapshots,
+                'bytes_stored': stored,
+                'bytes_raw': raw,
+                'compression_ratio': round(raw / stored, 2) if stored else None
+            }
+        return stats
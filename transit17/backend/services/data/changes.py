@@ -0,0 +1,249 @@
+"""
+Change-data-capture for realtime ingest
+
+Every trip update and vehicle position is hashed and compared with the last
+version stored for the same trip or vehicle; only new or changed entities are
+written. When an entity is missing from a feed that was polled, an end marker
+row is written for it. The state of an entity at time T is the latest row
+with feed_timestamp <= T, unless that row is an end marker.
+
+Retention drops whole partitions, so an entity unchanged for longer than
+the retention period is written again before its last row expires.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import func
+from backend import db
+from backend.config.settings import REALTIME_PARTITION_HOURS, StorageConfig
+from backend.models import TripUpdate, VehiclePosition
+
+def trip_key(trip_update: Dict[str, Any]) -> Tuple[str, str]:
+    """trip ids repeat on other service days, so the start date is part of the key"""
+    return trip_update['trip_id'], trip_update.get('start_date') or ''
+
+def vehicle_key(vehicle: Dict[str, Any]) -> str:
+    """subway feeds leave the vehicle id empty, the trip identifies the train then"""
+    return vehicle.get('vehicle_id') or f"trip:{vehicle.get('trip_id')}"
+
+def trip_hash(trip_update: Dict[str, Any]) -> str:
+    content = (
+        trip_update['route_id'], trip_update['direction_id'], trip_update['start_time'],
+        trip_update['schedule_relationship'],
+        [(stop['stop_id'], stop['stop_sequence'], stop['arrival_time'], stop['departure_time'],
+          stop.get('schedule_relationship'))
+         for stop in trip_update['stop_updates']]
+    )
+    return blake2b(repr(content).encode('utf-8'), digest_size=8).hexdigest()
+
+def vehicle_hash(vehicle: Dict[str, Any]) -> str:
+    # the report timestamp is left out: a vehicle re-reporting the same position is no change
+    position = vehicle['position']
+    content = (
+        vehicle.get('trip_id'), vehicle['current_stop_sequence'], vehicle['current_status'],
+        position['latitude'], position['longitude'], position.get('speed'), position.get('bearing')
+    )
+    return blake2b(repr(content).encode('utf-8'), digest_size=8).hexdigest()
+
+class _Version:
+    """Last stored version of an entity; fields are copied into its end marker"""
+    __slots__ = ('content_hash', 'feed_id', 'fields', 'stored_at')
+
+    def __init__(self, content_hash: Optional[str], feed_id: Optional[str], fields: Dict[str, Any],
+                 stored_at: datetime):
+        self.content_hash = content_hash
+        self.feed_id = feed_id
+        self.fields = fields
+        self.stored_at = stored_at
+
+class ChangeSet:
+    """Entities to write for one poll cycle of an agency"""
+
+    def __init__(self, tracker: 'ChangeTracker', agency_id: str):
+        self.tracker = tracker
+        self.agency_id = agency_id
+        self.trip_updates: List[Dict[str, Any]] = []  # new or changed, with 'content_hash'
+        self.vehicle_positions: List[Dict[str, Any]] = []
+        self.ended_trips: List[Dict[str, Any]] = []  # fields of the last version, with 'feed_id'
+        self.ended_vehicles: List[Dict[str, Any]] = []
+        self.unchanged = 0
+        self._trip_versions: Dict[Tuple[str, str], Optional[_Version]] = {}
+        self._vehicle_versions: Dict[str, Optional[_Version]] = {}
+
+    def apply(self) -> None:
+        """make the written versions the new baseline, call after the commit succeeded"""
+        self.tracker._apply(self)
+
+class ChangeTracker:
+    """Remember the last stored version of every trip and vehicle, per agency"""
+
+    def __init__(self, refresh_after: Optional[timedelta] = None):
+        """
+        Args:
+            refresh_after (timedelta): write an unchanged entity again once its
+                stored row is this old, defaults to the shortest realtime
+                retention less one partition
+        """
+        if refresh_after is None:
+            refresh_after = min(
+                StorageConfig.CLEANUP_STRATEGY['trip_updates'],
+                StorageConfig.CLEANUP_STRATEGY['vehicle_positions']
+            ) - timedelta(hours=REALTIME_PARTITION_HOURS)
+        self.refresh_after = refresh_after
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._trips: Dict[str, Dict[Tuple[str, str], _Version]] = {}
+        self._vehicles: Dict[str, Dict[str, _Version]] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _load(self, agency_id: str) -> None:
+        """load the latest version of every entity still in the feeds, once per agency"""
+        if agency_id in self._trips:
+            return
+
+        trips = {}
+        latest = db.session.query(func.max(TripUpdate.id)).filter(
+            TripUpdate.agency_id == agency_id
+        ).group_by(TripUpdate.trip_id, TripUpdate.start_date)
+        for row in TripUpdate.query.filter(TripUpdate.id.in_(latest)):
+            # rows written before change capture have no hash, they are never ended
+            if row.end_marker or row.content_hash is None:
+                continue
+            trips[(row.trip_id, row.start_date or '')] = _Version(row.content_hash, row.feed_id, {
+                'trip_id': row.trip_id,
+                'route_id': row.route_id,
+                'direction_id': row.direction_id,
+                'start_time': row.start_time,
+                'start_date': row.start_date,
+                'schedule_relationship': row.schedule_relationship
+            }, row.feed_timestamp)
+
+        vehicles = {}
+        latest = db.session.query(func.max(VehiclePosition.id)).filter(
+            VehiclePosition.agency_id == agency_id
+        ).group_by(VehiclePosition.vehicle_id, VehiclePosition.trip_id)
+        # a vehicle appears once per trip it served, the newest row decides
+        for row in VehiclePosition.query.filter(VehiclePosition.id.in_(latest)).order_by(VehiclePosition.id):
+            key = vehicle_key({'vehicle_id': row.vehicle_id, 'trip_id': row.trip_id})
+            if row.end_marker:
+                vehicles.pop(key, None)
+            elif row.content_hash is not None:
+                vehicles[key] = _Version(
+                    row.content_hash, row.feed_id, {'vehicle_id': row.vehicle_id, 'trip_id': row.trip_id},
+                    row.feed_timestamp
+                )
+
+        self._trips[agency_id] = trips
+        self._vehicles[agency_id] = vehicles
+        self.logger.info(f"Loaded {len(trips)} trips and {len(vehicles)} vehicles for {agency_id}")
+
+    def diff(self, agency_id: str, realtime_data: Dict[str, Any]) -> ChangeSet:
+        """
+        Compare one poll cycle with the stored versions
+
+        Args:
+            realtime_data (dict): as built by BaseMTAService.build_realtime_data;
+                entities carry 'feed_id' and 'feeds' lists the feeds polled this
+                cycle, only entities of those feeds can end
+
+        Returns:
+            ChangeSet: entities to write, not applied yet
+        """
+        with self._lock:
+            self._load(agency_id)
+            trips = self._trips[agency_id]
+            vehicles = self._vehicles[agency_id]
+        polled_feeds = set(realtime_data.get('feeds') or ())
+        changes = ChangeSet(self, agency_id)
+        # versions are as old as the feed header that carried them, like their rows
+        now = datetime.now()
+        stored_at = {
+            feed_id: datetime.fromtimestamp(header_timestamp)
+            for feed_id, header_timestamp in (realtime_data.get('feeds') or {}).items()
+            if header_timestamp
+        }
+        stale_before = now - self.refresh_after
+
+        seen_trips = set()
+        for trip_update in realtime_data.get('trip_updates') or []:
+            key = trip_key(trip_update)
+            if key in seen_trips:
+                continue
+            seen_trips.add(key)
+            content_hash = trip_hash(trip_update)
+            version = trips.get(key)
+            if version is not None and version.content_hash == content_hash and version.stored_at >= stale_before:
+                changes.unchanged += 1
+                continue
+            changes.trip_updates.append(dict(trip_update, content_hash=content_hash))
+            changes._trip_versions[key] = _Version(content_hash, trip_update.get('feed_id'), {
+                field: trip_update[field] for field in (
+                    'trip_id', 'route_id', 'direction_id', 'start_time', 'start_date', 'schedule_relationship'
+                )
+            }, stored_at.get(trip_update.get('feed_id'), now))
+
+        seen_vehicles = set()
+        for vehicle in realtime_data.get('vehicle_positions') or []:
+            key = vehicle_key(vehicle)
+            if key in seen_vehicles:
+                continue
+            seen_vehicles.add(key)
+            content_hash = vehicle_hash(vehicle)
+            version = vehicles.get(key)
+            if version is not None and version.content_hash == content_hash and version.stored_at >= stale_before:
+                changes.unchanged += 1
+                continue
+            changes.vehicle_positions.append(dict(vehicle, content_hash=content_hash))
+            changes._vehicle_versions[key] = _Version(content_hash, vehicle.get('feed_id'), {
+                'vehicle_id': vehicle['vehicle_id'], 'trip_id': vehicle.get('trip_id')
+            }, stored_at.get(vehicle.get('feed_id'), now))
+
+        for key, version in trips.items():
+            if key not in seen_trips and version.feed_id in polled_feeds:
+                changes.ended_trips.append(dict(version.fields, feed_id=version.feed_id))
+                changes._trip_versions[key] = None
+        for key, version in vehicles.items():
+            if key not in seen_vehicles and version.feed_id in polled_feeds:
+                changes.ended_vehicles.append(dict(version.fields, feed_id=version.feed_id))
+                changes._vehicle_versions[key] = None
+        return changes
+
+    def _apply(self, changes: ChangeSet) -> None:
+        with self._lock:
+            for versions, state in (
+                (changes._trip_versions, self._trips[changes.agency_id]),
+                (changes._vehicle_versions, self._vehicles[changes.agency_id])
+            ):
+                for key, version in versions.items():
+                    if version is None:
+                        state.pop(key, None)
+                    else:
+                        state[key] = version
+
+            stats = self._stats.setdefault(changes.agency_id, {
+                'written': 0, 'unchanged': 0, 'ended': 0
+            })
+            stats['written'] += len(changes.trip_updates) + len(changes.vehicle_positions)
+            stats['unchanged'] += changes.unchanged
+            stats['ended'] += len(changes.ended_trips) + len(changes.ended_vehicles)
+
+    def reset(self, agency_id: Optional[str] = None) -> None:
+        """forget the stored versions, they are reloaded from the database on the next diff"""
+        with self._lock:
+            for state in (self._trips, self._vehicles):
+                if agency_id is None:
+                    state.clear()
+                else:
+                    state.pop(agency_id, None)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Get entities written, skipped as unchanged and ended, per agency"""
+        with self._lock:
+            result = {}
+            for agency_id, stats in self._stats.items():
+                result[agency_id] = dict(stats, tracked=(
+                    len(self._trips.get(agency_id, ())) + len(self._vehicles.get(agency_id, ()))
+                ))
+            return result
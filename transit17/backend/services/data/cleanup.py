@@ -1,9 +1,8 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from backend import db
-from backend.models import (
-    TripUpdate, StopTimeUpdate, VehiclePosition, ServiceAlert
-)
+from backend.models import ServiceAlert
 from backend.config.settings import StorageConfig
+from backend.services.data.partitions import partition_manager
 
 class DataCleanup:
     """Clean up old data from database"""
@@ -11,48 +10,36 @@ class DataCleanup:
     @staticmethod
     def cleanup_trip_updates():
         """Clean up old trip updates"""
-        retention_period = StorageConfig.TRIP_UPDATES.retention_period
-        cutoff_time = datetime.utcnow() - timedelta(hours=retention_period)
+        # feed timestamps are local times, so is the cutoff
+        cutoff_time = datetime.now() - StorageConfig.CLEANUP_STRATEGY['trip_updates']
         
-        # Delete old trip updates and their associated stop time updates
-        old_trip_updates = TripUpdate.query.filter(
-            TripUpdate.feed_timestamp < cutoff_time
-        ).all()
-        
-        for trip_update in old_trip_updates:
-            db.session.delete(trip_update)
-        
-        db.session.commit()
+        # trip updates and their stop time updates go together, a partition at a time
+        return partition_manager.drop_before('trip_updates', cutoff_time)
 
     @staticmethod
     def cleanup_vehicle_positions():
         """Clean up old vehicle positions"""
-        retention_period = StorageConfig.VEHICLE_POSITIONS.retention_period
-        cutoff_time = datetime.utcnow() - timedelta(hours=retention_period)
+        cutoff_time = datetime.now() - StorageConfig.CLEANUP_STRATEGY['vehicle_positions']
         
-        VehiclePosition.query.filter(
-            VehiclePosition.feed_timestamp < cutoff_time
-        ).delete()
-        
-        db.session.commit()
+        return partition_manager.drop_before('vehicle_positions', cutoff_time)
 
     @staticmethod
     def cleanup_service_alerts():
         """Clean up old service alerts"""
-        retention_period = StorageConfig.ALERTS.retention_period
-        cutoff_time = datetime.utcnow() - timedelta(hours=retention_period)
+        cutoff_time = datetime.now() - StorageConfig.CLEANUP_STRATEGY['alerts']
         
         # Delete alerts that have ended and are older than retention period
-        ServiceAlert.query.filter(
+        deleted = ServiceAlert.query.filter(
             (ServiceAlert.active_period_end < cutoff_time) |
             (ServiceAlert.feed_timestamp < cutoff_time)
-        ).delete()
+        ).delete(synchronize_session=False)
         
         db.session.commit()
+        return deleted
 
     @classmethod
     def cleanup_all(cls):
         """Clean up all old data"""
         cls.cleanup_trip_updates()
         cls.cleanup_vehicle_positions()
-        cls.cleanup_service_alerts() 
\ No newline at end of file
+        cls.cleanup_service_alerts()
@@ -1,19 +1,35 @@
+import json
 import logging
-from datetime import datetime
-from typing import Dict, Any
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
 from backend.services.mta.manager import APIManager
+from backend.services.mta.feed_tracker import feed_tracker
+from backend.services.mta.session import get_connection_stats
 from backend.services.data.importer import RealtimeImporter
 from backend.services.data.cleanup import DataCleanup
-from backend.config.settings import StorageConfig
+from backend.services.data.archive import RawFeedArchive
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.history import PositionHistory
+from backend.services.data.live_state import LiveState
+from backend.config.settings import (
+    StorageConfig, COLLECTOR_STATS_FILE, FEED_ARCHIVE_ENABLED, REALTIME_CHANGE_CAPTURE,
+    POSITION_HISTORY_ENABLED, LIVE_STATE_ENABLED
+)
 import time
 
 class DataCollector:
     """Collect and store data from MTA API"""
     
     def __init__(self):
-        self.api_manager = APIManager()
+        self.archive = RawFeedArchive() if FEED_ARCHIVE_ENABLED else None
+        self.api_manager = APIManager(archive=self.archive)
+        self.change_tracker = ChangeTracker() if REALTIME_CHANGE_CAPTURE else None
+        self.history = PositionHistory() if POSITION_HISTORY_ENABLED else None
+        self.live_state = LiveState() if LIVE_STATE_ENABLED else None
         self.logger = logging.getLogger(__name__)
         self.last_collection_time: Dict[str, datetime] = {}
+        self.last_cleanup: Optional[datetime] = None
 
     def collect_data(self) -> None:
         """Collect data from all services"""
@@ -26,44 +42,120 @@ class DataCollector:
                 if not service_data:
                     continue
                     
-                # Import trip updates
-                if 'trip_updates' in service_data:
-                    for trip_update in service_data['trip_updates']:
-                        RealtimeImporter.import_trip_update(trip_update, service_type)
-                
-                # Import vehicle positions
-                if 'vehicle_positions' in service_data:
-                    for vehicle_position in service_data['vehicle_positions']:
-                        RealtimeImporter.import_vehicle_position(vehicle_position, service_type)
+                # The live state is what the API serves, it does not wait for the database
+                self.update_live_state(service_type, service_data)
+
+                # Import trip updates, stop time updates and vehicle positions in one transaction
+                RealtimeImporter.import_realtime_data(service_data, service_type, tracker=self.change_tracker)
+                self.append_history(service_type, service_data)
                 
                 self.last_collection_time[service_type] = datetime.utcnow()
                 self.logger.info(f"Data collected for {service_type}")
+
+            # feeds that did not change are still current
+            for service_type, feed_ids in self.api_manager.unchanged_feeds.items():
+                self.confirm_live_state(service_type, feed_ids)
                 
         except Exception as e:
             self.logger.error(f"Error collecting data: {str(e)}")
+        finally:
+            # one new snapshot per cycle, with the feeds of every agency polled in it
+            if self.live_state is not None:
+                self.live_state.swap()
+
+    def update_live_state(self, service_type: str, service_data: Dict[str, Any]) -> None:
+        """Stage the cycle's feeds of an agency for the next live state snapshot, if there is one"""
+        if self.live_state is None:
+            return
+        try:
+            self.live_state.update(service_type, service_data)
+        except Exception as e:
+            self.logger.error(f"Failed to update {service_type} live state: {str(e)}")
+
+    def confirm_live_state(self, service_type: str, feed_ids: List[str]) -> None:
+        """Keep the feeds of an agency polled without changes in the live state, if there is one"""
+        if self.live_state is None:
+            return
+        try:
+            self.live_state.confirm(service_type, feed_ids)
+        except Exception as e:
+            self.logger.error(f"Failed to confirm {service_type} live state: {str(e)}")
+
+    def append_history(self, service_type: str, service_data: Dict[str, Any]) -> None:
+        """Append the cycle's vehicle positions to the columnar position history, if there is one"""
+        if self.history is None:
+            return
+        try:
+            self.history.append_cycle(service_type, service_data)
+        except Exception as e:
+            self.logger.error(f"Failed to append {service_type} position history: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get collector statistics: feed skip counts, poll schedule, breakers, change capture and connection reuse"""
+        return {
+            'updated_at': datetime.utcnow().isoformat(),
+            'last_collection_time': {
+                service_type: last_time.isoformat()
+                for service_type, last_time in self.last_collection_time.items()
+            },
+            'last_cleanup': self.last_cleanup.isoformat() if self.last_cleanup else None,
+            'feeds': feed_tracker.get_stats(),
+            'schedule': self.api_manager.scheduler.get_stats(),
+            'breakers': self.api_manager.get_breaker_stats(),
+            'changes': self.change_tracker.get_stats() if self.change_tracker else None,
+            'live_state': self.live_state.get_stats() if self.live_state else None,
+            'http': get_connection_stats()
+        }
+
+    def write_stats(self, path: str = COLLECTOR_STATS_FILE) -> None:
+        """Write collector statistics to a JSON file other processes can read"""
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.get_stats(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Could not write collector stats: {str(e)}")
+
+    def run_maintenance(self) -> None:
+        """Prune the archive and the position history and clean up old rows, once per cleanup interval"""
+        now = datetime.utcnow()
+        if self.last_cleanup is not None and now - self.last_cleanup < timedelta(minutes=StorageConfig.CLEANUP_INTERVAL):
+            return
+        self.last_cleanup = now
+        if self.archive:
+            self.archive.prune()
+        if self.history:
+            self.history.prune()
+        DataCleanup.cleanup_all()
+        self.logger.info("Data cleanup completed")
+
+    def close(self) -> None:
+        """Write the archive's pending snapshots and close the archive and position history files"""
+        if self.archive:
+            self.archive.close()
+        if self.history:
+            self.history.close()
 
     def run_collection(self) -> None:
         """Run continuous data collection"""
         self.logger.info("Starting data collection service...")
         
-        while True:
-            try:
-                self.collect_data()
-                
-                # Check if cleanup is needed
-                for service_type, last_time in self.last_collection_time.items():
-                    time_since_last_cleanup = (
-                        datetime.utcnow() - last_time
-                    ).total_seconds() / 60
-                    
-                    if time_since_last_cleanup >= StorageConfig.CLEANUP_INTERVAL:
-                        DataCleanup.cleanup_all()
-                        self.logger.info("Data cleanup completed")
-                
-                # Wait for next collection interval
-                time.sleep(StorageConfig.API_POLL_INTERVAL)
-                
-            except Exception as e:
-                self.logger.error(f"Error in data collection: {str(e)}")
-                # Wait before retrying
-                time.sleep(60) 
\ No newline at end of file
+        try:
+            while True:
+                try:
+                    self.collect_data()
+                    self.write_stats()
+                    self.run_maintenance()
+
+                    # Wait until the next feed is due
+                    time.sleep(min(max(0.5, self.api_manager.seconds_until_next_poll()), StorageConfig.API_POLL_INTERVAL))
+
+                except Exception as e:
+                    self.logger.error(f"Error in data collection: {str(e)}")
+                    # Wait before retrying
+                    time.sleep(60)
+        finally:
+            # pending archive chunks are lost otherwise
+            self.close()
+            self.logger.info("Data collection service stopped")
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""
+Parallel GTFS static import through staging tables
+
+Every (agency, file) pair is parsed by a worker of a process pool into its
+own staging SQLite file, together with the row hashes versioned updates
+diff against (see gtfs_versions). The merge step copies the staging files
+into `<table>__staging` tables of the live database and swaps them in for
+the live tables in one transaction, which also rebuilds route_stops and
+activates a new FeedVersion for every agency. The live tables are rebuilt
+as a whole: every agency of the import is replaced, the static data of
+agencies left out is dropped together with their versions and row hashes,
+so their next update imports them in full.
+
+Total time is bounded by the slowest file (the subway's stop_times.txt)
+plus the merge, instead of the sum of all files of all agencies.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, List
+import requests
+from backend import db
+from backend.config.settings import GTFS_IMPORT_CHUNK_SIZE, GTFS_IMPORT_WORKERS
+from backend.services.data.gtfs_versions import GTFS_KEYS, GROUPED_FILES, file_hash, group_digest, row_hash
+from backend.services.data.importer import KEEP_EXISTING, GTFS_FILES, ROUTE_STOPS_SQL, GTFSImporter, peak_rss_mb
+
+logger = logging.getLogger(__name__)
+
+_STAGING_SUFFIX = '__staging'
+
+def stage_file(zip_path: str, file_name: str, agency_id: str, table_sql: str, staging_path: str,
+               chunk_size: int = GTFS_IMPORT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Parse one GTFS file into a staging SQLite file, run in a worker process
+
+    Args:
+        zip_path (str): local GTFS zip
+        file_name (str): GTFS file name, a key of GTFS_FILES
+        agency_id (str): agency of the feed
+        table_sql (str): CREATE TABLE statement of the live table
+        staging_path (str): staging database to create
+
+    Returns:
+        dict: 'agency_id', 'file', 'rows', 'file_hash', 'seconds', 'pid' and
+            'peak_rss_mb' of the worker process
+    """
+    started = time.perf_counter()
+    key_index = [column for column, _, _, _ in GTFS_FILES[file_name][1]].index(GTFS_KEYS[file_name])
+    grouped = file_name in GROUPED_FILES
+    now = datetime.utcnow()
+
+    connection = sqlite3.connect(staging_path)
+    # a scratch file, nothing to recover if the worker dies
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.execute(table_sql)
+    connection.execute("CREATE TABLE feed_row_hashes (row_key TEXT PRIMARY KEY, row_hash TEXT NOT NULL)")
+    sql = GTFSImporter.insert_sql(file_name)
+
+    rows = 0
+    hashes = {}
+    with zipfile.ZipFile(zip_path) as gtfs_zip:
+        content_hash = file_hash(gtfs_zip, file_name)
+        with gtfs_zip.open(file_name) as f:
+            positions, reader = GTFSImporter.read_csv(f)
+            convert_row = GTFSImporter.row_converter(file_name, positions, agency_id)
+            key_position = positions.get(GTFS_FILES[file_name][1][key_index][1])
+            for chunk in iter(lambda: list(islice(reader, chunk_size)), []):
+                values = []
+                for raw in chunk:
+                    row = convert_row(raw)
+                    if grouped:
+                        digest = hashes.get(raw[key_position])
+                        if digest is None:
+                            hashes[raw[key_position]] = digest = group_digest(positions)
+                        digest.update(repr(raw).encode('utf-8'))
+                    else:
+                        hashes[row[key_index]] = row_hash(row)
+                    values.append(row + (now, now))
+                connection.executemany(sql, values)
+                rows += len(values)
+    if grouped:
+        hashes = {key: digest.hexdigest() for key, digest in hashes.items()}
+    connection.executemany("INSERT OR REPLACE INTO feed_row_hashes VALUES (?, ?)", hashes.items())
+    connection.commit()
+    connection.close()
+
+    return {
+        'agency_id': agency_id,
+        'file': file_name,
+        'rows': rows,
+        'file_hash': content_hash,
+        'seconds': round(time.perf_counter() - started, 2),
+        'pid': os.getpid(),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+class ParallelGTFSImporter(GTFSImporter):
+    """Import the GTFS static feeds of all agencies in parallel and swap them in at once"""
+
+    def __init__(self, workers: int = GTFS_IMPORT_WORKERS, chunk_size: int = GTFS_IMPORT_CHUNK_SIZE):
+        super().__init__(chunk_size=chunk_size)
+        self.workers = workers
+
+    @staticmethod
+    def _download(url: str, path: str) -> str:
+        """get a local copy of a GTFS zip, the workers open it by path"""
+        if os.path.exists(url):
+            return url
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as f:
+                for block in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(block)
+        return path
+
+    def import_all(self, urls: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Import every agency's feed and replace the live static tables
+
+        Args:
+            urls (dict): agency_id -> GTFS zip URL or local path
+
+        Returns:
+            dict: 'workers' (per-worker results of stage_file), 'download',
+                'parse', 'merge' and 'total' seconds, and 'versions' (agency_id
+                -> id of the new active FeedVersion)
+        """
+        started = time.perf_counter()
+        workdir = tempfile.mkdtemp(prefix='gtfs_staging_')
+        try:
+            with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+                zip_paths = dict(zip(urls, pool.map(
+                    lambda item: self._download(item[1], os.path.join(workdir, f"{item[0]}.zip")), urls.items()
+                )))
+            downloaded = time.perf_counter()
+
+            table_sql = self._live_table_sql()
+            tasks = []
+            for agency_id, zip_path in zip_paths.items():
+                with zipfile.ZipFile(zip_path) as gtfs_zip:
+                    members = set(gtfs_zip.namelist())
+                for file_name in GTFS_FILES:
+                    if file_name not in members:
+                        logger.warning(f"{file_name} missing from GTFS data of {agency_id}")
+                        continue
+                    tasks.append((agency_id, file_name))
+            # the largest files first (stop times, trips), so they don't start last
+            tasks.sort(key=lambda task: -list(GTFS_FILES).index(task[1]))
+
+            results = []
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [
+                    pool.submit(
+                        stage_file, zip_paths[agency_id], file_name, agency_id,
+                        table_sql[GTFS_FILES[file_name][0]],
+                        os.path.join(workdir, f"{agency_id}_{file_name}.db"), self.chunk_size
+                    )
+                    for agency_id, file_name in tasks
+                ]
+                for future in futures:
+                    results.append(future.result())
+            parsed = time.perf_counter()
+
+            versions = self._merge(results, workdir, list(urls), table_sql)
+            finished = time.perf_counter()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        return {
+            'workers': results,
+            'download': round(downloaded - started, 2),
+            'parse': round(parsed - downloaded, 2),
+            'merge': round(finished - parsed, 2),
+            'total': round(finished - started, 2),
+            'versions': versions
+        }
+
+    @staticmethod
+    def _live_table_sql() -> Dict[str, str]:
+        """get the CREATE TABLE statement of every static table, creating missing tables first"""
+        db.metadata.create_all(db.engine, tables=[
+            db.metadata.tables[table_name] for table_name, _ in GTFS_FILES.values()
+        ] + [db.metadata.tables[table_name] for table_name in ('feed_versions', 'feed_row_hashes', 'route_stops')])
+        statements = dict(db.session.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table'"
+        ).fetchall())
+        db.session.commit()
+        return {table_name: statements[table_name] for table_name, _ in GTFS_FILES.values()}
+
+    def _merge(self, results: List[Dict[str, Any]], workdir: str, agencies: List[str],
+               table_sql: Dict[str, str]) -> Dict[str, int]:
+        """copy the staging files into staging tables, then swap them in for the live tables"""
+        staged_files = {result['file'] for result in results}
+        tables = [table_name for file_name, (table_name, _) in GTFS_FILES.items() if file_name in staged_files]
+
+        db.session.remove()
+        raw = db.engine.raw_connection()
+        connection = raw.connection
+        isolation_level = connection.isolation_level
+        # ATTACH is not allowed inside a transaction, transactions are explicit below
+        connection.isolation_level = None
+        try:
+            index_sql = {}
+            for table_name in tables:
+                staging = table_name + _STAGING_SUFFIX
+                connection.execute(f"DROP TABLE IF EXISTS {staging}")
+                # a table renamed by an earlier swap has its name quoted
+                connection.execute(re.sub(
+                    rf'^CREATE TABLE "?{table_name}"? \(', f"CREATE TABLE {staging} (", table_sql[table_name], count=1
+                ))
+                index_sql[table_name] = connection.execute(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                    (table_name,)
+                ).fetchall()
+                # unique keys resolve duplicates while copying; index names are global,
+                # the staging indexes are replaced by the live ones in the swap
+                for name, sql in index_sql[table_name]:
+                    if sql.startswith('CREATE UNIQUE INDEX'):
+                        connection.execute(sql.replace(
+                            f"INDEX {name} ON {table_name} ", f"INDEX {name}{_STAGING_SUFFIX} ON {staging} ", 1
+                        ))
+            connection.execute("DROP TABLE IF EXISTS feed_row_hashes" + _STAGING_SUFFIX)
+            connection.execute(
+                f"CREATE TABLE feed_row_hashes{_STAGING_SUFFIX} AS SELECT * FROM feed_row_hashes WHERE 0"
+            )
+
+            # agencies in order, so duplicate ids across agencies resolve as in a sequential import
+            for result in sorted(results, key=lambda result: agencies.index(result['agency_id'])):
+                table_name = GTFS_FILES[result['file']][0]
+                columns = ', '.join([column for column, _, _, _ in GTFS_FILES[result['file']][1]]
+                                    + ['created_at', 'updated_at'])
+                verb = 'INSERT OR IGNORE' if table_name in KEEP_EXISTING else 'INSERT'
+                connection.execute("ATTACH DATABASE ? AS staged",
+                                   (os.path.join(workdir, f"{result['agency_id']}_{result['file']}.db"),))
+                try:
+                    connection.execute("BEGIN")
+                    connection.execute(f"{verb} INTO {table_name}{_STAGING_SUFFIX} ({columns}) "
+                                       f"SELECT {columns} FROM staged.{table_name}")
+                    # keys an earlier agency already has stay theirs, as the rows above
+                    connection.execute(
+                        f"INSERT INTO feed_row_hashes{_STAGING_SUFFIX} (agency_id, file_name, row_key, row_hash, owned) "
+                        f"SELECT ?, ?, row_key, row_hash, NOT EXISTS (SELECT 1 FROM feed_row_hashes{_STAGING_SUFFIX} "
+                        f"AS earlier WHERE earlier.file_name = ? AND earlier.row_key = staged.feed_row_hashes.row_key) "
+                        f"FROM staged.feed_row_hashes",
+                        (result['agency_id'], result['file'], result['file'])
+                    )
+                    connection.execute("COMMIT")
+                finally:
+                    connection.execute("DETACH DATABASE staged")
+
+            # the swap: readers see the old tables until the commit
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for table_name in tables:
+                    connection.execute(f"DROP TABLE {table_name}")
+                    connection.execute(f"ALTER TABLE {table_name}{_STAGING_SUFFIX} RENAME TO {table_name}")
+                    for name, sql in index_sql[table_name]:
+                        connection.execute(f"DROP INDEX IF EXISTS {name}{_STAGING_SUFFIX}")
+                        connection.execute(sql)
+                for sql in ROUTE_STOPS_SQL:
+                    connection.execute(sql)
+
+                # the hashes and versions of every agency, left out ones included,
+                # describe tables that are gone now
+                connection.execute("DELETE FROM feed_row_hashes")
+                connection.execute(f"INSERT INTO feed_row_hashes SELECT * FROM feed_row_hashes{_STAGING_SUFFIX}")
+                connection.execute(f"DROP TABLE feed_row_hashes{_STAGING_SUFFIX}")
+
+                connection.execute("UPDATE feed_versions SET active = 0")
+                versions = {}
+                now = datetime.utcnow()
+                for agency_id in agencies:
+                    agency_results = [result for result in results if result['agency_id'] == agency_id]
+                    file_hashes = {result['file']: result['file_hash'] for result in agency_results}
+                    changes = {result['file']: {'inserted': result['rows'], 'updated': 0, 'deleted': 0,
+                                                'seconds': result['seconds']} for result in agency_results}
+                    cursor = connection.execute(
+                        "INSERT INTO feed_versions (agency_id, file_hashes, changes, active, created_at, updated_at) "
+                        "VALUES (?, ?, ?, 1, ?, ?)",
+                        (agency_id, json.dumps(file_hashes, sort_keys=True), json.dumps(changes, sort_keys=True),
+                         now, now)
+                    )
+                    versions[agency_id] = cursor.lastrowid
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.isolation_level = isolation_level
+            raw.close()
+        logger.info(f"Swapped in {', '.join(tables)} for {', '.join(agencies)}")
+        return versions
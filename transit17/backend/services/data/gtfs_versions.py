@@ -0,0 +1,288 @@
+"""
+Versioned GTFS static updates
+
+Every import of an agency's feed is a FeedVersion holding the content hash
+of each member file. A file whose hash matches the active version is
+skipped; a changed file is diffed by key against the row hashes stored with
+the previous version (feed_row_hashes), and only the rows inserted, updated
+or deleted are written. Stop times are keyed by trip: the stop times of a
+changed trip are replaced as a whole. When trips or stop times changed,
+route_stops is rebuilt from them.
+
+Keys are unique across agencies (LIRR and Metro-North both have route 1).
+As in a full import, the agency that imported a key first keeps its row;
+the hashes record which agency owns each key, and other agencies never
+overwrite or delete it.
+
+All changes of one feed and the switch of the active version are one
+transaction, so readers see either the old or the new feed, never a mix
+(in WAL mode without waiting for the update).
+"""
+import json
+import logging
+import time
+from datetime import datetime
+from hashlib import blake2b
+from itertools import islice
+from typing import Any, Dict, List, Optional, Set, Tuple
+from backend import db
+from backend.models import FeedVersion, feed_row_hashes
+from backend.services.data.importer import GTFS_FILES, GTFSImporter
+
+# key columns per GTFS file, they are unique in their table; stop times are grouped by trip
+GTFS_KEYS = {
+    'routes.txt': 'route_id',
+    'stops.txt': 'stop_id',
+    'trips.txt': 'trip_id',
+    'stop_times.txt': 'trip_id'
+}
+GROUPED_FILES = ('stop_times.txt',)
+# keys per statement when handing deleted keys to other agencies
+RELEASE_CHUNK_SIZE = 500
+
+def file_hash(gtfs_zip, file_name: str) -> str:
+    digest = blake2b(digest_size=16)
+    with gtfs_zip.open(file_name) as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def row_hash(row: tuple) -> str:
+    """hash of a converted row of routes, stops or trips"""
+    return blake2b(repr(row).encode('utf-8'), digest_size=8).hexdigest()
+
+def group_digest(positions: Dict[str, int]):
+    """
+    start the hash of a group of stop times; it is updated with
+    repr(raw_row) of every row of the group, in file order
+    """
+    return blake2b(repr(sorted(positions.items())).encode('utf-8'), digest_size=8)
+
+class GTFSUpdater(GTFSImporter):
+    """Apply new GTFS static feeds as incremental, atomically switched versions"""
+
+    def __init__(self, chunk_size: Optional[int] = None):
+        super().__init__(**({'chunk_size': chunk_size} if chunk_size else {}))
+        self.logger = logging.getLogger(__name__)
+
+    def active_version(self, agency_id: str) -> Optional[FeedVersion]:
+        return FeedVersion.query.filter_by(agency_id=agency_id, active=True).first()
+
+    def update_gtfs(self, url: str, agency_id: str) -> Dict[str, Any]:
+        """
+        Bring an agency's static data to the feed at url
+
+        Args:
+            url (str): GTFS zip URL or local path
+            agency_id (str): subway, lirr or mnr
+
+        Returns:
+            dict: 'version' (id of the active version), 'seconds' and 'files',
+                GTFS file name -> 'unchanged' or a dict of 'inserted',
+                'updated', 'deleted' and 'seconds'
+        """
+        started = time.perf_counter()
+        active = self.active_version(agency_id)
+        active_hashes = json.loads(active.file_hashes) if active else {}
+
+        files = {}
+        try:
+            with self.open_gtfs(url) as gtfs_zip:
+                members = set(gtfs_zip.namelist())
+                hashes = {
+                    file_name: file_hash(gtfs_zip, file_name)
+                    for file_name in GTFS_FILES if file_name in members
+                }
+                if active is not None and hashes == active_hashes:
+                    self.logger.info(f"GTFS data of {agency_id} unchanged, version {active.id} stays active")
+                    return {'version': active.id, 'seconds': round(time.perf_counter() - started, 2),
+                            'files': {file_name: 'unchanged' for file_name in hashes}}
+
+                # replacing the stop times of a trip looks them up by trip_id, databases
+                # created before the index existed get it here
+                connection = db.session.connection()
+                for index in db.metadata.tables['stop_times'].indexes:
+                    index.create(connection, checkfirst=True)
+
+                for file_name, content_hash in hashes.items():
+                    if active_hashes.get(file_name) == content_hash:
+                        files[file_name] = 'unchanged'
+                        continue
+                    files[file_name] = self._update_file(gtfs_zip, file_name, agency_id)
+
+            if any(files.get(file_name, 'unchanged') != 'unchanged' for file_name in ('trips.txt', 'stop_times.txt')):
+                self.refresh_route_stops()
+
+            # the new version becomes active in the same transaction as its rows
+            FeedVersion.query.filter_by(agency_id=agency_id, active=True).update(
+                {'active': False}, synchronize_session=False
+            )
+            version = FeedVersion(
+                agency_id=agency_id,
+                file_hashes=json.dumps(hashes, sort_keys=True),
+                changes=json.dumps(files, sort_keys=True),
+                active=True
+            )
+            db.session.add(version)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.logger.exception(f"Error updating GTFS data of {agency_id}")
+            raise
+
+        self.logger.info(f"GTFS data of {agency_id} is now version {version.id}")
+        return {'version': version.id, 'seconds': round(time.perf_counter() - started, 2), 'files': files}
+
+    def _stored_hashes(self, agency_id: str, file_name: str) -> Dict[str, Tuple[str, bool]]:
+        """key -> (row hash, owned) of the rows stored for an agency's file"""
+        rows = db.session.execute(
+            db.select([feed_row_hashes.c.row_key, feed_row_hashes.c.row_hash, feed_row_hashes.c.owned]).where(
+                (feed_row_hashes.c.agency_id == agency_id) & (feed_row_hashes.c.file_name == file_name)
+            )
+        )
+        return {key: (content_hash, bool(owned)) for key, content_hash, owned in rows}
+
+    def _owned_by_others(self, agency_id: str, file_name: str) -> Set[str]:
+        """keys of a file whose rows belong to another agency"""
+        rows = db.session.execute(
+            db.select([feed_row_hashes.c.row_key]).where(
+                (feed_row_hashes.c.file_name == file_name) & (feed_row_hashes.c.agency_id != agency_id)
+                & feed_row_hashes.c.owned
+            )
+        )
+        return {key for key, in rows}
+
+    def _release(self, agency_id: str, file_name: str, keys: List[str]):
+        """
+        hand keys whose rows an agency deleted to the agencies that also have
+        them: their hashes of the keys and their active content hash of the
+        file are dropped, so their next update diffs the file and inserts them
+        """
+        connection = db.session.connection()
+        agencies = set()
+        for start in range(0, len(keys), RELEASE_CHUNK_SIZE):
+            chunk = keys[start:start + RELEASE_CHUNK_SIZE]
+            condition = f"file_name = ? AND agency_id != ? AND row_key IN ({', '.join('?' * len(chunk))})"
+            parameters = (file_name, agency_id, *chunk)
+            agencies.update(other for other, in connection.exec_driver_sql(
+                f"SELECT DISTINCT agency_id FROM feed_row_hashes WHERE {condition}", parameters
+            ))
+            connection.exec_driver_sql(f"DELETE FROM feed_row_hashes WHERE {condition}", parameters)
+        for other in agencies:
+            version = self.active_version(other)
+            if version is not None:
+                hashes = json.loads(version.file_hashes)
+                hashes.pop(file_name, None)
+                version.file_hashes = json.dumps(hashes, sort_keys=True)
+            self.logger.info(f"{agency_id} released {file_name} keys also in the feed of {other}")
+
+    def _update_file(self, gtfs_zip, file_name: str, agency_id: str) -> Dict[str, Any]:
+        """
+        diff one changed file against the stored row hashes and write the difference, without committing
+
+        Keys are unique across agencies, and as in a full import the agency
+        that imported a key first keeps its row: keys owned by another agency
+        are only recorded in the hashes, unowned, and never written or
+        deleted. They are claimed once the owner deletes its row.
+        """
+        started = time.perf_counter()
+        table_name, columns = GTFS_FILES[file_name]
+        column_names = [column for column, _, _, _ in columns]
+        key_column = GTFS_KEYS[file_name]
+        key_index = column_names.index(key_column)
+        grouped = file_name in GROUPED_FILES
+
+        stored = self._stored_hashes(agency_id, file_name)
+        others = self._owned_by_others(agency_id, file_name)
+        current = {}
+        changed_rows = []
+        with gtfs_zip.open(file_name) as f:
+            if grouped:
+                # the group hash covers every raw row of the key, in file order; only
+                # the rows of changed groups are converted, in the second pass below
+                positions, reader = self.read_csv(f)
+                key_position = positions[columns[key_index][1]]
+                digests = {}
+                for row in reader:
+                    key = row[key_position]
+                    digest = digests.get(key)
+                    if digest is None:
+                        digests[key] = digest = group_digest(positions)
+                    digest.update(repr(row).encode('utf-8'))
+                current = {key: digest.hexdigest() for key, digest in digests.items()}
+            else:
+                for row in self.read_rows(file_name, f, agency_id):
+                    key = row[key_index]
+                    current[key] = row_hash(row)
+                    # new or changed rows, and rows this agency did not own so far
+                    if key not in others and stored.get(key) != (current[key], True):
+                        changed_rows.append(row)
+
+        inserted = [key for key in current if key not in stored]
+        updated = [key for key, content_hash in current.items() if key in stored and stored[key][0] != content_hash]
+        deleted = [key for key in stored if key not in current]
+        # only rows this agency owns are deleted from the table
+        released = [key for key in deleted if stored[key][1]]
+
+        connection = db.session.connection()
+        now = datetime.utcnow()
+        if grouped:
+            # replace the rows of every new, changed, newly owned or removed group
+            replaced = {key for key, content_hash in current.items()
+                        if key not in others and stored.get(key) != (content_hash, True)}
+            removed = [(key,) for key in list(replaced) + released]
+            if removed:
+                connection.exec_driver_sql(f"DELETE FROM {table_name} WHERE {key_column} = ?", removed)
+            # a first import loads everything, build the secondary indexes after it
+            deferred = [] if stored else [
+                index for index in db.metadata.tables[table_name].indexes if not index.unique
+            ]
+            for index in deferred:
+                index.drop(connection, checkfirst=True)
+            sql = self.insert_sql(file_name)
+            with gtfs_zip.open(file_name) as f:
+                rows = self.read_rows(file_name, f, agency_id, keys=replaced)
+                for chunk in iter(lambda: list(islice(rows, self.chunk_size)), []):
+                    connection.exec_driver_sql(sql, [row + (now, now) for row in chunk])
+            for index in deferred:
+                index.create(connection, checkfirst=True)
+        else:
+            # upsert: rows of an older, unversioned import are updated in place
+            assignments = ', '.join(
+                f"{column} = excluded.{column}" for column in column_names + ['updated_at'] if column != key_column
+            )
+            sql = f"{self.insert_sql(file_name)} ON CONFLICT({key_column}) DO UPDATE SET {assignments}"
+            for start in range(0, len(changed_rows), self.chunk_size):
+                connection.exec_driver_sql(sql, [row + (now, now) for row in changed_rows[start:start + self.chunk_size]])
+            if released:
+                connection.exec_driver_sql(
+                    f"DELETE FROM {table_name} WHERE {key_column} = ?", [(key,) for key in released]
+                )
+
+        if deleted:
+            connection.exec_driver_sql(
+                "DELETE FROM feed_row_hashes WHERE agency_id = ? AND file_name = ? AND row_key = ?",
+                [(agency_id, file_name, key) for key in deleted]
+            )
+        if released:
+            self._release(agency_id, file_name, released)
+        changed = [
+            (agency_id, file_name, key, content_hash, key not in others)
+            for key, content_hash in current.items()
+            if stored.get(key) != (content_hash, key not in others)
+        ]
+        for start in range(0, len(changed), self.chunk_size):
+            connection.exec_driver_sql(
+                "INSERT OR REPLACE INTO feed_row_hashes (agency_id, file_name, row_key, row_hash, owned) "
+                "VALUES (?, ?, ?, ?, ?)",
+                changed[start:start + self.chunk_size]
+            )
+
+        stats = {
+            'inserted': len(inserted),
+            'updated': len(updated),
+            'deleted': len(deleted),
+            'seconds': round(time.perf_counter() - started, 2)
+        }
+        self.logger.info(f"{agency_id} {file_name}: {stats}")
+        return stats
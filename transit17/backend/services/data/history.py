@@ -0,0 +1,400 @@
+"""
+Columnar history of vehicle positions
+
+Every reported vehicle position is appended to fixed-width column files, one
+directory per agency and local day, `<root>/<agency>/<YYYYMMDD>/<column>.col`:
+
+    timestamp      int64    report time, seconds since the epoch
+    vehicle        uint32   code of the vehicle id  (see below)
+    trip           uint32   code of the trip id
+    route          uint16   code of the route id
+    latitude       float32  NaN if missing
+    longitude      float32  NaN if missing
+    status         uint8    GTFS-rt VehicleStopStatus, 255 if missing
+    stop_sequence  int32    -1 if missing
+
+String ids are dictionary-encoded per day: `<column>.dict` holds one id per
+line and a code is the line number, 0 standing for no id. Days are read
+through memory maps as NumPy arrays, so filters and aggregates over a day
+run vectorized without building a Python object per row.
+
+The collector is the only writer. Dictionary entries are flushed before the
+column values using them and readers use the shortest column, so a day that
+is being written can be read at any time. A writer opening a day first cuts
+the columns to the shortest one, dropping a row a crash left half-written.
+"""
+import logging
+import os
+import shutil
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+from backend.config.settings import POSITION_HISTORY_DIR, POSITION_HISTORY_RETENTION_DAYS
+
+COLUMNS = {
+    'timestamp': np.dtype('<i8'),
+    'vehicle': np.dtype('<u4'),
+    'trip': np.dtype('<u4'),
+    'route': np.dtype('<u2'),
+    'latitude': np.dtype('<f4'),
+    'longitude': np.dtype('<f4'),
+    'status': np.dtype('u1'),
+    'stop_sequence': np.dtype('<i4')
+}
+# dictionary-encoded columns and the id field they hold
+DICTIONARY_COLUMNS = {'vehicle': 'vehicle_id', 'trip': 'trip_id', 'route': 'route_id'}
+
+MISSING_STATUS = 255
+MISSING_STOP_SEQUENCE = -1
+_DAY_FORMAT = '%Y%m%d'
+
+logger = logging.getLogger(__name__)
+
+def _epoch(value) -> int:
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+class _DayWriter:
+    """Open column files and dictionaries of the day being appended to"""
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        _repair(path)
+        self.dictionaries: Dict[str, Dict[str, int]] = {}
+        self.dictionary_files = {}
+        for column in DICTIONARY_COLUMNS:
+            dictionary_path = os.path.join(path, f"{column}.dict")
+            ids = _read_dictionary(dictionary_path)
+            self.dictionaries[column] = {value: code for code, value in enumerate(ids) if code}
+            self.dictionary_files[column] = open(dictionary_path, 'a', encoding='utf-8')
+            if not ids:
+                self.dictionary_files[column].write('\n')  # code 0, no id
+        self.column_files = {column: open(os.path.join(path, f"{column}.col"), 'ab') for column in COLUMNS}
+
+    def encode(self, column: str, values: Iterable[Optional[str]]) -> np.ndarray:
+        dictionary = self.dictionaries[column]
+        codes = []
+        new_ids = []
+        for value in values:
+            if not value:
+                codes.append(0)
+                continue
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary) + 1
+                new_ids.append(value)
+            codes.append(code)
+        if new_ids:
+            self.dictionary_files[column].write(''.join(f"{value}\n" for value in new_ids))
+        return np.asarray(codes, dtype=COLUMNS[column])
+
+    def write(self, columns: Dict[str, np.ndarray]) -> None:
+        # dictionaries first, a reader never sees a code it cannot resolve
+        for f in self.dictionary_files.values():
+            f.flush()
+        for column, values in columns.items():
+            self.column_files[column].write(values.astype(COLUMNS[column], copy=False).tobytes())
+        for f in self.column_files.values():
+            f.flush()
+
+    def close(self) -> None:
+        for f in list(self.dictionary_files.values()) + list(self.column_files.values()):
+            f.close()
+
+def _repair(path: str) -> None:
+    """
+    cut what a crash in the middle of a write left behind in a day: column
+    values past the shortest column, so appends stay aligned, and a
+    dictionary line without its newline
+    """
+    rows = min(
+        os.path.getsize(os.path.join(path, f"{column}.col")) // dtype.itemsize
+        if os.path.exists(os.path.join(path, f"{column}.col")) else 0
+        for column, dtype in COLUMNS.items()
+    )
+    for column, dtype in COLUMNS.items():
+        column_path = os.path.join(path, f"{column}.col")
+        if os.path.exists(column_path) and os.path.getsize(column_path) > rows * dtype.itemsize:
+            os.truncate(column_path, rows * dtype.itemsize)
+            logger.warning(f"Truncated {column_path} to {rows} rows")
+    for column in DICTIONARY_COLUMNS:
+        dictionary_path = os.path.join(path, f"{column}.dict")
+        if not os.path.exists(dictionary_path):
+            continue
+        with open(dictionary_path, 'rb') as f:
+            content = f.read()
+        if content and not content.endswith(b'\n'):
+            os.truncate(dictionary_path, content.rfind(b'\n') + 1)
+            logger.warning(f"Truncated a partial line of {dictionary_path}")
+
+def _read_dictionary(path: str) -> List[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return f.read().split('\n')[:-1]
+
+class HistoryDay:
+    """Columns of one day as memory-mapped NumPy arrays, plus the id dictionaries"""
+
+    def __init__(self, path: str):
+        self.path = path
+        sizes = {
+            column: os.path.getsize(os.path.join(path, f"{column}.col")) // dtype.itemsize
+            if os.path.exists(os.path.join(path, f"{column}.col")) else 0
+            for column, dtype in COLUMNS.items()
+        }
+        self.rows = min(sizes.values())
+        self.columns: Dict[str, np.ndarray] = {
+            column: np.memmap(os.path.join(path, f"{column}.col"), dtype=dtype, mode='r', shape=(self.rows,))
+            if self.rows else np.empty(0, dtype=dtype)
+            for column, dtype in COLUMNS.items()
+        }
+        self.dictionaries = {
+            column: np.array(_read_dictionary(os.path.join(path, f"{column}.dict")) or [''], dtype=object)
+            for column in DICTIONARY_COLUMNS
+        }
+
+    def code(self, column: str, value: str) -> Optional[int]:
+        """get the code of an id in this day, None if it does not occur"""
+        matches = np.flatnonzero(self.dictionaries[column] == value)
+        return int(matches[0]) if len(matches) and value else None
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+class PositionHistory:
+    """Append vehicle positions to day segments and query them as arrays"""
+
+    def __init__(self, root: str = POSITION_HISTORY_DIR):
+        self.root = root
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._writers: Dict[str, Any] = {}  # agency_id -> (day, _DayWriter)
+        self._last_report: Dict[str, Dict[Any, int]] = {}  # agency_id -> vehicle key -> report time
+        self._sealed: Dict[str, HistoryDay] = {}  # path -> past day, they don't change anymore
+
+    def _day_path(self, agency_id: str, day: str) -> str:
+        return os.path.join(self.root, agency_id, day)
+
+    # writing
+
+    def append(self, agency_id: str, vehicle_positions: List[Dict[str, Any]],
+               routes_by_trip: Optional[Dict[str, str]] = None) -> int:
+        """
+        Append vehicle positions
+
+        Args:
+            agency_id (str): subway, lirr or mnr
+            vehicle_positions (list): dicts as built by
+                BaseMTAService.process_vehicle_positions
+            routes_by_trip (dict): trip_id -> route_id for vehicles without
+                a route_id
+
+        Returns:
+            int: number of positions appended
+        """
+        routes_by_trip = routes_by_trip or {}
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for vehicle in vehicle_positions:
+            timestamp = _epoch(vehicle.get('timestamp') or datetime.now())
+            by_day.setdefault(datetime.fromtimestamp(timestamp).strftime(_DAY_FORMAT), []).append(
+                dict(vehicle, timestamp=timestamp)
+            )
+
+        with self._lock:
+            for day, vehicles in sorted(by_day.items()):
+                writer = self._writer(agency_id, day)
+                positions = [vehicle.get('position') or {} for vehicle in vehicles]
+                writer.write({
+                    'timestamp': np.fromiter((vehicle['timestamp'] for vehicle in vehicles), COLUMNS['timestamp'],
+                                             len(vehicles)),
+                    'vehicle': writer.encode('vehicle', (vehicle.get('vehicle_id') for vehicle in vehicles)),
+                    'trip': writer.encode('trip', (vehicle.get('trip_id') for vehicle in vehicles)),
+                    'route': writer.encode('route', (
+                        vehicle.get('route_id') or routes_by_trip.get(vehicle.get('trip_id')) for vehicle in vehicles
+                    )),
+                    'latitude': np.array([
+                        np.nan if position.get('latitude') is None else position['latitude'] for position in positions
+                    ], dtype=COLUMNS['latitude']),
+                    'longitude': np.array([
+                        np.nan if position.get('longitude') is None else position['longitude'] for position in positions
+                    ], dtype=COLUMNS['longitude']),
+                    'status': np.array([
+                        MISSING_STATUS if vehicle.get('current_status') is None else vehicle['current_status']
+                        for vehicle in vehicles
+                    ], dtype=COLUMNS['status']),
+                    'stop_sequence': np.array([
+                        MISSING_STOP_SEQUENCE if vehicle.get('current_stop_sequence') is None
+                        else vehicle['current_stop_sequence'] for vehicle in vehicles
+                    ], dtype=COLUMNS['stop_sequence'])
+                })
+                if self._writers[agency_id][1] is not writer:
+                    writer.close()
+        return sum(len(vehicles) for vehicles in by_day.values())
+
+    def append_cycle(self, agency_id: str, realtime_data: Dict[str, Any]) -> int:
+        """
+        Append the vehicle positions of one poll cycle
+
+        Routes come from the cycle's trip updates; a vehicle whose report time
+        did not change since the last cycle is not appended again.
+        """
+        routes_by_trip = {
+            trip_update['trip_id']: trip_update['route_id']
+            for trip_update in realtime_data.get('trip_updates') or []
+        }
+        last_report = self._last_report.setdefault(agency_id, {})
+        fresh = []
+        for vehicle in realtime_data.get('vehicle_positions') or []:
+            key = vehicle.get('vehicle_id') or vehicle.get('trip_id')
+            timestamp = _epoch(vehicle.get('timestamp') or datetime.now())
+            if last_report.get(key) == timestamp:
+                continue
+            last_report[key] = timestamp
+            fresh.append(vehicle)
+        return self.append(agency_id, fresh, routes_by_trip)
+
+    def _writer(self, agency_id: str, day: str) -> _DayWriter:
+        current = self._writers.get(agency_id)
+        if current is not None and current[0] == day:
+            return current[1]
+        if current is not None and current[0] > day:
+            # a late report of a past day, appended without switching the open day
+            return _DayWriter(self._day_path(agency_id, day))
+        if current is not None:
+            current[1].close()
+        writer = _DayWriter(self._day_path(agency_id, day))
+        self._writers[agency_id] = (day, writer)
+        return writer
+
+    def close(self) -> None:
+        with self._lock:
+            for _, writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+
+    # reading
+
+    def days(self, agency_id: str) -> List[str]:
+        """get the days with positions of an agency, oldest first"""
+        path = os.path.join(self.root, agency_id)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name for name in os.listdir(path) if len(name) == 8 and name.isdigit())
+
+    def load_day(self, agency_id: str, day) -> HistoryDay:
+        """
+        Get the columns of one day
+
+        Args:
+            day: date or 'YYYYMMDD'
+        """
+        if isinstance(day, (date, datetime)):
+            day = day.strftime(_DAY_FORMAT)
+        path = self._day_path(agency_id, day)
+        if day >= datetime.now().strftime(_DAY_FORMAT):
+            return HistoryDay(path)  # still growing
+        with self._lock:
+            history_day = self._sealed.get(path)
+            if history_day is None:
+                history_day = self._sealed[path] = HistoryDay(path)
+            return history_day
+
+    def query(self, agency_id: str, start: datetime, end: datetime, vehicle_id: Optional[str] = None,
+              trip_id: Optional[str] = None, route_id: Optional[str] = None,
+              decode: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Get the positions reported in [start, end), optionally of one vehicle, trip or route
+
+        Returns:
+            dict: column -> array, in append order; with decode the id columns
+                are replaced by 'vehicle_id', 'trip_id' and 'route_id' arrays
+                of strings ('' for no id)
+        """
+        start_ts, end_ts = _epoch(start), _epoch(end)
+        filters = {'vehicle': vehicle_id, 'trip': trip_id, 'route': route_id}
+        parts = []
+        day = start.date() if isinstance(start, datetime) else datetime.fromtimestamp(start_ts).date()
+        last_day = datetime.fromtimestamp(end_ts).date()
+        while day <= last_day:
+            history_day = self.load_day(agency_id, day)
+            day += timedelta(days=1)
+            if not history_day.rows:
+                continue
+            timestamps = history_day['timestamp']
+            mask = (timestamps >= start_ts) & (timestamps < end_ts)
+            for column, value in filters.items():
+                if value is None:
+                    continue
+                code = history_day.code(column, value)
+                if code is None:
+                    mask[:] = False
+                    break
+                mask &= history_day[column] == code
+            rows = np.flatnonzero(mask)
+            part = {column: history_day[column][rows] for column in COLUMNS}
+            if decode:
+                for column, field in DICTIONARY_COLUMNS.items():
+                    part[field] = history_day.dictionaries[column][part.pop(column)]
+            parts.append(part)
+
+        if not parts:
+            empty = {column: np.empty(0, dtype=dtype) for column, dtype in COLUMNS.items()}
+            if decode:
+                for column, field in DICTIONARY_COLUMNS.items():
+                    empty.pop(column)
+                    empty[field] = np.empty(0, dtype=object)
+            return empty
+        return {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+
+    def track(self, agency_id: str, vehicle_id: str, start: datetime, end: datetime) -> Dict[str, np.ndarray]:
+        """get where a vehicle was in [start, end), ordered by report time"""
+        positions = self.query(agency_id, start, end, vehicle_id=vehicle_id)
+        order = np.argsort(positions['timestamp'], kind='stable')
+        return {column: values[order] for column, values in positions.items()}
+
+    # maintenance
+
+    def prune(self, retention_days: int = POSITION_HISTORY_RETENTION_DAYS) -> int:
+        """delete days older than retention_days, returns the number of days deleted"""
+        cutoff = (datetime.now() - timedelta(days=retention_days)).strftime(_DAY_FORMAT)
+        deleted = 0
+        if not os.path.isdir(self.root):
+            return 0
+        for agency_id in os.listdir(self.root):
+            for day in self.days(agency_id):
+                if day < cutoff:
+                    path = self._day_path(agency_id, day)
+                    with self._lock:
+                        self._sealed.pop(path, None)
+                    shutil.rmtree(path, ignore_errors=True)
+                    deleted += 1
+        if deleted:
+            self.logger.info(f"Pruned {deleted} position history days older than {cutoff}")
+        return deleted
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get days, positions and bytes stored per agency"""
+        stats = {}
+        if not os.path.isdir(self.root):
+            return stats
+        for agency_id in sorted(os.listdir(self.root)):
+            days = self.days(agency_id)
+            rows = stored = 0
+            for day in days:
+                path = self._day_path(agency_id, day)
+                files = [os.path.join(path, name) for name in os.listdir(path)]
+                stored += sum(os.path.getsize(name) for name in files)
+                timestamp_file = os.path.join(path, 'timestamp.col')
+                if os.path.exists(timestamp_file):
+                    rows += os.path.getsize(timestamp_file) // COLUMNS['timestamp'].itemsize
+            stats[agency_id] = {
+                'days': len(days),
+                'first_day': days[0] if days else None,
+                'last_day': days[-1] if days else None,
+                'positions': rows,
+                'bytes_stored': stored
+            }
+        return stats
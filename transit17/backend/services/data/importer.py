@@ -1,215 +1,511 @@
 import csv
+import io
+import logging
+import os
+import sys
+import time
 import requests
 import tempfile
 import zipfile
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 from backend import db
-from backend.models import (
-    Route, Stop, Trip, StopTime,
-    TripUpdate, StopTimeUpdate, VehiclePosition, ServiceAlert
+from backend.config.settings import GTFS_IMPORT_CHUNK_SIZE, REALTIME_INGEST_BATCH_SIZE
+from backend.services.data.interning import id_resolver
+from backend.services.data.partitions import partition_manager
+from backend.models import Trip, ServiceAlert
+
+logger = logging.getLogger(__name__)
+
+def gtfs_seconds(value):
+    """seconds since the start of the service day of a GTFS time, H:MM:SS or HH:MM:SS, may exceed 24:00:00"""
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+# GTFS file -> table and (column, GTFS field, converter or None to keep the text, value for missing or empty fields)
+GTFS_FILES = {
+    'routes.txt': ('routes', (
+        ('route_id', 'route_id', None, None),
+        ('agency_id', 'agency_id', None, None),  # the agency imported if missing
+        ('route_short_name', 'route_short_name', None, None),
+        ('route_long_name', 'route_long_name', None, None),
+        ('route_desc', 'route_desc', None, None),
+        ('route_type', 'route_type', int, 1),  # Default to subway/metro type
+        ('route_url', 'route_url', None, None),
+        ('route_color', 'route_color', None, None),
+        ('route_text_color', 'route_text_color', None, None)
+    )),
+    'stops.txt': ('stops', (
+        ('stop_id', 'stop_id', None, None),
+        ('stop_code', 'stop_code', None, None),
+        ('stop_name', 'stop_name', None, ''),
+        ('stop_desc', 'stop_desc', None, None),
+        ('stop_lat', 'stop_lat', float, 0.0),
+        ('stop_lon', 'stop_lon', float, 0.0),
+        ('zone_id', 'zone_id', None, None),
+        ('stop_url', 'stop_url', None, None),
+        ('location_type', 'location_type', int, 0),
+        ('parent_station', 'parent_station', None, None),
+        ('wheelchair_boarding', 'wheelchair_boarding', int, 0)
+    )),
+    'trips.txt': ('trips', (
+        ('trip_id', 'trip_id', None, None),
+        ('route_id', 'route_id', None, None),
+        ('service_id', 'service_id', None, None),
+        ('trip_headsign', 'trip_headsign', None, None),
+        ('trip_short_name', 'trip_short_name', None, None),
+        ('direction_id', 'direction_id', int, 0),
+        ('block_id', 'block_id', None, None),
+        ('shape_id', 'shape_id', None, None),
+        ('wheelchair_accessible', 'wheelchair_accessible', int, 0),
+        ('bikes_allowed', 'bikes_allowed', int, 0)
+    )),
+    'stop_times.txt': ('stop_times', (
+        ('trip_id', 'trip_id', None, None),
+        ('stop_id', 'stop_id', None, None),
+        ('arrival_time', 'arrival_time', None, None),
+        ('departure_time', 'departure_time', None, None),
+        ('arrival_seconds', 'arrival_time', gtfs_seconds, None),
+        ('departure_seconds', 'departure_time', gtfs_seconds, None),
+        ('stop_sequence', 'stop_sequence', int, None),
+        ('stop_headsign', 'stop_headsign', None, None),
+        ('pickup_type', 'pickup_type', int, 0),
+        ('drop_off_type', 'drop_off_type', int, 0),
+        ('shape_dist_traveled', 'shape_dist_traveled', float, 0.0),
+        ('timepoint', 'timepoint', int, 1)
+    ))
+}
+
+# tables whose rows are unique by GTFS id, rows already imported are kept
+KEEP_EXISTING = ('routes', 'stops', 'trips')
+
+# route_stops, the index of the routes serving each stop, is rebuilt from trips and
+# stop times whenever either changed; run in the transaction that changed them
+ROUTE_STOPS_SQL = (
+    "DELETE FROM route_stops",
+    "INSERT INTO route_stops (route_id, stop_id) "
+    "SELECT DISTINCT trips.route_id, stop_times.stop_id FROM stop_times JOIN trips ON trips.trip_id = stop_times.trip_id"
 )
 
+def peak_rss_mb():
+    """peak resident set size of this process so far, in MiB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return round(peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024, 1)
+
 class GTFSImporter:
     """Import GTFS static data into database"""
     
+    def __init__(self, chunk_size=GTFS_IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+    
+    @contextmanager
+    def open_gtfs(self, url):
+        """
+        Open a GTFS zip from a URL or a local path
+
+        The download is streamed to a temporary file, zipfile needs a seekable
+        file; the zip is never extracted.
+        """
+        if os.path.exists(url):
+            with zipfile.ZipFile(url) as gtfs_zip:
+                yield gtfs_zip
+            return
+        with tempfile.TemporaryFile() as download:
+            with requests.get(url, stream=True) as response:
+                response.raise_for_status()
+                for block in response.iter_content(chunk_size=1024 * 1024):
+                    download.write(block)
+            with zipfile.ZipFile(download) as gtfs_zip:
+                yield gtfs_zip
+
     def import_gtfs(self, url, agency_id):
-        """Import GTFS data from URL"""
-        # Download GTFS zip file
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Save zip file
-            zip_path = f"{temp_dir}/gtfs.zip"
-            with open(zip_path, 'wb') as f:
-                f.write(response.content)
-            
-            # Extract zip file
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # Import each file
-            try:
-                self.import_routes(f"{temp_dir}/routes.txt")
-                self.import_stops(f"{temp_dir}/stops.txt")
-                self.import_trips(f"{temp_dir}/trips.txt")
-                self.import_stop_times(f"{temp_dir}/stop_times.txt")
-            except Exception as e:
-                print(f"Error importing GTFS data: {str(e)}")
-                raise
+        """
+        Import GTFS data from URL or a local zip file
 
-    @staticmethod
-    def import_routes(file_path):
-        """Import routes from GTFS routes.txt"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    # Check if route already exists
-                    existing_route = Route.query.filter_by(route_id=row['route_id']).first()
-                    if existing_route:
+        The CSV members are streamed out of the zip and bulk inserted
+        chunk_size rows at a time, one transaction per file; route_stops is
+        rebuilt after the last one.
+
+        Returns:
+            list: one dict per file with 'file', 'rows', 'seconds' and
+                'peak_rss_mb' (peak of the process so far)
+        """
+        try:
+            with self.open_gtfs(url) as gtfs_zip:
+                members = set(gtfs_zip.namelist())
+                stats = []
+                for file_name in GTFS_FILES:
+                    if file_name not in members:
+                        logger.warning(f"{file_name} missing from GTFS data of {agency_id}")
                         continue
-                    
-                    # Handle empty values
-                    route_type = row.get('route_type', '')
-                    if not route_type:
-                        route_type = 1  # Default to subway/metro type
-                    
-                    route = Route(
-                        route_id=row['route_id'],
-                        agency_id=row.get('agency_id', 'subway'),
-                        route_short_name=row.get('route_short_name'),
-                        route_long_name=row.get('route_long_name'),
-                        route_desc=row.get('route_desc'),
-                        route_type=int(route_type),
-                        route_url=row.get('route_url'),
-                        route_color=row.get('route_color'),
-                        route_text_color=row.get('route_text_color')
-                    )
-                    db.session.add(route)
-                    db.session.commit()
-                except Exception as e:
-                    print(f"Error importing route {row.get('route_id')}: {str(e)}")
-                    db.session.rollback()
+                    with gtfs_zip.open(file_name) as f:
+                        stats.append(self.import_file(file_name, f, agency_id))
+                self.refresh_route_stops()
+                db.session.commit()
+                return stats
+        except Exception as e:
+            logger.error(f"Error importing GTFS data: {str(e)}")
+            raise
 
     @staticmethod
-    def import_stops(file_path):
-        """Import stops from GTFS stops.txt"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    # Check if stop already exists
-                    existing_stop = Stop.query.filter_by(stop_id=row['stop_id']).first()
-                    if existing_stop:
-                        continue
-                    
-                    # Handle empty values
-                    stop_lat = row.get('stop_lat', '0')
-                    stop_lon = row.get('stop_lon', '0')
-                    location_type = row.get('location_type', '0')
-                    wheelchair_boarding = row.get('wheelchair_boarding', '0')
-                    
-                    if not stop_lat:
-                        stop_lat = '0'
-                    if not stop_lon:
-                        stop_lon = '0'
-                    if not location_type:
-                        location_type = '0'
-                    if not wheelchair_boarding:
-                        wheelchair_boarding = '0'
-                    
-                    stop = Stop(
-                        stop_id=row['stop_id'],
-                        stop_code=row.get('stop_code'),
-                        stop_name=row['stop_name'],
-                        stop_desc=row.get('stop_desc'),
-                        stop_lat=float(stop_lat),
-                        stop_lon=float(stop_lon),
-                        zone_id=row.get('zone_id'),
-                        stop_url=row.get('stop_url'),
-                        location_type=int(location_type),
-                        parent_station=row.get('parent_station'),
-                        wheelchair_boarding=int(wheelchair_boarding)
-                    )
-                    db.session.add(stop)
-                    db.session.commit()
-                except Exception as e:
-                    print(f"Error importing stop {row.get('stop_id')}: {str(e)}")
-                    db.session.rollback()
+    def read_csv(source):
+        """
+        Stream a GTFS file as lists of strings
+
+        Returns:
+            tuple: field name -> column position, iterator over the rows
+        """
+        # utf-8-sig: some feeds start with a byte order mark
+        reader = csv.reader(io.TextIOWrapper(source, encoding='utf-8-sig', newline=''))
+        header = next(reader, [])
+        return {field: index for index, field in enumerate(header)}, reader
+
+    @classmethod
+    def read_rows(cls, file_name, source, agency_id=None, keys=None):
+        """
+        Stream the rows of a GTFS file converted to the columns of its table
+
+        Args:
+            file_name (str): GTFS file name, a key of GTFS_FILES
+            source: binary file object, e.g. a zip member
+            agency_id (str): agency of routes without agency_id
+            keys (set): only convert rows whose first column (the key of
+                routes, stops, trips and stop times) is in keys
+
+        Returns:
+            iterator: tuples of column values in the order of GTFS_FILES
+        """
+        positions, reader = cls.read_csv(source)
+        convert_row = cls.row_converter(file_name, positions, agency_id)
+        if keys is not None:
+            key_position = positions.get(GTFS_FILES[file_name][1][0][1])
+            reader = (row for row in reader if row[key_position] in keys)
+        return map(convert_row, reader)
 
     @staticmethod
-    def import_trips(file_path):
-        """Import trips from GTFS trips.txt"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                trip = Trip(
-                    trip_id=row['trip_id'],
-                    route_id=row['route_id'],
-                    service_id=row['service_id'],
-                    trip_headsign=row.get('trip_headsign'),
-                    trip_short_name=row.get('trip_short_name'),
-                    direction_id=int(row.get('direction_id', 0)),
-                    block_id=row.get('block_id'),
-                    shape_id=row.get('shape_id'),
-                    wheelchair_accessible=int(row.get('wheelchair_accessible', 0)),
-                    bikes_allowed=int(row.get('bikes_allowed', 0))
-                )
-                db.session.add(trip)
-        db.session.commit()
+    def row_converter(file_name, positions, agency_id=None):
+        """get a function converting a raw row of a GTFS file to the column values of its table"""
+        converters = [
+            (positions.get(field), convert, agency_id if column == 'agency_id' else default)
+            for column, field, convert, default in GTFS_FILES[file_name][1]
+        ]
+
+        def convert_row(row):
+            return tuple(
+                (row[index] if convert is None else convert(row[index]))
+                if index is not None and index < len(row) and row[index] != '' else default
+                for index, convert, default in converters
+            )
+        return convert_row
+
+    @staticmethod
+    def insert_sql(file_name, verb='INSERT'):
+        """get the insert statement of a GTFS file's table, taking its columns plus created_at and updated_at"""
+        table_name, columns = GTFS_FILES[file_name]
+        column_names = [column for column, _, _, _ in columns] + ['created_at', 'updated_at']
+        return (f"{verb} INTO {table_name} ({', '.join(column_names)}) "
+                f"VALUES ({', '.join('?' for _ in column_names)})")
+
+    def import_file(self, file_name, source, agency_id=None):
+        """
+        Bulk import one GTFS file
+
+        Args:
+            file_name (str): GTFS file name, a key of GTFS_FILES
+            source: path of the file or a binary file object, e.g. a zip member
+            agency_id (str): agency of routes without agency_id
+
+        Returns:
+            dict: 'file', 'rows', 'seconds', 'peak_rss_mb'
+        """
+        started = time.perf_counter()
+        table_name = GTFS_FILES[file_name][0]
+        table = db.metadata.tables[table_name]
+
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return self.import_file(file_name, f, agency_id)
+
+        sql = self.insert_sql(file_name, 'INSERT OR IGNORE' if table_name in KEEP_EXISTING else 'INSERT')
+        now = datetime.utcnow()
+        rows = self.read_rows(file_name, source, agency_id)
+
+        connection = db.session.connection()
+        # secondary indexes are built once after the load instead of row by row
+        deferred = [index for index in table.indexes if not index.unique]
+        for index in deferred:
+            index.drop(connection, checkfirst=True)
+        count = 0
+        try:
+            for chunk in iter(lambda: list(islice(rows, self.chunk_size)), []):
+                connection.exec_driver_sql(sql, [row + (now, now) for row in chunk])
+                count += len(chunk)
+            for index in deferred:
+                index.create(connection, checkfirst=True)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {
+            'file': file_name,
+            'rows': count,
+            'seconds': round(time.perf_counter() - started, 2),
+            'peak_rss_mb': peak_rss_mb()
+        }
 
     @staticmethod
-    def import_stop_times(file_path):
+    def refresh_route_stops(connection=None):
+        """rebuild route_stops from trips and stop times, without committing"""
+        connection = connection or db.session.connection()
+        for sql in ROUTE_STOPS_SQL:
+            connection.exec_driver_sql(sql)
+
+    def import_routes(self, file_path, agency_id=None):
+        """Import routes from GTFS routes.txt"""
+        return self.import_file('routes.txt', file_path, agency_id)
+
+    def import_stops(self, file_path):
+        """Import stops from GTFS stops.txt"""
+        return self.import_file('stops.txt', file_path)
+
+    def import_trips(self, file_path):
+        """Import trips from GTFS trips.txt"""
+        return self.import_file('trips.txt', file_path)
+
+    def import_stop_times(self, file_path):
         """Import stop times from GTFS stop_times.txt"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                stop_time = StopTime(
-                    trip_id=row['trip_id'],
-                    stop_id=row['stop_id'],
-                    arrival_time=row['arrival_time'],
-                    departure_time=row['departure_time'],
-                    stop_sequence=int(row['stop_sequence']),
-                    stop_headsign=row.get('stop_headsign'),
-                    pickup_type=int(row.get('pickup_type', 0)),
-                    drop_off_type=int(row.get('drop_off_type', 0)),
-                    shape_dist_traveled=float(row.get('shape_dist_traveled', 0)),
-                    timepoint=int(row.get('timepoint', 1))
-                )
-                db.session.add(stop_time)
-        db.session.commit()
+        return self.import_file('stop_times.txt', file_path)
 
 class RealtimeImporter:
     """Import GTFS real-time data into database"""
     
-    @staticmethod
-    def import_trip_update(trip_update_data, agency_id):
+    @classmethod
+    def import_trip_update(cls, trip_update_data, agency_id):
         """Import trip update from processed data"""
-        trip_update = TripUpdate(
-            trip_id=trip_update_data['trip_id'],
-            route_id=trip_update_data['route_id'],
-            direction_id=trip_update_data['direction_id'],
-            start_time=trip_update_data['start_time'],
-            start_date=trip_update_data['start_date'],
-            schedule_relationship=trip_update_data['schedule_relationship'],
-            feed_timestamp=datetime.now(),  # Use current time as feed timestamp
-            agency_id=agency_id
-        )
-        db.session.add(trip_update)
-        db.session.flush()
-
-        # Import stop time updates
-        for stop_update in trip_update_data['stop_updates']:
-            stop_time_update = StopTimeUpdate(
-                trip_update_id=trip_update.id,
-                stop_id=stop_update['stop_id'],
-                stop_sequence=stop_update['stop_sequence'],
-                arrival_time=datetime.fromtimestamp(stop_update['arrival_time']) if stop_update['arrival_time'] else None,
-                departure_time=datetime.fromtimestamp(stop_update['departure_time']) if stop_update['departure_time'] else None
-            )
-            db.session.add(stop_time_update)
-        db.session.commit()
+        # the realtime tables are views over partitions, rows go in through the bulk path
+        cls.import_realtime_data({'trip_updates': [trip_update_data]}, agency_id)
 
-    @staticmethod
-    def import_vehicle_position(vehicle_data, agency_id):
+    @classmethod
+    def import_vehicle_position(cls, vehicle_data, agency_id):
         """Import vehicle position from processed data"""
-        position = VehiclePosition(
-            vehicle_id=vehicle_data['vehicle_id'],
-            trip_id=vehicle_data.get('trip_id'),
-            current_stop_sequence=vehicle_data['current_stop_sequence'],
-            current_status=vehicle_data['current_status'],
-            timestamp=datetime.now(),  # Use current time as timestamp
-            latitude=vehicle_data['position']['latitude'],
-            longitude=vehicle_data['position']['longitude'],
-            speed=vehicle_data['position'].get('speed'),
-            bearing=vehicle_data['position'].get('bearing'),
-            feed_timestamp=datetime.now(),  # Use current time as feed timestamp
-            agency_id=agency_id
-        )
-        db.session.add(position)
-        db.session.commit()
+        cls.import_realtime_data({'vehicle_positions': [vehicle_data]}, agency_id)
+
+    @staticmethod
+    def _insert_chunked(table, rows, chunk_size):
+        """bulk insert rows with executemany, chunk_size rows per statement"""
+        for start in range(0, len(rows), chunk_size):
+            db.session.execute(table.insert(), rows[start:start + chunk_size])
+
+    @classmethod
+    def _insert_partitioned(cls, group, rows, chunk_size):
+        """
+        bulk insert rows into the time partitions they belong to
+
+        Args:
+            group (str): partition group, see PARTITION_GROUPS
+            rows (dict): table name -> list of (partition key, row)
+        """
+        by_key = {}
+        for table_name, keyed_rows in rows.items():
+            for key, row in keyed_rows:
+                by_key.setdefault(key, {}).setdefault(table_name, []).append(row)
+        for key, tables in by_key.items():
+            partitions = partition_manager.ensure_partition(group, key)
+            for table_name, table_rows in tables.items():
+                cls._insert_chunked(partitions[table_name], table_rows, chunk_size)
+
+    @staticmethod
+    def _routes_by_trip(realtime_data, *vehicle_lists):
+        """
+        route of the trip of every vehicle: from the trip updates of the same
+        poll cycle, else from the static trips
+        """
+        routes = {
+            trip_update['trip_id']: trip_update['route_id']
+            for trip_update in realtime_data.get('trip_updates') or []
+        }
+        missing = list({
+            vehicle['trip_id'] for vehicles in vehicle_lists for vehicle in vehicles
+            if vehicle.get('trip_id') and not vehicle.get('route_id') and vehicle['trip_id'] not in routes
+        })
+        # stay below SQLite's host parameter limit
+        for start in range(0, len(missing), 500):
+            routes.update(db.session.query(Trip.trip_id, Trip.route_id).filter(
+                Trip.trip_id.in_(missing[start:start + 500])
+            ))
+        return routes
+
+    @classmethod
+    def import_realtime_data(cls, realtime_data, agency_id, feed_timestamp=None,
+                             chunk_size=REALTIME_INGEST_BATCH_SIZE, tracker=None):
+        """
+        Import the trip updates and vehicle positions of one poll cycle in a
+        single transaction using bulk inserts
+
+        Rows go straight to the time partition of their feed timestamp, stop
+        time updates to the partition of their trip update. Ids are assigned
+        up front from the current maximum id so stop time updates can
+        reference their trip update without a flush per trip; this relies on
+        the collector being the only writer of the realtime tables.
+
+        Args:
+            realtime_data (dict): 'trip_updates', 'vehicle_positions' and
+                'feeds' as built by BaseMTAService.build_realtime_data
+            agency_id (str): subway, lirr or mnr
+            feed_timestamp (datetime): feed timestamp of rows whose feed header
+                has no timestamp, defaults to now
+            chunk_size (int): rows per insert statement
+            tracker (ChangeTracker): write only new or changed entities and end
+                markers for entities that left their feed, optional
+
+        Returns:
+            dict: number of rows inserted per table, plus the number of
+                unchanged entities skipped and of end markers
+        """
+        feed_timestamp = feed_timestamp or datetime.now()
+        fromtimestamp = datetime.fromtimestamp
+        feed_timestamps = {
+            feed_id: fromtimestamp(header_timestamp)
+            for feed_id, header_timestamp in (realtime_data.get('feeds') or {}).items()
+            if header_timestamp
+        }
+
+        changes = tracker.diff(agency_id, realtime_data) if tracker is not None else None
+        if changes is not None:
+            trip_updates = changes.trip_updates
+            vehicle_positions = changes.vehicle_positions
+            ended_trips = changes.ended_trips
+            ended_vehicles = changes.ended_vehicles
+        else:
+            trip_updates = realtime_data.get('trip_updates') or []
+            vehicle_positions = realtime_data.get('vehicle_positions') or []
+            ended_trips = ended_vehicles = []
+
+        try:
+            partition_key = partition_manager.partition_key
+            next_trip_update_id = partition_manager.next_id('trip_updates')
+            trip_rows = []
+            stop_rows = []
+            for trip_update_id, trip_update_data in enumerate(trip_updates, next_trip_update_id):
+                row_feed_timestamp = feed_timestamps.get(trip_update_data.get('feed_id'), feed_timestamp)
+                key = partition_key(row_feed_timestamp)
+                trip_rows.append((key, {
+                    'id': trip_update_id,
+                    'trip_id': trip_update_data['trip_id'],
+                    'route_id': trip_update_data['route_id'],
+                    'direction_id': trip_update_data['direction_id'],
+                    'start_time': trip_update_data['start_time'],
+                    'start_date': trip_update_data['start_date'],
+                    'schedule_relationship': trip_update_data['schedule_relationship'],
+                    'feed_timestamp': row_feed_timestamp,
+                    'agency_id': agency_id,
+                    'feed_id': trip_update_data.get('feed_id'),
+                    'content_hash': trip_update_data.get('content_hash'),
+                    'end_marker': False
+                }))
+                stop_rows.extend((key, {
+                    'trip_update_id': trip_update_id,
+                    'route_id': trip_update_data['route_id'],
+                    'agency_id': agency_id,
+                    'stop_id': stop_update['stop_id'],
+                    'stop_sequence': stop_update['stop_sequence'],
+                    'arrival_time': fromtimestamp(stop_update['arrival_time']) if stop_update['arrival_time'] else None,
+                    'departure_time': fromtimestamp(stop_update['departure_time']) if stop_update['departure_time'] else None,
+                    'schedule_relationship': stop_update.get('schedule_relationship')
+                }) for stop_update in trip_update_data['stop_updates'])
+
+            for trip_update_id, ended in enumerate(ended_trips, next_trip_update_id + len(trip_rows)):
+                row_feed_timestamp = feed_timestamps.get(ended['feed_id'], feed_timestamp)
+                trip_rows.append((partition_key(row_feed_timestamp), dict(
+                    ended,
+                    id=trip_update_id,
+                    feed_timestamp=row_feed_timestamp,
+                    agency_id=agency_id,
+                    content_hash=None,
+                    end_marker=True
+                )))
+
+            routes_by_trip = cls._routes_by_trip(realtime_data, vehicle_positions, ended_vehicles)
+            vehicle_rows = [{
+                'vehicle_id': vehicle_data['vehicle_id'],
+                'trip_id': vehicle_data.get('trip_id'),
+                'route_id': vehicle_data.get('route_id') or routes_by_trip.get(vehicle_data.get('trip_id')),
+                'current_stop_sequence': vehicle_data['current_stop_sequence'],
+                'current_status': vehicle_data['current_status'],
+                'timestamp': feed_timestamp,
+                'latitude': vehicle_data['position']['latitude'],
+                'longitude': vehicle_data['position']['longitude'],
+                'speed': vehicle_data['position'].get('speed'),
+                'bearing': vehicle_data['position'].get('bearing'),
+                'feed_timestamp': feed_timestamps.get(vehicle_data.get('feed_id'), feed_timestamp),
+                'agency_id': agency_id,
+                'feed_id': vehicle_data.get('feed_id'),
+                'content_hash': vehicle_data.get('content_hash'),
+                'end_marker': False
+            } for vehicle_data in vehicle_positions]
+
+            # executemany needs the same columns in every row
+            vehicle_rows.extend({
+                'vehicle_id': ended['vehicle_id'],
+                'trip_id': ended['trip_id'],
+                'route_id': routes_by_trip.get(ended['trip_id']),
+                'current_stop_sequence': None,
+                'current_status': None,
+                'timestamp': feed_timestamp,
+                'latitude': None,
+                'longitude': None,
+                'speed': None,
+                'bearing': None,
+                'feed_timestamp': feed_timestamps.get(ended['feed_id'], feed_timestamp),
+                'agency_id': agency_id,
+                'feed_id': ended['feed_id'],
+                'content_hash': None,
+                'end_marker': True
+            } for ended in ended_vehicles)
+
+            stop_rows = [(key, dict(row, id=stop_time_update_id)) for stop_time_update_id, (key, row) in enumerate(
+                stop_rows, partition_manager.next_id('stop_time_updates')
+            )]
+            vehicle_rows = [(partition_key(row['feed_timestamp']), dict(row, id=vehicle_position_id))
+                            for vehicle_position_id, row in enumerate(
+                                vehicle_rows, partition_manager.next_id('vehicle_positions'))]
+
+            # string ids are stored as their interned codes
+            for table_name, keyed_rows in (
+                ('trip_updates', trip_rows), ('stop_time_updates', stop_rows), ('vehicle_positions', vehicle_rows)
+            ):
+                id_resolver.encode_rows(table_name, [row for _, row in keyed_rows])
+
+            cls._insert_partitioned('trip_updates', {
+                'trip_updates': trip_rows,
+                'stop_time_updates': stop_rows
+            }, chunk_size)
+            cls._insert_partitioned('vehicle_positions', {'vehicle_positions': vehicle_rows}, chunk_size)
+            db.session.commit()
+            id_resolver.commit()
+        except Exception:
+            db.session.rollback()
+            id_resolver.rollback()
+            raise
+
+        if changes is not None:
+            changes.apply()
+        return {
+            'trip_updates': len(trip_rows),
+            'stop_time_updates': len(stop_rows),
+            'vehicle_positions': len(vehicle_rows),
+            'unchanged': changes.unchanged if changes is not None else 0,
+            'ended': len(ended_trips) + len(ended_vehicles)
+        }
 
     @staticmethod
     def import_service_alert(feed, agency_id):
@@ -0,0 +1,101 @@
+"""
+Codes of the interned string ids of the realtime tables
+
+The columns typed InternedString hold codes of interned_ids instead of the
+strings themselves. Readers never see the codes (the type translates in
+SQL); the importer turns the strings of every row into codes before the
+bulk insert, through the resolver below. It keeps the codes it has
+resolved in memory, so a poll cycle looks up only the ids that are new
+since the last one. Codes created in a transaction are cached once it is
+committed, a rolled back transaction leaves the cache as it was.
+"""
+import logging
+import threading
+from typing import Any, Dict, Iterable, List
+from backend import db
+from backend.config.settings import INTERNED_ID_CACHE_SIZE
+from backend.models import InternedString
+
+# SQLite host parameters per statement
+_CHUNK = 500
+
+def interned_columns(table_name: str) -> List[str]:
+    """get the names of the InternedString columns of a model table"""
+    return [
+        column.name for column in db.metadata.tables[table_name].columns
+        if isinstance(column.type, InternedString)
+    ]
+
+class IdResolver:
+    """Resolve string ids to their interned codes, creating missing ones"""
+
+    def __init__(self, cache_size: int = INTERNED_ID_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._codes: Dict[str, Dict[str, int]] = {}  # database URL -> id -> code, committed
+        self._pending: Dict[str, Dict[str, int]] = {}  # database URL -> id -> code, current transaction
+        self._stats = {'hits': 0, 'misses': 0, 'cleared': 0}
+
+    def resolve(self, values: Iterable[str]) -> Dict[str, int]:
+        """
+        Get the codes of string ids in the current transaction
+
+        Returns:
+            dict: id -> code for every id that is not None
+        """
+        url = str(db.engine.url)
+        with self._lock:
+            codes = self._codes.setdefault(url, {})
+            pending = self._pending.setdefault(url, {})
+            wanted = {value for value in values if value is not None}
+            missing = [value for value in wanted if value not in codes and value not in pending]
+            self._stats['hits'] += len(wanted) - len(missing)
+            self._stats['misses'] += len(missing)
+            if missing:
+                connection = db.session.connection()
+                connection.exec_driver_sql(
+                    "INSERT OR IGNORE INTO interned_ids (value) VALUES (?)", [(value,) for value in missing]
+                )
+                for start in range(0, len(missing), _CHUNK):
+                    chunk = missing[start:start + _CHUNK]
+                    pending.update(connection.exec_driver_sql(
+                        f"SELECT value, id FROM interned_ids WHERE value IN ({', '.join('?' * len(chunk))})",
+                        tuple(chunk)
+                    ).fetchall())
+            return {value: codes.get(value) or pending[value] for value in wanted}
+
+    def encode_rows(self, table_name: str, rows: List[Dict[str, Any]]) -> None:
+        """replace the string ids of rows of a realtime table by their codes, in place"""
+        columns = interned_columns(table_name)
+        if not rows or not columns:
+            return
+        codes = self.resolve(row[column] for row in rows for column in columns)
+        for row in rows:
+            for column in columns:
+                value = row[column]
+                if value is not None:
+                    row[column] = codes[value]
+
+    def commit(self) -> None:
+        """cache the codes created in the transaction just committed"""
+        url = str(db.engine.url)
+        with self._lock:
+            codes = self._codes.setdefault(url, {})
+            codes.update(self._pending.pop(url, {}))
+            if len(codes) > self.cache_size:
+                # trip ids keep coming, older ones are rarely seen again
+                codes.clear()
+                self._stats['cleared'] += 1
+
+    def rollback(self) -> None:
+        """forget the codes created in the transaction just rolled back"""
+        with self._lock:
+            self._pending.pop(str(db.engine.url), None)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get cache hits and misses and the number of cached ids"""
+        with self._lock:
+            return dict(self._stats, cached=sum(len(codes) for codes in self._codes.values()))
+
+id_resolver = IdResolver()
@@ -0,0 +1,385 @@
+"""
+Server-sent event stream of the live state
+
+Clients of /api/stream get a snapshot of the live state when they connect
+(vehicles, trips, upcoming arrivals and active alerts), then after
+every collector cycle a delta holding only what changed. A client may
+subscribe to routes and stops; without a subscription it gets everything.
+The changes of a generation are computed once, and each event is
+serialized once per distinct subscription, however many clients share it.
+
+One thread serves every connection through non-blocking sockets, so open
+streams don't hold the workers of the request pool. A client reading more
+slowly than updates arrive (more than STREAM_MAX_BUFFER bytes waiting behind
+the event it is reading) has its waiting deltas dropped, and once it has
+read that event it gets a fresh snapshot instead. A client that reads nothing for
+STREAM_CLIENT_TIMEOUT seconds is disconnected.
+"""
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs
+from backend.config.settings import (
+    LIVE_STATE_CHECK_INTERVAL, STREAM_MAX_CLIENTS, STREAM_MAX_BUFFER, STREAM_CLIENT_TIMEOUT,
+    STREAM_KEEPALIVE_INTERVAL
+)
+from backend.services.data.live_state import LiveSnapshot, current_snapshot
+from backend.services.data.query import DataQuery
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE = b': keepalive\n\n'
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def format_event(event: str, generation: int, data: Dict[str, Any]) -> bytes:
+    return (
+        f"id: {generation}\nevent: {event}\ndata: "
+        f"{json.dumps(data, default=_json_default, separators=(',', ':'))}\n\n"
+    ).encode()
+
+class _Entry(NamedTuple):
+    """an entity of a view: what subscriptions filter it by, what it is compared by and its event form"""
+    route_id: Optional[str]
+    stop_id: Optional[str]
+    content: Tuple
+    item: Dict[str, Any]
+
+class LiveView:
+    """What the stream shows of one snapshot: vehicles, trips, arrivals and alerts by id, in their event form"""
+    KINDS = ('vehicles', 'trips', 'arrivals', 'alerts')
+
+    def __init__(self, snapshot: LiveSnapshot, alerts: List[Any]):
+        self.generation = snapshot.generation
+        now = datetime.now()
+        self.vehicles: Dict[str, _Entry] = {}
+        self.trips: Dict[str, _Entry] = {}
+        self.arrivals: Dict[str, _Entry] = {}
+        for feed in snapshot.fresh_feeds():
+            for key, vehicle in feed.vehicles.items():
+                item = dict(vehicle.to_dict(), id=f"{feed.agency_id}:{key}")
+                # every poll renews the feed timestamp, it is no change of the vehicle
+                self.vehicles[item['id']] = _Entry(vehicle.route_id, None, vehicle[:-3], item)
+            for (trip_id, start_date), trip in feed.trips.items():
+                trip_id = f"{feed.agency_id}:{trip_id}:{start_date}"
+                self.trips[trip_id] = _Entry(trip.route_id, None, trip[:6], dict(trip.to_dict(), id=trip_id))
+                # a delay of the trip changes its upcoming arrivals, not the other trips'
+                for arrival in trip.stop_time_updates:
+                    if arrival.time is None or arrival.time < now:
+                        continue
+                    item = {
+                        'id': f"{trip_id}:{arrival.stop_id}:{arrival.stop_sequence}",
+                        'stop_id': arrival.stop_id,
+                        'trip_id': arrival.trip_id,
+                        'route_id': arrival.route_id,
+                        'stop_sequence': arrival.stop_sequence,
+                        'arrival_time': arrival.arrival_time,
+                        'departure_time': arrival.departure_time,
+                        'schedule_relationship': arrival.schedule_relationship
+                    }
+                    self.arrivals[item['id']] = _Entry(arrival.route_id, arrival.stop_id, arrival, item)
+        self.alerts: Dict[str, _Entry] = {}
+        for alert in alerts:
+            item = alert.to_dict()
+            del item['created_at'], item['updated_at']
+            item['id'] = str(item['id'])
+            self.alerts[item['id']] = _Entry(item['informed_entity_id'], None, tuple(item.values()), item)
+
+def diff_views(previous: LiveView, current: LiveView) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    ids of the entities that changed between two views, computed once for all subscriptions
+
+    Returns:
+        dict: kind -> ids updated (new ones included) and ids removed
+    """
+    changes = {}
+    for kind in LiveView.KINDS:
+        before, after = getattr(previous, kind), getattr(current, kind)
+        changes[kind] = (
+            [key for key, entry in after.items() if key not in before or before[key].content != entry.content],
+            [key for key in before if key not in after]
+        )
+    return changes
+
+class Subscription(NamedTuple):
+    """The routes and stops a client follows, both empty for everything"""
+    routes: FrozenSet[str]
+    stops: FrozenSet[str]
+
+    @classmethod
+    def from_query(cls, query: str) -> 'Subscription':
+        """from a query string like route=A,C&stop=A27N"""
+        params = parse_qs(query)
+        return cls(*(
+            frozenset(value for values in params.get(name, []) for value in values.split(',') if value)
+            for name in ('route', 'stop')
+        ))
+
+    def wants(self, kind: str, entry: _Entry) -> bool:
+        """
+        vehicles and trips of the followed routes, arrivals of the followed
+        routes or at the followed stops, alerts of either and those of no
+        entity in particular (alerts carry their informed entity as route_id)
+        """
+        if not self.routes and not self.stops:
+            return True
+        if kind == 'arrivals':
+            return entry.route_id in self.routes or entry.stop_id in self.stops
+        if kind == 'alerts':
+            return entry.route_id is None or entry.route_id in self.routes or entry.route_id in self.stops
+        return entry.route_id in self.routes
+
+    def snapshot(self, view: LiveView) -> bytes:
+        """the snapshot event of a view"""
+        data = {'generation': view.generation}
+        for kind in LiveView.KINDS:
+            data[kind] = [entry.item for entry in getattr(view, kind).values() if self.wants(kind, entry)]
+        return format_event('snapshot', view.generation, data)
+
+    def delta(self, previous: LiveView, current: LiveView,
+              changes: Dict[str, Tuple[List[str], List[str]]]) -> Optional[bytes]:
+        """the delta event between two views, None if nothing followed changed"""
+        data = {}
+        for kind, (updated_keys, removed_keys) in changes.items():
+            before, after = getattr(previous, kind), getattr(current, kind)
+            updated, removed = [], []
+            for key in updated_keys:
+                if self.wants(kind, after[key]):
+                    updated.append(after[key].item)
+                elif key in before and self.wants(kind, before[key]):
+                    removed.append(key)  # moved out of the subscription
+            removed.extend(key for key in removed_keys if self.wants(kind, before[key]))
+            if updated or removed:
+                data[kind] = {'updated': updated, 'removed': removed}
+        if not data:
+            return None
+        return format_event('delta', current.generation, dict(data, generation=current.generation))
+
+class StreamClient:
+    """A connected client and the events queued for it"""
+    __slots__ = ('sock', 'subscription', 'queue', 'queued', 'offset', 'needs_snapshot', 'progress_at',
+                 'sent_at', 'writing')
+
+    def __init__(self, sock: socket.socket, subscription: Subscription):
+        self.sock = sock
+        self.subscription = subscription
+        self.queue = deque()  # events, the first one sent up to offset
+        self.queued = 0  # bytes in the queue
+        self.offset = 0
+        self.needs_snapshot = True
+        self.progress_at = self.sent_at = time.monotonic()
+        self.writing = False  # registered for writability
+
+class LiveStream:
+    """
+    Stream the live state to server-sent event clients of one serving process
+
+    The handler of a stream request sends the response headers and hands
+    its socket over with add(); the connection is then this object's.
+    """
+
+    def __init__(self, app, max_clients: int = STREAM_MAX_CLIENTS, max_buffer: int = STREAM_MAX_BUFFER,
+                 client_timeout: float = STREAM_CLIENT_TIMEOUT, keepalive_interval: float = STREAM_KEEPALIVE_INTERVAL,
+                 check_interval: float = LIVE_STATE_CHECK_INTERVAL):
+        self.app = app
+        self.max_clients = max_clients
+        self.max_buffer = max_buffer
+        self.client_timeout = client_timeout
+        self.keepalive_interval = keepalive_interval
+        self.check_interval = check_interval
+        self.view: Optional[LiveView] = None
+        self._snapshots: Dict[Subscription, bytes] = {}  # snapshot events of the current view
+        self._lock = threading.Lock()
+        self._incoming: List[StreamClient] = []
+        self._clients: Dict[socket.socket, StreamClient] = {}
+        self._selector = selectors.DefaultSelector()
+        self._wakeup, self._waker = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        self._thread: Optional[threading.Thread] = None
+        self._running = True
+        self._stats = {
+            'connected': 0,
+            'disconnected': 0,
+            'snapshots': 0,
+            'deltas': 0,
+            'bytes': 0,
+            'overflows': 0,
+            'timeouts': 0
+        }
+
+    def accepts(self) -> bool:
+        with self._lock:
+            return self._running and len(self._clients) + len(self._incoming) < self.max_clients
+
+    def add(self, sock: socket.socket, subscription: Subscription) -> bool:
+        """take over a connection whose response headers were sent, False if there is no room left"""
+        with self._lock:
+            if not self._running or len(self._clients) + len(self._incoming) >= self.max_clients:
+                return False
+            self._incoming.append(StreamClient(sock, subscription))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-stream', daemon=True)
+                self._thread.start()
+        self._waker.send(b'\0')
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            self._running = False
+            thread = self._thread
+        self._waker.send(b'\0')
+        if thread is not None:
+            thread.join()
+        for client in list(self._clients.values()) + self._incoming:
+            client.sock.close()
+        self._clients.clear()
+        self._selector.close()
+        self._wakeup.close()
+        self._waker.close()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+                incoming, self._incoming = self._incoming, []
+            for client in incoming:
+                client.sock.setblocking(False)
+                self._clients[client.sock] = client
+                self._selector.register(client.sock, selectors.EVENT_READ, client)
+                self._stats['connected'] += 1
+            try:
+                self._update()
+            except Exception as e:
+                logger.error(f"Error updating live stream: {str(e)}")
+            now = time.monotonic()
+            for client in list(self._clients.values()):
+                if client.queue and now - client.progress_at > self.client_timeout:
+                    self._stats['timeouts'] += 1
+                    self._disconnect(client)
+                elif client.needs_snapshot and not client.queue and self.view is not None:
+                    self._send_snapshot(client)
+                elif not client.queue and now - client.sent_at > self.keepalive_interval:
+                    self._send(client, KEEPALIVE)
+
+            for key, mask in self._selector.select(timeout=self.check_interval):
+                if key.fileobj is self._wakeup:
+                    try:
+                        self._wakeup.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                client = key.data
+                if client.sock not in self._clients:
+                    continue  # disconnected earlier in this round
+                if mask & selectors.EVENT_READ:
+                    # clients send nothing after their request, a read means they are gone
+                    try:
+                        if not client.sock.recv(4096):
+                            self._disconnect(client)
+                            continue
+                    except BlockingIOError:
+                        pass
+                    except OSError:
+                        self._disconnect(client)
+                        continue
+                if mask & selectors.EVENT_WRITE:
+                    self._flush(client)
+
+    def _update(self) -> None:
+        """send the deltas of a new generation of the live state"""
+        snapshot = current_snapshot()
+        if snapshot is None or (self.view is not None and snapshot.generation == self.view.generation):
+            return
+        with self.app.app_context():
+            alerts = DataQuery.get_active_alerts()
+        view = LiveView(snapshot, alerts)
+        previous, self.view = self.view, view
+        self._snapshots = {}
+        if previous is None:
+            return
+        changes = diff_views(previous, view)
+        deltas: Dict[Subscription, Optional[bytes]] = {}
+        for client in list(self._clients.values()):
+            if client.needs_snapshot:
+                continue  # it gets a snapshot of this view once it has read what it has
+            if client.subscription not in deltas:
+                deltas[client.subscription] = client.subscription.delta(previous, view, changes)
+            event = deltas[client.subscription]
+            if event is not None:
+                self._stats['deltas'] += 1
+                self._send(client, event)
+
+    def _send_snapshot(self, client: StreamClient) -> None:
+        event = self._snapshots.get(client.subscription)
+        if event is None:
+            event = self._snapshots[client.subscription] = client.subscription.snapshot(self.view)
+        client.needs_snapshot = False
+        self._stats['snapshots'] += 1
+        self._send(client, event)
+
+    def _send(self, client: StreamClient, event: bytes) -> None:
+        # the event being read may be a large snapshot, only what waits behind it counts
+        if client.queue and client.queued - len(client.queue[0]) + len(event) > self.max_buffer:
+            # too slow: drop the events waiting behind the one being read, it gets a snapshot instead
+            while len(client.queue) > 1:
+                client.queued -= len(client.queue.pop())
+            client.needs_snapshot = True
+            self._stats['overflows'] += 1
+            return
+        client.queue.append(event)
+        client.queued += len(event)
+        client.sent_at = time.monotonic()
+        self._flush(client)
+
+    def _flush(self, client: StreamClient) -> None:
+        while client.queue:
+            event = client.queue[0]
+            try:
+                sent = client.sock.send(memoryview(event)[client.offset:])
+            except BlockingIOError:
+                break
+            except OSError:
+                self._disconnect(client)
+                return
+            client.offset += sent
+            client.progress_at = time.monotonic()
+            self._stats['bytes'] += sent
+            if client.offset < len(event):
+                break
+            client.queue.popleft()
+            client.queued -= len(event)
+            client.offset = 0
+        writing = bool(client.queue)
+        if writing != client.writing:
+            client.writing = writing
+            self._selector.modify(
+                client.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0), client
+            )
+
+    def _disconnect(self, client: StreamClient) -> None:
+        if self._clients.pop(client.sock, None) is None:
+            return
+        self._selector.unregister(client.sock)
+        try:
+            client.sock.close()
+        except OSError:
+            pass
+        self._stats['disconnected'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['clients'] = len(self._clients) + len(self._incoming)
+        stats['generation'] = self.view.generation if self.view is not None else None
+        return stats
@@ -0,0 +1,332 @@
+"""
+Time partitions for the realtime tables
+
+trip_updates, stop_time_updates and vehicle_positions are stored in one
+table per REALTIME_PARTITION_HOURS hours of feed_timestamp, named
+`<table>_p<YYYYMMDDHH>` after the start of the period. The original table
+name becomes a UNION ALL view over the partitions, so the models and every
+query keep working unchanged; writes go to the partitions directly
+(RealtimeImporter). Stop time updates are stored in the partition of their
+trip update. Retention drops whole partitions. String ids are stored as
+their codes in interned_ids (InternedString columns).
+
+A database created before partitioning keeps its rows in a legacy partition
+(`<table>_p0000000000`), dropped once all of its rows have expired.
+"""
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import Column, Index, MetaData, Table, text
+from sqlalchemy.schema import CreateColumn
+from backend import db
+from backend.models import InternedString, interned_ids
+from backend.config.settings import REALTIME_PARTITION_HOURS
+
+# tables partitioned together share partition keys, the first one holds feed_timestamp
+PARTITION_GROUPS = {
+    'trip_updates': ('trip_updates', 'stop_time_updates'),
+    'vehicle_positions': ('vehicle_positions',)
+}
+PARTITIONED_TABLES = tuple(table for group in PARTITION_GROUPS.values() for table in group)
+
+LEGACY_KEY = '0000000000'
+_KEY_FORMAT = '%Y%m%d%H'
+
+class PartitionManager:
+    """Create, list and drop the partitions of the realtime tables"""
+
+    def __init__(self, hours: int = REALTIME_PARTITION_HOURS):
+        """
+        Args:
+            hours (int): hours per partition, should divide 24
+        """
+        self.hours = hours
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._metadata = MetaData()
+        self._tables: Dict[str, Table] = {}
+        self._ready = set()  # database URLs set up in this process
+        self._known: Dict[str, set] = {}  # database URL -> partition table names known to exist
+
+    # naming
+
+    def partition_key(self, timestamp: datetime) -> str:
+        """get the key of the partition holding a feed timestamp"""
+        start = timestamp.replace(minute=0, second=0, microsecond=0, hour=timestamp.hour - timestamp.hour % self.hours)
+        return start.strftime(_KEY_FORMAT)
+
+    def partition_name(self, table_name: str, key: str) -> str:
+        return f"{table_name}_p{key}"
+
+    def partition_table(self, table_name: str, key: str) -> Table:
+        """get the Table of a partition, for inserts"""
+        name = self.partition_name(table_name, key)
+        with self._lock:
+            table = self._tables.get(name)
+            if table is None:
+                model_table = db.metadata.tables[table_name]
+                columns = [
+                    # no foreign keys: the referenced table is a view; interned
+                    # ids are written as their codes
+                    Column(
+                        column.name, column.type.impl if isinstance(column.type, InternedString) else column.type,
+                        primary_key=column.primary_key,
+                        nullable=column.nullable,
+                        index=column.index,
+                        default=column.default.arg if column.default is not None else None,
+                        server_default=column.server_default
+                    )
+                    for column in model_table.columns
+                ]
+                table = Table(name, self._metadata, *columns)
+                if table_name == 'stop_time_updates':
+                    Index(f"ix_{name}_trip_update_id", table.c.trip_update_id)
+                # composite indexes of the model, renamed after the partition
+                for index in model_table.indexes:
+                    if len(index.columns) > 1:
+                        Index(index.name.replace(table_name, name, 1), *(table.c[column.name] for column in index.columns))
+                self._tables[name] = table
+            return table
+
+    # schema
+
+    def _url(self) -> str:
+        return str(db.engine.url)
+
+    def _object_names(self, kind: str) -> List[str]:
+        return [row[0] for row in db.session.execute(
+            text("SELECT name FROM sqlite_master WHERE type = :kind"), {'kind': kind}
+        )]
+
+    def partitions(self, table_name: str) -> List[str]:
+        """get the partition keys of a table, oldest first"""
+        pattern = re.compile(rf"^{table_name}_p(\d{{10}})$")
+        return sorted(
+            match.group(1)
+            for match in map(pattern.match, self._object_names('table'))
+            if match
+        )
+
+    def _rebuild_view(self, table_name: str) -> None:
+        """point the view at the current partitions, listing columns so their order does not matter"""
+        keys = self.partitions(table_name)
+        columns = ', '.join(column.name for column in db.metadata.tables[table_name].columns)
+        db.session.execute(text(f"DROP VIEW IF EXISTS {table_name}"))
+        if not keys:
+            return
+        selects = ' UNION ALL '.join(
+            f"SELECT {columns} FROM {self.partition_name(table_name, key)}" for key in keys
+        )
+        db.session.execute(text(f"CREATE VIEW {table_name} AS {selects}"))
+
+    def _add_missing_columns(self, table_name: str, key: str) -> List[str]:
+        """add the columns added to the model since the partition was created, returns their names"""
+        name = self.partition_name(table_name, key)
+        existing = {row[1] for row in db.session.execute(text(f"PRAGMA table_info({name})"))}
+        added = []
+        for column in self.partition_table(table_name, key).columns:
+            if column.name not in existing:
+                column_sql = CreateColumn(column).compile(dialect=db.engine.dialect)
+                db.session.execute(text(f"ALTER TABLE {name} ADD COLUMN {column_sql}"))
+                self.logger.info(f"Added column {name}.{column.name}")
+                added.append(column.name)
+        return added
+
+    def _add_missing_indexes(self, table_name: str, key: str) -> None:
+        connection = db.session.connection()
+        for index in self.partition_table(table_name, key).indexes:
+            index.create(connection, checkfirst=True)
+
+    def _backfill(self, table_name: str, key: str, columns: List[str]) -> None:
+        """fill denormalized columns added to an existing partition from the rows they are copied from"""
+        name = self.partition_name(table_name, key)
+        if table_name == 'stop_time_updates' and 'route_id' in columns:
+            trips = self.partition_name('trip_updates', key)
+            db.session.execute(text(
+                f"UPDATE {name} SET "
+                f"route_id = (SELECT route_id FROM {trips} WHERE {trips}.id = {name}.trip_update_id), "
+                f"agency_id = (SELECT agency_id FROM {trips} WHERE {trips}.id = {name}.trip_update_id)"
+            ))
+        elif table_name == 'vehicle_positions' and 'route_id' in columns:
+            # realtime trip ids first, they differ from the static ones on the subway
+            db.session.execute(text(
+                f"UPDATE {name} SET route_id = coalesce("
+                f"(SELECT route_id FROM trip_updates WHERE trip_updates.trip_id = {name}.trip_id LIMIT 1), "
+                f"(SELECT route_id FROM trips WHERE trips.trip_id = {name}.trip_id)"
+                f") WHERE trip_id IS NOT NULL"
+            ))
+        else:
+            return
+        self.logger.info(f"Filled {', '.join(columns)} of {name}")
+
+    def _intern_partition(self, table_name: str, key: str) -> None:
+        """rewrite a partition that still holds string ids with their interned codes"""
+        name = self.partition_name(table_name, key)
+        columns = {row[1]: row[2] for row in db.session.execute(text(f"PRAGMA table_info({name})"))}
+        interned = [
+            column.name for column in db.metadata.tables[table_name].columns
+            if isinstance(column.type, InternedString)
+        ]
+        if columns.get(interned[0], 'INTEGER').upper() == 'INTEGER':
+            return
+        for column in interned:
+            db.session.execute(text(
+                f"INSERT OR IGNORE INTO interned_ids (value) SELECT DISTINCT {column} FROM {name} "
+                f"WHERE {column} IS NOT NULL"
+            ))
+        for index in [row[1] for row in db.session.execute(text(f"PRAGMA index_list({name})")) if row[3] == 'c']:
+            db.session.execute(text(f"DROP INDEX {index}"))
+        db.session.execute(text(f"ALTER TABLE {name} RENAME TO {name}__strings"))
+        self.partition_table(table_name, key).create(db.session.connection())
+        selects = ', '.join(
+            f"(SELECT id FROM interned_ids WHERE value = {column})" if column in interned else column
+            for column in columns
+        )
+        db.session.execute(text(
+            f"INSERT INTO {name} ({', '.join(columns)}) SELECT {selects} FROM {name}__strings"
+        ))
+        db.session.execute(text(f"DROP TABLE {name}__strings"))
+        self.logger.info(f"Interned the string ids of {name}")
+
+    def setup(self) -> None:
+        """
+        Turn the realtime tables into views over partitions, once per process
+
+        Plain tables left by db.create_all() or an older version are renamed to
+        the legacy partition (or dropped when empty); every partition gets the
+        columns added to the model since it was created.
+        """
+        url = self._url()
+        if url in self._ready:
+            return
+        with self._lock:
+            if url in self._ready:
+                return
+            tables = set(self._object_names('table'))
+            for table_name in PARTITIONED_TABLES:
+                if table_name in tables:
+                    has_rows = db.session.execute(text(f"SELECT 1 FROM {table_name} LIMIT 1")).first()
+                    if has_rows:
+                        legacy = self.partition_name(table_name, LEGACY_KEY)
+                        db.session.execute(text(f"ALTER TABLE {table_name} RENAME TO {legacy}"))
+                        self.logger.info(f"Moved existing {table_name} rows to partition {legacy}")
+                    else:
+                        db.session.execute(text(f"DROP TABLE {table_name}"))
+            # every group keeps at least one partition so the views always exist, and
+            # the tables of a group share their keys (an empty legacy table was dropped)
+            connection = db.session.connection()
+            interned_ids.create(connection, checkfirst=True)
+            for group, table_names in PARTITION_GROUPS.items():
+                keys = self.partitions(table_names[0]) or [self.partition_key(datetime.now())]
+                for table_name in table_names:
+                    for key in keys:
+                        self.partition_table(table_name, key).create(connection, checkfirst=True)
+            # partitions are migrated in group order, so a trip_updates view is
+            # complete before vehicle positions are filled from it
+            for table_name in PARTITIONED_TABLES:
+                for key in self.partitions(table_name):
+                    added = self._add_missing_columns(table_name, key)
+                    if added:
+                        self._backfill(table_name, key, added)
+            # partitions written before the ids were interned are rewritten, without
+            # the views that would follow their renaming
+            for table_name in PARTITIONED_TABLES:
+                db.session.execute(text(f"DROP VIEW IF EXISTS {table_name}"))
+            for table_name in PARTITIONED_TABLES:
+                for key in self.partitions(table_name):
+                    self._intern_partition(table_name, key)
+                    self._add_missing_indexes(table_name, key)
+                self._rebuild_view(table_name)
+            db.session.commit()
+            self._known[url] = set(self._object_names('table'))
+            self._ready.add(url)
+
+    def ensure_partition(self, group: str, key: str) -> Dict[str, Table]:
+        """
+        create the partitions of a group for a key if they don't exist yet
+
+        Returns:
+            dict: table name -> partition Table
+        """
+        self.setup()
+        url = self._url()
+        tables = {table_name: self.partition_table(table_name, key) for table_name in PARTITION_GROUPS[group]}
+        with self._lock:
+            known = self._known.setdefault(url, set())
+            missing = [table for table in tables.values() if table.name not in known]
+            if missing:
+                connection = db.session.connection()
+                for table in missing:
+                    table.create(connection, checkfirst=True)
+                    known.add(table.name)
+                for table_name in PARTITION_GROUPS[group]:
+                    self._rebuild_view(table_name)
+                self.logger.info(f"Created {group} partition {key}")
+        return tables
+
+    def next_id(self, table_name: str) -> int:
+        """
+        get the first free id of a partitioned table
+
+        Ids are unique across partitions and assigned by the writer; max(id)
+        of every partition is a primary key lookup.
+        """
+        self.setup()
+        keys = self.partitions(table_name)
+        if not keys:
+            return 1
+        maxima = ' UNION ALL '.join(
+            f"SELECT max(id) AS id FROM {self.partition_name(table_name, key)}" for key in keys
+        )
+        return (db.session.execute(text(f"SELECT max(id) FROM ({maxima})")).scalar() or 0) + 1
+
+    # retention
+
+    def _partition_end(self, group: str, key: str) -> Optional[datetime]:
+        """get the time after which a partition holds no rows"""
+        if key == LEGACY_KEY:
+            leading = self.partition_name(PARTITION_GROUPS[group][0], key)
+            latest = db.session.execute(text(f"SELECT max(feed_timestamp) FROM {leading}")).scalar()
+            if latest is None:
+                return datetime.min
+            # SQLite hands back DATETIME values of raw SQL as text
+            return datetime.fromisoformat(latest) if isinstance(latest, str) else latest
+        return datetime.strptime(key, _KEY_FORMAT) + timedelta(hours=self.hours)
+
+    def drop_before(self, group: str, cutoff: datetime) -> int:
+        """
+        Drop the partitions of a group whose rows are all older than cutoff
+
+        The newest partition is always kept so the views never go away.
+
+        Returns:
+            int: number of partition keys dropped
+        """
+        self.setup()
+        with self._lock:
+            keys = self.partitions(PARTITION_GROUPS[group][0])
+            expired = [
+                key for key in keys[:-1]
+                if self._partition_end(group, key) <= cutoff
+            ]
+            if not expired:
+                return 0
+            known = self._known.setdefault(self._url(), set())
+            for table_name in PARTITION_GROUPS[group]:
+                for key in expired:
+                    name = self.partition_name(table_name, key)
+                    db.session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                    known.discard(name)
+                self._rebuild_view(table_name)
+            db.session.commit()
+            self.logger.info(f"Dropped {len(expired)} {group} partitions older than {cutoff}")
+            return len(expired)
+
+    def get_stats(self) -> Dict[str, List[str]]:
+        """Get the partition keys of every partitioned table"""
+        self.setup()
+        return {table_name: self.partitions(table_name) for table_name in PARTITIONED_TABLES}
+
+partition_manager = PartitionManager()
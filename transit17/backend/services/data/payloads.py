@@ -0,0 +1,152 @@
+"""
+Materialized API payloads
+
+Dashboard documents such as /api/status only change when the collector
+publishes a new live state generation, yet every poll of every viewer used
+to rebuild them. PayloadCache builds a payload once per generation (and at
+least every PAYLOAD_MAX_AGE seconds, since its time windows move, or when
+there is no live state to follow): it is serialized once, gzipped once and
+gets a strong ETag, the hash of its body. Requests in between only pick the
+stored bytes, so their cost does not grow with the number of viewers.
+"""
+import gzip
+import json
+import threading
+import time
+from hashlib import blake2b
+from typing import Any, Callable, Dict, Optional
+from backend.config.settings import PAYLOAD_MAX_AGE, PAYLOAD_GZIP_LEVEL
+from backend.services.data.live_state import current_snapshot
+
+class MaterializedPayload:
+    """A serialized payload with its gzipped body and the ETags of both"""
+    __slots__ = ('generation', 'built_at', 'body', 'gzip_body', 'etag', 'gzip_etag')
+
+    def __init__(self, data: Any, generation: Optional[int], built_at: float):
+        self.generation = generation
+        self.built_at = built_at
+        self.body = json.dumps(data).encode()
+        # mtime=0: equal bodies give equal gzip bodies
+        self.gzip_body = gzip.compress(self.body, compresslevel=PAYLOAD_GZIP_LEVEL, mtime=0)
+        digest = blake2b(self.body, digest_size=16).hexdigest()
+        # strong ETags differ between content codings
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """whether an If-None-Match header names either representation of this payload"""
+        if not if_none_match:
+            return False
+        tags = {tag.strip() for tag in if_none_match.split(',')}
+        return '*' in tags or self.etag in tags or self.gzip_etag in tags
+
+class _PendingBuild:
+    """a build in progress that other callers can wait on"""
+    __slots__ = ('event', 'payload', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.payload = None
+        self.error = None
+
+class PayloadCache:
+    """
+    Payloads by name, built at most once per live state generation
+
+    The first caller that finds a payload out of date builds it, in its own
+    request; concurrent callers get the previous payload meanwhile, or wait
+    for the build if there is none yet.
+    """
+
+    def __init__(self, max_age: float = PAYLOAD_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._payloads: Dict[str, MaterializedPayload] = {}
+        self._pending: Dict[str, _PendingBuild] = {}
+        self._stats = {
+            'hits': 0,
+            'builds': 0,
+            'served_previous': 0,
+            'coalesced': 0,
+            'errors': 0
+        }
+
+    def get(self, name: str, build: Callable[[], Any]) -> MaterializedPayload:
+        """
+        get the current payload of name, calling build() if it is out of date
+
+        Args:
+            name (str): payload name, e.g. the URL path
+            build (callable): returns the data of the payload, JSON-serializable
+
+        Returns:
+            MaterializedPayload
+
+        Raises:
+            whatever build() raised, in the building caller and in callers waiting for it
+        """
+        snapshot = current_snapshot()
+        generation = snapshot.generation if snapshot is not None else None
+        now = time.monotonic()
+        with self._lock:
+            payload = self._payloads.get(name)
+            if payload is not None and payload.generation == generation and now - payload.built_at < self.max_age:
+                self._stats['hits'] += 1
+                return payload
+
+            pending = self._pending.get(name)
+            if pending is not None:
+                if payload is not None:
+                    self._stats['served_previous'] += 1
+                    return payload
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                self._stats['builds'] += 1
+                pending = self._pending[name] = _PendingBuild()
+                leader = True
+
+        if not leader:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.payload
+
+        try:
+            pending.payload = MaterializedPayload(build(), generation, now)
+            with self._lock:
+                self._payloads[name] = pending.payload
+            return pending.payload
+        except Exception as e:
+            pending.error = e
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(name, None)
+            pending.event.set()
+
+    def invalidate(self, name: Optional[str] = None):
+        """drop one payload, or every payload"""
+        with self._lock:
+            if name is None:
+                self._payloads.clear()
+            else:
+                self._payloads.pop(name, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """get build/hit counters and the generation, age and sizes of every payload"""
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['payloads'] = {
+                name: {
+                    'generation': payload.generation,
+                    'age': round(now - payload.built_at, 3),
+                    'bytes': len(payload.body),
+                    'gzip_bytes': len(payload.gzip_body)
+                }
+                for name, payload in self._payloads.items()
+            }
+            return stats
@@ -1,10 +1,39 @@
-from datetime import datetime, timedelta
-from sqlalchemy import desc
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, desc, func
 from backend import db
 from backend.models import (
     Route, Stop, Trip, StopTime,
     TripUpdate, StopTimeUpdate, VehiclePosition, ServiceAlert
 )
+from backend.services.data.live_state import current_snapshot
+
+def service_day_start(service_date: date) -> datetime:
+    """
+    get the time GTFS schedule times of a service day count from: noon minus
+    12 hours, local time, which is midnight except on daylight saving changes
+    """
+    noon = time.mktime((service_date.year, service_date.month, service_date.day, 12, 0, 0, 0, 0, -1))
+    return datetime.fromtimestamp(noon - 12 * 3600)
+
+def current_versions(model, *key_columns):
+    """
+    ids of the current version of every entity of a change-captured table:
+    an entity is only written when it changes, so its latest row is its
+    state, unless that row is an end marker (as DataQuery.get_trip_updates_at)
+    """
+    latest = db.session.query(func.max(model.id)).group_by(*key_columns)
+    return db.session.query(model.id).filter(model.id.in_(latest), model.end_marker.is_(False))
+
+def current_vehicles():
+    """current_versions of the vehicles, keyed like changes.vehicle_key: by trip when the vehicle id is empty"""
+    return current_versions(VehiclePosition, case(
+        (VehiclePosition.vehicle_id == '', VehiclePosition.trip_id), else_=VehiclePosition.vehicle_id
+    ))
+
+def current_trip_updates():
+    """current_versions of the trips, keyed like changes.trip_key"""
+    return current_versions(TripUpdate, TripUpdate.trip_id, TripUpdate.start_date)
 
 class DataQuery:
     """Query data from database"""
@@ -31,20 +60,64 @@ class DataQuery:
 
     @staticmethod
     def get_latest_trip_updates(route_id=None, limit=10):
-        """Get latest trip updates"""
-        query = TripUpdate.query.order_by(desc(TripUpdate.feed_timestamp))
+        """
+        Get latest trip updates: the current trips of the collector's live
+        state (LiveTripUpdate), the current versions in the database if
+        there is none
+        """
+        live = current_snapshot()
+        if live is not None:
+            return live.trip_updates(route_id, limit=limit)
+        query = TripUpdate.query.filter(TripUpdate.id.in_(current_trip_updates())).order_by(
+            desc(TripUpdate.feed_timestamp))
         if route_id:
             query = query.filter_by(route_id=route_id)
         return query.limit(limit).all()
 
     @staticmethod
     def get_latest_vehicle_positions(route_id=None, limit=10):
-        """Get latest vehicle positions"""
-        query = VehiclePosition.query.order_by(desc(VehiclePosition.feed_timestamp))
+        """
+        Get latest vehicle positions: the current vehicles of the collector's
+        live state (LiveVehiclePosition), the current versions in the
+        database if there is none
+        """
+        live = current_snapshot()
+        if live is not None:
+            return live.vehicle_positions(route_id, limit=limit)
+        query = VehiclePosition.query.filter(VehiclePosition.id.in_(current_vehicles())).order_by(
+            desc(VehiclePosition.feed_timestamp))
         if route_id:
             query = query.filter_by(route_id=route_id)
         return query.limit(limit).all()
 
+    @staticmethod
+    def get_trip_updates_at(timestamp, route_id=None):
+        """
+        Get the trip updates in effect at a point in time
+
+        With change capture a trip is only written when it changes, so its
+        state at a time is its latest version up to then, unless that is an
+        end marker.
+        """
+        latest = db.session.query(func.max(TripUpdate.id)).filter(
+            TripUpdate.feed_timestamp <= timestamp
+        )
+        if route_id:
+            latest = latest.filter(TripUpdate.route_id == route_id)
+        latest = latest.group_by(TripUpdate.trip_id, TripUpdate.start_date)
+        return TripUpdate.query.filter(
+            TripUpdate.id.in_(latest),
+            TripUpdate.end_marker.is_(False)
+        ).all()
+
+    @staticmethod
+    def get_trip_update_history(trip_id, start_date=None):
+        """Get every stored version of a trip, end markers included, oldest first"""
+        query = TripUpdate.query.filter_by(trip_id=trip_id)
+        if start_date:
+            query = query.filter_by(start_date=start_date)
+        return query.order_by(TripUpdate.feed_timestamp, TripUpdate.id).all()
+
     @staticmethod
     def get_active_alerts(route_id=None):
         """Get active service alerts"""
@@ -60,11 +133,17 @@ class DataQuery:
     @staticmethod
     def get_route_status(route_id):
         """Get current status of a route"""
-        # Get latest trip updates
-        trip_updates = DataQuery.get_latest_trip_updates(route_id, limit=1)
-        
-        # Get latest vehicle positions
-        vehicle_positions = DataQuery.get_latest_vehicle_positions(route_id, limit=1)
+        live = current_snapshot()
+        if live is not None:
+            # trips and vehicles of the same poll cycle
+            trip_updates = live.trip_updates(route_id, limit=1)
+            vehicle_positions = live.vehicle_positions(route_id, limit=1)
+        else:
+            # Get latest trip updates
+            trip_updates = DataQuery.get_latest_trip_updates(route_id, limit=1)
+
+            # Get latest vehicle positions
+            vehicle_positions = DataQuery.get_latest_vehicle_positions(route_id, limit=1)
         
         # Get active alerts
         alerts = DataQuery.get_active_alerts(route_id)
@@ -75,6 +154,42 @@ class DataQuery:
             'alerts': [alert.to_dict() for alert in alerts]
         }
 
+    @staticmethod
+    def get_next_departures(stop_id, at=None, limit=5):
+        """
+        Get the next scheduled departures at a stop
+
+        A trip of a service day may run past midnight (times past 24:00:00),
+        so the departures at a time come from yesterday's, today's and
+        tomorrow's service days; each is one range scan of the
+        (stop_id, departure_seconds) index. Service calendars are not
+        imported, trips of every service id are included.
+
+        Args:
+            stop_id (str): GTFS stop id
+            at (datetime): local time, defaults to now
+            limit (int): number of departures
+
+        Returns:
+            list: (departure time, service date, StopTime), soonest first
+        """
+        at = at or datetime.now()
+        departures = []
+        for days in (-1, 0, 1):
+            service_date = at.date() + timedelta(days=days)
+            start = service_day_start(service_date)
+            seconds = int((at - start).total_seconds())
+            stop_times = StopTime.query.join(Trip).filter(
+                StopTime.stop_id == stop_id,
+                StopTime.departure_seconds >= seconds
+            ).order_by(StopTime.departure_seconds).limit(limit).all()
+            departures.extend(
+                (start + timedelta(seconds=stop_time.departure_seconds), service_date, stop_time)
+                for stop_time in stop_times
+            )
+        departures.sort(key=lambda departure: departure[0])
+        return departures[:limit]
+
     @staticmethod
     def get_stop_info(stop_id):
         """Get information about a stop"""
@@ -83,17 +198,16 @@ class DataQuery:
             return None
             
         # Get upcoming trips
-        now = datetime.utcnow()
-        upcoming_stop_times = StopTime.query.join(Trip).filter(
-            StopTime.stop_id == stop_id,
-            StopTime.departure_time > now.strftime('%H:%M:%S')
-        ).order_by(StopTime.departure_time).limit(5).all()
+        departures = DataQuery.get_next_departures(stop_id, limit=5)
         
         # Get active alerts
         alerts = DataQuery.get_active_alerts()
         
         return {
             'stop': stop.to_dict(),
-            'upcoming_trips': [stop_time.to_dict() for stop_time in upcoming_stop_times],
+            'upcoming_trips': [
+                dict(stop_time.to_dict(), departure=departure.isoformat(), service_date=service_date.strftime('%Y%m%d'))
+                for departure, service_date, stop_time in departures
+            ],
             'alerts': [alert.to_dict() for alert in alerts]
         } 
\ No newline at end of file
@@ -1,28 +1,41 @@
 import schedule
 import time
 from datetime import datetime
+from backend import create_app
 from backend.services.data.cleanup import DataCleanup
 from backend.config.settings import StorageConfig
 
 class DataScheduler:
     """Schedule data cleanup tasks"""
     
+    app = None
+    
+    @staticmethod
+    def _run_in_context(task):
+        """cleanup tasks use the database, run them inside an app context"""
+        if DataScheduler.app is None:
+            DataScheduler.app = create_app()
+        with DataScheduler.app.app_context():
+            task()
+    
     @staticmethod
     def schedule_cleanup():
         """Schedule all cleanup tasks"""
+        interval = StorageConfig.CLEANUP_INTERVAL
+        
         # Schedule trip updates cleanup
-        schedule.every(StorageConfig.TRIP_UPDATES.cleanup_interval).minutes.do(
-            DataCleanup.cleanup_trip_updates
+        schedule.every(interval).minutes.do(
+            DataScheduler._run_in_context, DataCleanup.cleanup_trip_updates
         )
         
         # Schedule vehicle positions cleanup
-        schedule.every(StorageConfig.VEHICLE_POSITIONS.cleanup_interval).minutes.do(
-            DataCleanup.cleanup_vehicle_positions
+        schedule.every(interval).minutes.do(
+            DataScheduler._run_in_context, DataCleanup.cleanup_vehicle_positions
         )
         
         # Schedule service alerts cleanup
-        schedule.every(StorageConfig.ALERTS.cleanup_interval).minutes.do(
-            DataCleanup.cleanup_service_alerts
+        schedule.every(interval).minutes.do(
+            DataScheduler._run_in_context, DataCleanup.cleanup_service_alerts
         )
         
         print(f"Cleanup tasks scheduled at {datetime.now()}")
@@ -0,0 +1,78 @@
+"""
+SQLite connection setup for the storage modes of SQLITE_STORAGE_MODE
+
+In 'wal' mode the database runs in write-ahead-log mode, so the collector,
+the cleanup scheduler and the serving processes no longer block each other:
+readers see the last committed state while a write is in progress. Writing
+processes get a single pooled connection, so writes of one process are
+serialized instead of fighting over the lock; serving processes get a pool of
+read-only connections. Every connection gets SQLITE_PRAGMAS.
+"""
+import logging
+import os
+import sqlite3
+from typing import Any, Dict, Optional
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from backend.config.settings import SQLITE_PRAGMAS, SQLITE_READER_POOL_SIZE, SQLITE_STORAGE_MODE
+
+logger = logging.getLogger(__name__)
+
+def sqlite_path(uri: str) -> Optional[str]:
+    """get the file of a SQLite database URI, None for other databases and in-memory ones"""
+    url = make_url(uri)
+    if url.drivername != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
+def enable_wal(path: str) -> str:
+    """switch a database file to WAL mode, creating it if missing; the mode is stored in the file"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000)
+    try:
+        return connection.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        connection.close()
+
+def _connect(path: str, readonly: bool) -> sqlite3.Connection:
+    if readonly:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        connection = sqlite3.connect(path, check_same_thread=False)
+    for name, value in SQLITE_PRAGMAS.items():
+        if readonly and name in ('synchronous', 'journal_size_limit'):
+            continue  # writer settings, a read-only connection cannot set them
+        connection.execute(f"PRAGMA {name}={value}")
+    if readonly:
+        connection.execute("PRAGMA query_only=ON")
+    return connection
+
+def engine_options(uri: str, readonly: bool = False, mode: str = SQLITE_STORAGE_MODE) -> Dict[str, Any]:
+    """
+    Get SQLALCHEMY_ENGINE_OPTIONS for a storage mode
+
+    Args:
+        uri (str): database URI
+        readonly (bool): serving process, connections are opened read-only
+        mode (str): 'wal' or 'rollback'
+
+    Returns:
+        dict: engine options, empty when the defaults apply
+    """
+    if mode not in ('wal', 'rollback'):
+        raise ValueError(f"Unknown SQLite storage mode: {mode}")
+    path = sqlite_path(uri)
+    if mode != 'wal' or path is None:
+        return {}
+
+    path = os.path.abspath(path)
+    journal_mode = enable_wal(path)
+    if journal_mode != 'wal':
+        logger.warning(f"Could not enable WAL mode for {path}, journal mode is {journal_mode}")
+    return {
+        'creator': lambda: _connect(path, readonly),
+        'poolclass': QueuePool,
+        'pool_size': SQLITE_READER_POOL_SIZE if readonly else 1,
+        'max_overflow': 0,
+        'pool_timeout': 30
+    }
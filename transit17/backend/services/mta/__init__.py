@@ -1,12 +1,16 @@
+import threading
 from .subway import SubwayService
 from .lirr import LIRRService
 from .mnr import MNRService
 
 class MTAServiceFactory:
-    """MTA service factory class"""
+    """MTA service factory class, service instances are created once and reused"""
     
-    @staticmethod
-    def get_service(service_type):
+    _instances = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def get_service(cls, service_type):
         """
         get specified type of MTA service
         
@@ -25,17 +29,25 @@ class MTAServiceFactory:
             'mnr': MNRService
         }
         
-        service_class = services.get(service_type.lower())
+        service_type = service_type.lower()
+        service_class = services.get(service_type)
         if not service_class:
             raise ValueError(f"Invalid service type: {service_type}")
             
-        return service_class()
+        service = cls._instances.get(service_type)
+        if service is None:
+            with cls._lock:
+                service = cls._instances.get(service_type)
+                if service is None:
+                    service = cls._instances[service_type] = service_class()
+                    
+        return service
         
-    @staticmethod
-    def get_all_services():
+    @classmethod
+    def get_all_services(cls):
         """get all available MTA services"""
         return {
-            'subway': SubwayService(),
-            'lirr': LIRRService(),
-            'mnr': MNRService()
+            'subway': cls.get_service('subway'),
+            'lirr': cls.get_service('lirr'),
+            'mnr': cls.get_service('mnr')
         } 
\ No newline at end of file
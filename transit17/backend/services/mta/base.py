@@ -1,18 +1,30 @@
+import math
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from google.transit import gtfs_realtime_pb2
 from backend.config.mta_endpoints import get_feed_url
+from backend.config.settings import FEED_FETCH_CONCURRENCY, FEED_FETCH_TIMEOUT
+from backend.services.mta.session import get_session, DEFAULT_TIMEOUT
+from backend.services.mta.feed_tracker import feed_tracker
+from backend.services.mta.cache import feed_cache
 
 class BaseMTAService:
     def __init__(self):
         self.headers = {
             "Accept": "application/json"
         }
+        # keep-alive session shared by all services
+        self.session = get_session()
         
-    def _make_request(self, url):
+    def _make_request(self, url, timeout=None, headers=None):
         """send HTTP request and handle response"""
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self.session.get(
+                url,
+                headers={**self.headers, **headers} if headers else self.headers,
+                timeout=timeout or DEFAULT_TIMEOUT
+            )
             response.raise_for_status()
             return response
         except requests.exceptions.RequestException as e:
@@ -29,6 +41,30 @@ class BaseMTAService:
             print(f"Error parsing GTFS feed: {e}")
             return None
             
+    def _peek_feed_header(self, content):
+        """parse only the FeedHeader at the front of a serialized FeedMessage"""
+        # the header is field 1 (length-delimited), serialized before any entity
+        if not content or content[0] != 0x0A:
+            return None
+            
+        length, shift, pos = 0, 0, 1
+        while True:
+            if pos >= len(content) or shift > 28:
+                return None
+            byte = content[pos]
+            pos += 1
+            length |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+            
+        try:
+            header = gtfs_realtime_pb2.FeedHeader()
+            header.ParseFromString(content[pos:pos + length])
+            return header
+        except Exception:
+            return None
+            
     def _parse_json_response(self, response):
         """parse JSON response"""
         try:
@@ -37,77 +73,256 @@ class BaseMTAService:
             print(f"Error parsing JSON response: {e}")
             return None
             
-    def get_feed(self, feed_type, feed_id, format='gtfs'):
-        """get specified type of feed data"""
-        url = get_feed_url(feed_type, feed_id)
-        response = self._make_request(url)
+    def get_feed(self, feed_type, feed_id, format='gtfs', timeout=None, skip_unchanged=False):
+        """
+        get specified type of feed data
         
+        With skip_unchanged the request is conditional (ETag / If-Modified-Since)
+        and a GTFS feed whose header timestamp has not advanced since the last
+        call is not parsed; None is returned for skipped feeds.
+        """
+        if not skip_unchanged:
+            response = self._make_request(get_feed_url(feed_type, feed_id), timeout=timeout)
+            if not response:
+                return None
+            if format == 'gtfs':
+                return self._parse_gtfs_feed(response)
+            return self._parse_json_response(response)
+            
+        feed, accept = self._get_new_feed(feed_type, feed_id, format, timeout)
+        if accept:
+            accept()
+        return feed
+
+    def _get_new_feed(self, feed_type, feed_id, format='gtfs', timeout=None):
+        """
+        conditional request of a feed, skipping it if unchanged
+        
+        Returns:
+            tuple: (feed, accept); accept() records the validators and header
+                timestamp of a new feed, after which it counts as seen and the
+                next call skips it. Both are None for skipped or failed feeds.
+        """
+        key = (feed_type, feed_id)
+        url = get_feed_url(feed_type, feed_id)
+        response = self._make_request(url, timeout=timeout, headers=feed_tracker.conditional_headers(url))
         if not response:
-            return None
+            feed_tracker.record_error(key)
+            return None, None
             
-        if format == 'gtfs':
-            return self._parse_gtfs_feed(response)
-        else:
-            return self._parse_json_response(response)
+        if response.status_code == 304:
+            feed_tracker.record_not_modified(key)
+            return None, None
+            
+        feed_tracker.record_fetched(key)
+        
+        if format != 'gtfs':
+            feed = self._parse_json_response(response)
+            return feed, lambda: feed_tracker.remember_validators(url, response)
+            
+        header = self._peek_feed_header(response.content)
+        if header is not None and not feed_tracker.is_new(key, header.timestamp):
+            feed_tracker.record_unchanged(key, len(response.content))
+            return None, None
+            
+        feed = self._parse_gtfs_feed(response)
+        if not feed:
+            feed_tracker.record_error(key)
+            return None, None
+
+        def accept():
+            feed_tracker.remember_validators(url, response)
+            feed_tracker.record_updated(key, feed.header.timestamp)
+        return feed, accept
+
+    def get_cached_feed(self, feed_type, feed_id):
+        """get feed data through the shared TTL cache"""
+        return feed_cache.get((feed_type, feed_id), lambda: self.get_feed(feed_type, feed_id))
+
+    def get_feeds(self, feed_type, feed_ids, max_workers=None, timeout=None, skip_unchanged=False, use_cache=False):
+        """
+        get several feeds of the same type concurrently
+        
+        Args:
+            feed_type (str): feed type, e.g. 'subway'
+            feed_ids (list): feed IDs to fetch
+            max_workers (int): max feeds fetched at the same time,
+                defaults to FEED_FETCH_CONCURRENCY
+            timeout (float): seconds allowed for each feed,
+                defaults to FEED_FETCH_TIMEOUT
+            skip_unchanged (bool): leave out feeds that have not changed
+                since the last call (see get_feed)
+            use_cache (bool): read the feeds through the shared TTL cache
+                
+        Returns:
+            dict: feed_id -> parsed feed, only for feeds that were fetched
+                successfully within their timeout (partial results)
+        """
+        feed_ids = list(feed_ids)
+        if not feed_ids:
+            return {}
+            
+        max_workers = max(1, min(max_workers or FEED_FETCH_CONCURRENCY, len(feed_ids)))
+        timeout = timeout or FEED_FETCH_TIMEOUT
+        
+        # feeds queued behind the concurrency limit start one "wave" later,
+        # so the overall deadline grows with the number of waves
+        deadline = timeout * math.ceil(len(feed_ids) / max_workers)
+        
+        feeds = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{feed_type}-feed")
+        try:
+            if use_cache:
+                futures = {
+                    executor.submit(self.get_cached_feed, feed_type, feed_id): feed_id
+                    for feed_id in feed_ids
+                }
+            elif skip_unchanged:
+                # feeds count as seen once returned: one finishing after the
+                # deadline is dropped and fetched in full again by the next call
+                futures = {
+                    executor.submit(self._get_new_feed, feed_type, feed_id, timeout=timeout): feed_id
+                    for feed_id in feed_ids
+                }
+            else:
+                futures = {
+                    executor.submit(self.get_feed, feed_type, feed_id, timeout=timeout): feed_id
+                    for feed_id in feed_ids
+                }
+            try:
+                for future in as_completed(futures, timeout=deadline):
+                    feed_id = futures[future]
+                    try:
+                        feed = future.result()
+                    except Exception as e:
+                        print(f"Error fetching {feed_type} feed {feed_id}: {e}")
+                        continue
+                    if skip_unchanged and not use_cache:
+                        feed, accept = feed
+                        if accept:
+                            accept()
+                    if feed:
+                        feeds[feed_id] = feed
+            except FuturesTimeoutError:
+                pending = [feed_id for future, feed_id in futures.items() if not future.done()]
+                print(f"Timed out fetching {feed_type} feeds: {', '.join(pending)}")
+        finally:
+            # never wait for a hung request, the partial result is returned as is
+            executor.shutdown(wait=False, cancel_futures=True)
+            
+        return feeds
             
     def get_timestamp(self):
         """get current timestamp"""
         return datetime.now()
 
+    def decode_feed(self, feed):
+        """decode the trip updates and vehicle positions of a feed in one pass over its entities"""
+        if not feed:
+            return [], []
+
+        timestamp = self.get_timestamp()
+        trip_updates = []
+        positions = []
+        for entity in feed.entity:
+            if entity.HasField('trip_update'):
+                trip_updates.append(self._trip_update_dict(entity.trip_update, timestamp))
+            if entity.HasField('vehicle'):
+                positions.append(self._vehicle_position_dict(entity.vehicle))
+
+        return trip_updates, positions
+
+    def build_realtime_data(self, feeds):
+        """
+        build the real-time data dict from parsed feeds
+        
+        Args:
+            feeds (dict): feed_id -> FeedMessage
+            
+        Returns:
+            dict: trip updates and vehicle positions of all feeds, each tagged
+                with its 'feed_id', plus the header timestamp of each feed under 'feeds'
+        """
+        all_trip_updates = []
+        all_vehicle_positions = []
+        feed_timestamps = {}
+        
+        for feed_id, feed in feeds.items():
+            trip_updates, vehicle_positions = self.decode_feed(feed)
+            for entity in trip_updates:
+                entity['feed_id'] = feed_id
+            for entity in vehicle_positions:
+                entity['feed_id'] = feed_id
+            all_trip_updates.extend(trip_updates)
+            all_vehicle_positions.extend(vehicle_positions)
+            feed_timestamps[feed_id] = feed.header.timestamp if feed else 0
+            
+        return {
+            'trip_updates': all_trip_updates,
+            'vehicle_positions': all_vehicle_positions,
+            'feeds': feed_timestamps,
+            'timestamp': self.get_timestamp()
+        }
+
+    def _vehicle_position_dict(self, vehicle):
+        """dict of one VehiclePosition"""
+        return {
+            'vehicle_id': vehicle.vehicle.id,
+            'trip_id': vehicle.trip.trip_id if vehicle.HasField('trip') else None,
+            'current_stop_sequence': vehicle.current_stop_sequence,
+            'current_status': vehicle.current_status,
+            'timestamp': datetime.fromtimestamp(vehicle.timestamp),
+            'position': {
+                'latitude': vehicle.position.latitude,
+                'longitude': vehicle.position.longitude,
+                'speed': vehicle.position.speed,
+                'bearing': vehicle.position.bearing
+            }
+        }
+
+    def _trip_update_dict(self, trip_update, timestamp):
+        """dict of one TripUpdate with its stop time updates"""
+        trip = trip_update.trip
+        updates = []
+        
+        # Process stop time updates
+        for stop_update in trip_update.stop_time_update:
+            updates.append({
+                'stop_id': stop_update.stop_id,
+                'arrival_time': stop_update.arrival.time if stop_update.HasField('arrival') else None,
+                'departure_time': stop_update.departure.time if stop_update.HasField('departure') else None,
+                'stop_sequence': stop_update.stop_sequence,
+                'schedule_relationship': stop_update.schedule_relationship
+            })
+            
+        return {
+            'trip_id': trip.trip_id,
+            'route_id': trip.route_id,
+            'direction_id': trip.direction_id,
+            'start_time': trip.start_time,
+            'start_date': trip.start_date,
+            'schedule_relationship': trip.schedule_relationship,
+            'stop_updates': updates,
+            'timestamp': timestamp
+        }
+
     def process_vehicle_positions(self, feed):
         """Process vehicle position data from GTFS feed"""
         if not feed:
             return []
             
-        positions = []
-        for entity in feed.entity:
-            if entity.HasField('vehicle'):
-                vehicle = entity.vehicle
-                positions.append({
-                    'vehicle_id': vehicle.vehicle.id,
-                    'trip_id': vehicle.trip.trip_id if vehicle.HasField('trip') else None,
-                    'current_stop_sequence': vehicle.current_stop_sequence,
-                    'current_status': vehicle.current_status,
-                    'timestamp': datetime.fromtimestamp(vehicle.timestamp),
-                    'position': {
-                        'latitude': vehicle.position.latitude,
-                        'longitude': vehicle.position.longitude,
-                        'speed': vehicle.position.speed,
-                        'bearing': vehicle.position.bearing
-                    }
-                })
-                
-        return positions 
+        return [
+            self._vehicle_position_dict(entity.vehicle)
+            for entity in feed.entity if entity.HasField('vehicle')
+        ]
 
     def process_trip_updates(self, feed):
         """Process trip update data from GTFS feed"""
         if not feed:
             return []
             
-        trip_updates = []
-        for entity in feed.entity:
-            if entity.HasField('trip_update'):
-                trip = entity.trip_update.trip
-                updates = []
-                
-                # Process stop time updates
-                for stop_update in entity.trip_update.stop_time_update:
-                    updates.append({
-                        'stop_id': stop_update.stop_id,
-                        'arrival_time': stop_update.arrival.time if stop_update.HasField('arrival') else None,
-                        'departure_time': stop_update.departure.time if stop_update.HasField('departure') else None,
-                        'stop_sequence': stop_update.stop_sequence
-                    })
-                    
-                trip_updates.append({
-                    'trip_id': trip.trip_id,
-                    'route_id': trip.route_id,
-                    'direction_id': trip.direction_id,
-                    'start_time': trip.start_time,
-                    'start_date': trip.start_date,
-                    'schedule_relationship': trip.schedule_relationship,
-                    'stop_updates': updates,
-                    'timestamp': self.get_timestamp()
-                })
-                
-        return trip_updates 
\ No newline at end of file
+        timestamp = self.get_timestamp()
+        return [
+            self._trip_update_dict(entity.trip_update, timestamp)
+            for entity in feed.entity if entity.HasField('trip_update')
+        ]
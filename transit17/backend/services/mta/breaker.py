@@ -0,0 +1,111 @@
+import threading
+import time
+from datetime import datetime
+from backend.config.settings import (
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, BREAKER_MAX_BACKOFF
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    """
+    Per-feed circuit breaker
+
+    Closed: requests flow; after a failure the next attempt waits an
+    exponential delay (2 ** consecutive failures seconds).
+    Open: after BREAKER_FAILURE_THRESHOLD consecutive failures no requests
+    are made until the backoff has passed; the backoff doubles every time
+    the breaker re-opens, up to BREAKER_MAX_BACKOFF.
+    Half-open: one probe request is let through; success closes the
+    breaker, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT, max_backoff=BREAKER_MAX_BACKOFF):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.consecutive_opens = 0
+        self.open_until = 0.0
+        self.retry_at = 0.0
+        self.opened_at = None
+        self.backoff_time = 0.0  # total seconds spent open, excluding the current period
+        self.failures = 0
+        self.opens = 0
+
+    def allow_request(self, now=None):
+        """check whether a request may be made now, moving open -> half-open when due"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.state == CLOSED:
+                return now >= self.retry_at
+            if self.state == OPEN and now >= self.open_until:
+                self._leave_open(now)
+                self.state = HALF_OPEN
+                return True
+            # open, or half-open with the probe still running
+            return False
+
+    def retry_delay(self, now=None):
+        """get seconds until the next attempt should be made"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.state == OPEN:
+                return max(0.0, self.open_until - now)
+            if self.state == CLOSED:
+                return max(0.0, self.retry_at - now)
+            return 0.0
+
+    def record_success(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.state == OPEN:
+                self._leave_open(now)
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.consecutive_opens = 0
+            self.retry_at = 0.0
+
+    def record_failure(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state == OPEN:
+                    self._leave_open(now)
+                backoff = min(self.max_backoff, self.reset_timeout * 2 ** self.consecutive_opens)
+                self.state = OPEN
+                self.opened_at = now
+                self.open_until = now + backoff
+                self.consecutive_opens += 1
+                self.opens += 1
+            else:
+                self.retry_at = now + min(self.max_backoff, 2 ** self.consecutive_failures)
+
+    def _leave_open(self, now):
+        if self.opened_at is not None:
+            self.backoff_time += now - self.opened_at
+            self.opened_at = None
+
+    def to_dict(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            backoff_time = self.backoff_time
+            if self.state == OPEN and self.opened_at is not None:
+                backoff_time += now - self.opened_at
+            return {
+                'feed': self.name,
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'failures': self.failures,
+                'opens': self.opens,
+                'open_until': datetime.fromtimestamp(self.open_until).isoformat() if self.state == OPEN else None,
+                'backoff_time': round(backoff_time, 3)
+            }
@@ -0,0 +1,138 @@
+import threading
+import time
+from backend.config.settings import FEED_CACHE_TTL, FEED_CACHE_STALE_TTL
+
+class _CacheEntry:
+    __slots__ = ('value', 'fetched_at', 'refreshing')
+
+    def __init__(self, value, fetched_at):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.refreshing = False
+
+class _PendingLoad:
+    """an upstream fetch in progress that other callers can wait on"""
+    __slots__ = ('event', 'value')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+class FeedCache:
+    """
+    In-process TTL cache for upstream MTA data, keyed by (feed_type, feed_id)
+
+    Concurrent misses for the same key share one upstream fetch. Once an entry
+    is older than its TTL it is still served for up to stale_ttl seconds while
+    a single background refresh runs.
+    """
+
+    def __init__(self, ttl=FEED_CACHE_TTL, stale_ttl=FEED_CACHE_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._pending = {}
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'refreshes': 0,
+            'errors': 0
+        }
+
+    def get(self, key, loader, ttl=None):
+        """
+        get a cached value, calling loader() on a miss
+
+        Args:
+            key (tuple): (feed_type, feed_id)
+            loader (callable): fetches the value upstream, returns None on failure
+            ttl (float): seconds a value is fresh, defaults to the cache TTL
+
+        Returns:
+            the cached or freshly loaded value, None if the upstream fetch failed
+        """
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if age < ttl:
+                    self._stats['hits'] += 1
+                    return entry.value
+                if age < ttl + self.stale_ttl:
+                    self._stats['stale_hits'] += 1
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        threading.Thread(
+                            target=self._refresh, args=(key, loader), daemon=True
+                        ).start()
+                    return entry.value
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                self._stats['misses'] += 1
+                pending = self._pending[key] = _PendingLoad()
+                leader = True
+
+        if not leader:
+            pending.event.wait()
+            return pending.value
+
+        try:
+            pending.value = self._load(key, loader)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.event.set()
+        return pending.value
+
+    def _load(self, key, loader):
+        """call the loader and store its result, failures are not cached"""
+        try:
+            value = loader()
+        except Exception as e:
+            print(f"Error loading {key}: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self._stats['errors'] += 1
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+            else:
+                self._entries[key] = _CacheEntry(value, time.monotonic())
+        return value
+
+    def _refresh(self, key, loader):
+        with self._lock:
+            self._stats['refreshes'] += 1
+        self._load(key, loader)
+
+    def invalidate(self, key=None):
+        """drop one key, or every key"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_stats(self):
+        """get hit/miss counters and the age of every cached key"""
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = {
+                '/'.join(map(str, key)): round(now - entry.fetched_at, 3)
+                for key, entry in self._entries.items()
+            }
+            return stats
+
+# cache shared by all MTA services in this process
+feed_cache = FeedCache()
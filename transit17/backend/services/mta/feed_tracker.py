@@ -0,0 +1,125 @@
+import threading
+from datetime import datetime
+
+class FeedTracker:
+    """
+    Remember HTTP validators and GTFS-rt header timestamps of each feed so
+    unchanged feeds can be skipped, and count how often that happens
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._validators = {}  # url -> conditional request headers
+        self._header_timestamps = {}  # (feed_type, feed_id) -> last FeedHeader.timestamp
+        self._stats = {}  # (feed_type, feed_id) -> counters
+        self._outcomes = {}  # (feed_type, feed_id) -> outcome of the latest poll
+
+    def _feed_stats(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {
+                'fetched': 0,
+                'not_modified': 0,
+                'unchanged': 0,
+                'updated': 0,
+                'errors': 0,
+                'bytes_skipped': 0,
+                'last_header_timestamp': None
+            }
+        return stats
+
+    def conditional_headers(self, url):
+        """get If-None-Match / If-Modified-Since headers for a URL"""
+        with self._lock:
+            return dict(self._validators.get(url, {}))
+
+    def remember_validators(self, url, response):
+        """store the ETag / Last-Modified of a successful response"""
+        validators = {}
+        if response.headers.get('ETag'):
+            validators['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = response.headers['Last-Modified']
+        with self._lock:
+            if validators:
+                self._validators[url] = validators
+            else:
+                self._validators.pop(url, None)
+
+    def is_new(self, key, header_timestamp):
+        """check whether a feed's header timestamp has advanced"""
+        with self._lock:
+            last = self._header_timestamps.get(key)
+        return not header_timestamp or last is None or header_timestamp > last
+
+    def last_header_timestamp(self, key):
+        """get the last header timestamp accepted for a feed"""
+        with self._lock:
+            return self._header_timestamps.get(key)
+
+    def begin_poll(self, key):
+        """forget the outcome of the previous poll of a feed"""
+        with self._lock:
+            self._outcomes.pop(key, None)
+
+    def last_outcome(self, key):
+        """
+        get the outcome of the latest poll of a feed: 'not_modified', 'unchanged',
+        'updated', 'error', or None if the poll has not finished
+        """
+        with self._lock:
+            return self._outcomes.get(key)
+
+    def record_error(self, key):
+        """the request or the parse failed"""
+        with self._lock:
+            self._feed_stats(key)['errors'] += 1
+            self._outcomes[key] = 'error'
+
+    def record_fetched(self, key):
+        with self._lock:
+            self._feed_stats(key)['fetched'] += 1
+
+    def record_not_modified(self, key):
+        """the server answered 304 Not Modified"""
+        with self._lock:
+            self._feed_stats(key)['not_modified'] += 1
+            self._outcomes[key] = 'not_modified'
+
+    def record_unchanged(self, key, size):
+        """the payload was downloaded but its header timestamp did not advance"""
+        with self._lock:
+            stats = self._feed_stats(key)
+            stats['unchanged'] += 1
+            stats['bytes_skipped'] += size
+            self._outcomes[key] = 'unchanged'
+
+    def record_updated(self, key, header_timestamp):
+        """the feed was parsed, remember its header timestamp"""
+        with self._lock:
+            stats = self._feed_stats(key)
+            stats['updated'] += 1
+            self._outcomes[key] = 'updated'
+            if header_timestamp:
+                self._header_timestamps[key] = header_timestamp
+                stats['last_header_timestamp'] = datetime.fromtimestamp(header_timestamp).isoformat()
+
+    def get_stats(self):
+        """get skip counters per feed, keyed by 'feed_type/feed_id'"""
+        with self._lock:
+            result = {}
+            for (feed_type, feed_id), stats in self._stats.items():
+                stats = dict(stats)
+                stats['skipped'] = stats['not_modified'] + stats['unchanged']
+                result[f"{feed_type}/{feed_id}"] = stats
+            return result
+
+    def reset(self):
+        """forget all validators, timestamps and counters"""
+        with self._lock:
+            self._validators.clear()
+            self._header_timestamps.clear()
+            self._stats.clear()
+            self._outcomes.clear()
+
+feed_tracker = FeedTracker()
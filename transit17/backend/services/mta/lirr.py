@@ -7,21 +7,17 @@ class LIRRService(BaseMTAService):
         super().__init__()
         self.feeds = LIRR_FEEDS
         
-    def get_feed(self):
+    def get_feed(self, feed_type='lirr', feed_id='lirr', **kwargs):
         """get LIRR GTFS real-time data"""
-        return self.get_feed('lirr')
+        return super().get_feed(feed_type, feed_id, **kwargs)
         
-    def get_realtime_data(self):
-        """get real-time data for LIRR"""
-        feed = self.get_feed()
+    def get_realtime_data(self, skip_unchanged=False, use_cache=False):
+        """get real-time data for LIRR, None if the feed has not changed (skip_unchanged)"""
+        if use_cache:
+            feed = self.get_cached_feed('lirr', 'lirr')
+        else:
+            feed = self.get_feed(skip_unchanged=skip_unchanged)
         if not feed:
             return None
             
-        trip_updates = self.process_trip_updates(feed)
-        vehicle_positions = self.process_vehicle_positions(feed)
-        
-        return {
-            'trip_updates': trip_updates,
-            'vehicle_positions': vehicle_positions,
-            'timestamp': self.get_timestamp()
-        } 
\ No newline at end of file
+        return self.build_realtime_data({'lirr': feed})
\ No newline at end of file
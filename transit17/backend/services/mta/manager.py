@@ -3,15 +3,39 @@ import logging
 from datetime import datetime
 from typing import Dict, Any
 from backend.config.settings import API_POLL_INTERVAL
+from backend.config.mta_endpoints import SUBWAY_FEEDS, LIRR_FEEDS, MNR_FEEDS
+from backend.error_handlers import MTAConnectionError
 from backend.services.mta import MTAServiceFactory
+from backend.services.mta.breaker import CircuitBreaker
+from backend.services.mta.feed_tracker import feed_tracker
+from backend.services.mta.poll_scheduler import FeedPollScheduler
+
+# realtime feeds polled by the collector, per service
+SERVICE_FEEDS = {
+    'subway': SUBWAY_FEEDS,
+    'lirr': LIRR_FEEDS,
+    'mnr': MNR_FEEDS
+}
 
 class APIManager:
     """Manage MTA API calls with rate limiting and error handling"""
     
-    def __init__(self):
+    def __init__(self, archive=None):
+        """
+        Args:
+            archive (RawFeedArchive): archive every new feed snapshot, optional
+        """
         self.last_request_time = {}  # Track last request time for each service
         self.logger = logging.getLogger(__name__)
         self.min_interval = API_POLL_INTERVAL  # Minimum time between requests
+        self.scheduler = FeedPollScheduler(
+            (service_type, feed_id)
+            for service_type, feeds in SERVICE_FEEDS.items()
+            for feed_id in feeds
+        )
+        self.breakers = {}  # circuit breaker per feed, or per service for get_data
+        self.archive = archive
+        self.unchanged_feeds = {}  # service type -> feeds polled without changes by the last get_all_data
         
     def can_make_request(self, service_type: str) -> bool:
         """Check if enough time has passed since last request"""
@@ -22,34 +46,45 @@ class APIManager:
         time_since_last_request = now - self.last_request_time[service_type]
         return time_since_last_request >= self.min_interval
     
-    def handle_error(self, error: Exception, retry_count: int) -> None:
-        """Handle API errors with exponential backoff"""
-        wait_time = min(300, 2 ** retry_count)  # Cap at 5 minutes
-        self.logger.error(f"API error: {str(error)}. Retrying in {wait_time} seconds.")
-        time.sleep(wait_time)
+    def get_breaker(self, key) -> CircuitBreaker:
+        """Get the circuit breaker of a feed key or service type"""
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            name = '/'.join(key) if isinstance(key, tuple) else key
+            breaker = self.breakers[key] = CircuitBreaker(name)
+        return breaker
+    
+    def handle_error(self, error: Exception, key) -> float:
+        """Record an API error and return seconds until the next attempt, without blocking"""
+        breaker = self.get_breaker(key)
+        breaker.record_failure()
+        wait_time = breaker.retry_delay()
+        self.logger.error(
+            f"API error for {breaker.name}: {str(error)}. "
+            f"Next attempt in {wait_time:.0f} seconds (breaker {breaker.state})."
+        )
+        return wait_time
     
     def get_data(self, service_type: str, api_call) -> Dict[str, Any]:
-        """Get data from MTA API with rate limiting and error handling"""
-        retry_count = 0
-        max_retries = 5
+        """
+        Get data from MTA API with rate limiting and a circuit breaker, without blocking
         
-        while retry_count < max_retries:
-            if not self.can_make_request(service_type):
-                time.sleep(self.min_interval)
-                continue
-                
-            try:
-                data = api_call()
-                self.last_request_time[service_type] = time.time()
-                return data
-            except Exception as e:
-                retry_count += 1
-                if retry_count == max_retries:
-                    self.logger.error(f"Max retries reached for {service_type}. Error: {str(e)}")
-                    raise
-                self.handle_error(e, retry_count)
-        
-        raise Exception(f"Failed to get data for {service_type} after {max_retries} retries")
+        Returns None while the service is rate limited or waiting for its next
+        attempt; errors are recorded on the breaker and re-raised.
+        """
+        breaker = self.get_breaker(service_type)
+        if not self.can_make_request(service_type) or not breaker.allow_request():
+            return None
+            
+        try:
+            data = api_call()
+        except Exception as e:
+            self.handle_error(e, service_type)
+            raise
+            
+        breaker.record_success()
+        self.last_request_time[service_type] = time.time()
+        return data
     
     def get_all_data(self, services: Dict[str, callable]) -> Dict[str, Any]:
         """Get data from all services"""
@@ -63,11 +98,68 @@ class APIManager:
         return results
 
     def get_all_data(self) -> Dict[str, Any]:
-        """Get data from all services with coordinated timing"""
+        """Get new data from every feed whose poll is due, grouped by service"""
+        due = {}
+        now = time.time()
+        for key in self.scheduler.due_feeds(now):
+            breaker = self.get_breaker(key)
+            if breaker.allow_request(now):
+                due.setdefault(key[0], []).append(key[1])
+            else:
+                # breaker open, or a retry is pending: keep the feed off the poll list
+                self.scheduler.defer(key, breaker.retry_delay(now), now)
+            
         results = {}
-        for service_type in ['subway', 'lirr', 'mnr']:
-            if self.can_make_request(service_type):
-                data = self.get_data(service_type, lambda: MTAServiceFactory.get_service(service_type).get_realtime_data())
-                if data:
-                    results[service_type] = data
-        return results 
\ No newline at end of file
+        unchanged = {}
+        for service_type, feed_ids in due.items():
+            service = MTAServiceFactory.get_service(service_type)
+            for feed_id in feed_ids:
+                feed_tracker.begin_poll((service_type, feed_id))
+                
+            feeds = service.get_feeds(service_type, feed_ids, skip_unchanged=True)
+            now = time.time()
+            
+            for feed_id in feed_ids:
+                key = (service_type, feed_id)
+                outcome = feed_tracker.last_outcome(key)
+                if feed_id in feeds:
+                    self.get_breaker(key).record_success(now)
+                    self.scheduler.record_poll(key, feeds[feed_id].header.timestamp or int(now), now)
+                elif outcome in ('not_modified', 'unchanged'):
+                    self.get_breaker(key).record_success(now)
+                    self.scheduler.record_poll(key, None, now)
+                    unchanged.setdefault(service_type, []).append(feed_id)
+                else:
+                    reason = 'timed out' if outcome is None else 'request failed'
+                    wait_time = self.handle_error(MTAConnectionError(f"feed {reason}"), key)
+                    self.scheduler.record_failure(key, now, retry_in=wait_time)
+                    
+            if feeds:
+                self.last_request_time[service_type] = now
+                self.archive_feeds(service_type, feeds)
+                results[service_type] = service.build_realtime_data(feeds)
+        self.unchanged_feeds = unchanged
+        return results
+
+    def archive_feeds(self, service_type: str, feeds: Dict[str, Any]) -> None:
+        """Append new feed snapshots to the raw feed archive, if there is one"""
+        if self.archive is None:
+            return
+        for feed_id, feed in feeds.items():
+            try:
+                self.archive.append(service_type, feed_id, feed)
+            except Exception as e:
+                self.logger.error(f"Failed to archive {service_type}/{feed_id}: {str(e)}")
+
+    def get_breaker_stats(self) -> Dict[str, Any]:
+        """Get state and time spent in backoff of every circuit breaker"""
+        breakers = [breaker.to_dict() for breaker in self.breakers.values()]
+        return {
+            'open': sum(1 for breaker in breakers if breaker['state'] != 'closed'),
+            'backoff_time_total': round(sum(breaker['backoff_time'] for breaker in breakers), 3),
+            'breakers': breakers
+        }
+
+    def seconds_until_next_poll(self) -> float:
+        """Get seconds until the next feed poll is due"""
+        return self.scheduler.seconds_until_next_poll()
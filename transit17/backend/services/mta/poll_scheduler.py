@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+from datetime import datetime
+from backend.config.settings import (
+    FEED_POLL_MIN_INTERVAL, FEED_POLL_MAX_INTERVAL, FEED_POLL_DELAY,
+    FEED_POLL_JITTER, FEED_POLL_RETRY_INTERVAL
+)
+
+class FeedTimer:
+    """Polling state of one feed"""
+
+    # weight of the newest header timestamp delta in the observed period
+    PERIOD_SMOOTHING = 0.3
+
+    def __init__(self, key):
+        self.key = key
+        self.next_due = 0.0
+        self.observed_period = None
+        # seconds after the expected header timestamp to poll, grows when the
+        # feed is published later than its header timestamp suggests
+        self.delay = FEED_POLL_DELAY
+        self.last_poll_wasted = False
+        self.last_header_timestamp = None
+        self.last_poll = None
+        self.polls = 0
+        self.updates = 0
+        self.wasted_polls = 0
+        self.failures = 0
+        self.avg_staleness = None
+
+    def observe_update(self, header_timestamp, now):
+        """learn the refresh period from successive header timestamps"""
+        if self.last_header_timestamp and header_timestamp > self.last_header_timestamp:
+            delta = header_timestamp - self.last_header_timestamp
+            if self.observed_period is None:
+                self.observed_period = delta
+            else:
+                self.observed_period += self.PERIOD_SMOOTHING * (delta - self.observed_period)
+
+        staleness = max(0.0, now - header_timestamp)
+        if self.avg_staleness is None:
+            self.avg_staleness = staleness
+        else:
+            self.avg_staleness += self.PERIOD_SMOOTHING * (staleness - self.avg_staleness)
+        self.last_header_timestamp = header_timestamp
+
+    def to_dict(self, now):
+        feed_type, feed_id = self.key
+        return {
+            'feed': f"{feed_type}/{feed_id}",
+            'next_due': datetime.fromtimestamp(self.next_due).isoformat() if self.next_due else None,
+            'seconds_until_due': round(max(0.0, self.next_due - now), 3),
+            'observed_period': round(self.observed_period, 3) if self.observed_period else None,
+            'poll_delay': round(self.delay, 3),
+            'last_header_timestamp': self.last_header_timestamp,
+            'polls': self.polls,
+            'updates': self.updates,
+            'wasted_polls': self.wasted_polls,
+            'failures': self.failures,
+            'avg_staleness': round(self.avg_staleness, 3) if self.avg_staleness is not None else None
+        }
+
+class FeedPollScheduler:
+    """
+    Give every feed its own poll timer
+
+    Each feed's refresh cadence is learned from successive header timestamps
+    and the next poll is planned just after the expected update, with jitter
+    so feeds don't line up. Until a feed's period is known it is probed every
+    FEED_POLL_MIN_INTERVAL seconds.
+    """
+
+    def __init__(self, feeds=None):
+        """
+        Args:
+            feeds (iterable): (feed_type, feed_id) keys to schedule
+        """
+        self._lock = threading.Lock()
+        self._timers = {}
+        for key in feeds or []:
+            self.add_feed(key)
+
+    def add_feed(self, key):
+        """start scheduling a feed, due immediately"""
+        with self._lock:
+            if key not in self._timers:
+                self._timers[key] = FeedTimer(key)
+
+    def due_feeds(self, now=None):
+        """get the keys of all feeds whose poll is due"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [key for key, timer in self._timers.items() if timer.next_due <= now]
+
+    def seconds_until_next_poll(self, now=None):
+        """get seconds until the earliest feed is due, 0 if one is due already"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._timers:
+                return FEED_POLL_MAX_INTERVAL
+            return max(0.0, min(timer.next_due for timer in self._timers.values()) - now)
+
+    def _jitter(self):
+        return random.uniform(0, FEED_POLL_JITTER)
+
+    def record_poll(self, key, header_timestamp, now=None):
+        """
+        record a successful poll and plan the next one
+
+        Args:
+            key (tuple): (feed_type, feed_id)
+            header_timestamp (int): header timestamp of the feed if it had new
+                data, None if it was unchanged (304 or same timestamp)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            timer = self._timers.setdefault(key, FeedTimer(key))
+            timer.polls += 1
+            timer.last_poll = now
+
+            if header_timestamp and header_timestamp != timer.last_header_timestamp:
+                timer.updates += 1
+                timer.observe_update(header_timestamp, now)
+                if timer.observed_period and not timer.last_poll_wasted:
+                    # found on the first try, creep closer to the expected update
+                    timer.delay = max(0.0, timer.delay - 0.25)
+                timer.last_poll_wasted = False
+                if timer.observed_period:
+                    period = min(max(timer.observed_period, FEED_POLL_MIN_INTERVAL), FEED_POLL_MAX_INTERVAL)
+                    next_due = header_timestamp + period + timer.delay
+                else:
+                    next_due = now + FEED_POLL_MIN_INTERVAL
+            else:
+                # the expected update has not been published yet, look again
+                # shortly and poll a little later after the next update
+                timer.wasted_polls += 1
+                if timer.observed_period and not timer.last_poll_wasted:
+                    timer.delay = min(timer.delay + 1.0, timer.observed_period / 2)
+                timer.last_poll_wasted = True
+                next_due = now + FEED_POLL_RETRY_INTERVAL
+
+            next_due = min(max(next_due, now + FEED_POLL_MIN_INTERVAL), now + FEED_POLL_MAX_INTERVAL)
+            timer.next_due = next_due + self._jitter()
+
+    def record_failure(self, key, now=None, retry_in=None):
+        """
+        record a failed poll
+
+        Args:
+            retry_in (float): seconds until the next attempt, defaults to
+                FEED_POLL_RETRY_INTERVAL
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            timer = self._timers.setdefault(key, FeedTimer(key))
+            timer.polls += 1
+            timer.failures += 1
+            timer.last_poll = now
+            timer.next_due = now + (FEED_POLL_RETRY_INTERVAL if retry_in is None else retry_in) + self._jitter()
+
+    def defer(self, key, delay, now=None):
+        """push a feed's next poll back without polling it"""
+        now = time.time() if now is None else now
+        with self._lock:
+            timer = self._timers.setdefault(key, FeedTimer(key))
+            timer.next_due = max(timer.next_due, now + delay)
+
+    def make_all_due(self):
+        """make every feed due now, e.g. to drive polls from a replay clock"""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.next_due = 0.0
+
+    def get_stats(self, now=None):
+        """get next-due time, observed period and poll counters of every feed"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [timer.to_dict(now) for timer in self._timers.values()]
@@ -0,0 +1,345 @@
+"""
+Record and replay MTA API responses
+
+The recorder appends every successful response of the shared session to an
+archive file. The replayer serves those bytes back through the same
+requests.Session (in-process) or from a local HTTP stand-in, following a
+replay clock that runs at real time, N times faster, or is stepped by hand.
+"""
+import bisect
+import json
+import struct
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from backend.services.mta.session import get_session
+
+# record header: magic, recorded_at, flags, status, url length, headers length, body length
+_RECORD = struct.Struct('<4sdBHIII')
+_MAGIC = b'MTAR'
+_FLAG_ZLIB = 1
+
+# response headers worth keeping, the rest is transport detail
+_KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+class FeedRecorder:
+    """Append raw responses (status, headers, body) to an archive file"""
+
+    def __init__(self, path, compress=True):
+        self.path = path
+        self.compress = compress
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+
+    def record(self, url, status, headers, body, recorded_at=None):
+        """append one response"""
+        recorded_at = time.time() if recorded_at is None else recorded_at
+        url_bytes = url.encode('utf-8')
+        header_bytes = json.dumps(headers).encode('utf-8')
+        flags = 0
+        if self.compress:
+            compressed = zlib.compress(body, 6)
+            if len(compressed) < len(body):
+                body = compressed
+                flags |= _FLAG_ZLIB
+
+        with self._lock:
+            self._file.write(_RECORD.pack(
+                _MAGIC, recorded_at, flags, status, len(url_bytes), len(header_bytes), len(body)
+            ))
+            self._file.write(url_bytes)
+            self._file.write(header_bytes)
+            self._file.write(body)
+            self._file.flush()
+            self.records += 1
+
+    def response_hook(self, response, *args, **kwargs):
+        """requests response hook recording every 200 response under the URL that was requested"""
+        if response.status_code == 200:
+            headers = {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers}
+            self.record(response.request.url, response.status_code, headers, response.content)
+        return response
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class ArchivedResponse:
+    """One recorded response; the body is read and decompressed on demand"""
+    __slots__ = ('archive', 'recorded_at', 'url', 'status', 'headers', '_offset', '_length', '_flags')
+
+    def __init__(self, archive, recorded_at, url, status, headers, offset, length, flags):
+        self.archive = archive
+        self.recorded_at = recorded_at
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self._offset = offset
+        self._length = length
+        self._flags = flags
+
+    @property
+    def body(self):
+        data = self.archive.read_bytes(self._offset, self._length)
+        return zlib.decompress(data) if self._flags & _FLAG_ZLIB else data
+
+    @property
+    def etag(self):
+        """recorded ETag, or one derived from the record position"""
+        return self.headers.get('ETag') or f'"r{self._offset:x}"'
+
+class FeedArchive:
+    """Read an archive written by FeedRecorder"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._lock = threading.Lock()
+        self.records = []
+        self._by_url = {}
+        self._load_index()
+
+    def _load_index(self):
+        offset = 0
+        while True:
+            self._file.seek(offset)
+            raw = self._file.read(_RECORD.size)
+            if len(raw) < _RECORD.size:
+                break
+            magic, recorded_at, flags, status, url_len, headers_len, body_len = _RECORD.unpack(raw)
+            if magic != _MAGIC:
+                raise ValueError(f"Corrupt feed archive {self.path} at offset {offset}")
+            url = self._file.read(url_len).decode('utf-8')
+            headers = json.loads(self._file.read(headers_len))
+            body_offset = offset + _RECORD.size + url_len + headers_len
+            if body_offset + body_len > self._size():
+                break  # truncated last record, e.g. recorder still writing
+            self.records.append(ArchivedResponse(
+                self, recorded_at, url, status, headers, body_offset, body_len, flags
+            ))
+            offset = body_offset + body_len
+
+        self.records.sort(key=lambda record: record.recorded_at)
+        for record in self.records:
+            self._by_url.setdefault(record.url, []).append(record)
+        self._times = {url: [record.recorded_at for record in records] for url, records in self._by_url.items()}
+
+    def _size(self):
+        self._file.seek(0, 2)
+        return self._file.tell()
+
+    def read_bytes(self, offset, length):
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    @property
+    def start(self):
+        return self.records[0].recorded_at if self.records else 0.0
+
+    @property
+    def end(self):
+        return self.records[-1].recorded_at if self.records else 0.0
+
+    @property
+    def urls(self):
+        return list(self._by_url)
+
+    def snapshot_times(self, gap=1.0):
+        """
+        get one time per recorded poll: responses recorded less than gap
+        seconds apart belong to the same poll, the time of its last response is used
+        """
+        times = []
+        for record in self.records:
+            if times and record.recorded_at - times[-1] < gap:
+                times[-1] = record.recorded_at
+            else:
+                times.append(record.recorded_at)
+        return times
+
+    def response_at(self, url, timestamp):
+        """get the latest response recorded for a URL at or before timestamp"""
+        times = self._times.get(url)
+        if not times:
+            return None
+        index = bisect.bisect_right(times, timestamp) - 1
+        return self._by_url[url][index] if index >= 0 else None
+
+    def close(self):
+        self._file.close()
+
+class ReplayClock:
+    """
+    Archive time during a replay
+
+    With a speed the clock runs from the archive start at speed times real
+    time (1.0 = real time); without one it only moves when set() is called.
+    """
+
+    def __init__(self, start, speed=None):
+        self.start = start
+        self.speed = speed
+        self._manual = start
+        self._started = time.monotonic()
+
+    def now(self):
+        if self.speed is None:
+            return self._manual
+        return self.start + (time.monotonic() - self._started) * self.speed
+
+    def set(self, timestamp):
+        """move a manual clock to an archive timestamp"""
+        self._manual = timestamp
+
+def _build_response(request, record, not_modified=False):
+    response = Response()
+    response.request = request
+    response.url = request.url
+    if record is None:
+        response.status_code = 404
+        response.reason = 'Not Found'
+        response._content = b''
+        return response
+
+    response.headers = CaseInsensitiveDict(record.headers)
+    response.headers['ETag'] = record.etag
+    if not_modified:
+        response.status_code = 304
+        response.reason = 'Not Modified'
+        response._content = b''
+    else:
+        response.status_code = record.status
+        response.reason = 'OK'
+        response._content = record.body
+    return response
+
+class ReplayAdapter(BaseAdapter):
+    """requests transport adapter answering from a FeedArchive instead of the network"""
+
+    def __init__(self, archive, clock):
+        super().__init__()
+        self.archive = archive
+        self.clock = clock
+
+    def send(self, request, **kwargs):
+        record = self.archive.response_at(request.url, self.clock.now())
+        not_modified = record is not None and request.headers.get('If-None-Match') == record.etag
+        return _build_response(request, record, not_modified)
+
+    def close(self):
+        pass
+
+def install_recorder(path, session=None):
+    """record every response of the shared session to an archive, returns the recorder"""
+    session = session or get_session()
+    recorder = FeedRecorder(path)
+    session.hooks['response'].append(recorder.response_hook)
+    return recorder
+
+def uninstall_recorder(recorder, session=None):
+    session = session or get_session()
+    if recorder.response_hook in session.hooks['response']:
+        session.hooks['response'].remove(recorder.response_hook)
+    recorder.close()
+
+def install_replay(archive, clock, session=None):
+    """
+    serve the shared session's requests from an archive (in-process replay)
+
+    Returns:
+        dict: the adapters that were replaced, for uninstall_replay
+    """
+    session = session or get_session()
+    adapter = ReplayAdapter(archive, clock)
+    replaced = {}
+    for url in archive.urls:
+        parts = urlsplit(url)
+        prefix = f"{parts.scheme}://{parts.netloc}/"
+        if prefix not in replaced:
+            replaced[prefix] = session.adapters.get(prefix)
+            session.mount(prefix, adapter)
+    return replaced
+
+def uninstall_replay(replaced, session=None):
+    session = session or get_session()
+    for prefix, adapter in replaced.items():
+        if adapter is None:
+            session.adapters.pop(prefix, None)
+        else:
+            session.mount(prefix, adapter)
+
+class ReplayServer:
+    """
+    Local HTTP stand-in for the MTA endpoints serving an archive
+
+    Requests are matched on path and query, so point MTA_BASE_URL and
+    MTA_STATUS_URL at this server keeping the original paths.
+    """
+
+    def __init__(self, archive, clock, host='127.0.0.1', port=0):
+        self.archive = archive
+        self.clock = clock
+        self._by_path = {}
+        for url in archive.urls:
+            parts = urlsplit(url)
+            path = parts.path + (f"?{parts.query}" if parts.query else '')
+            self._by_path[path] = url
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = server._by_path.get(self.path)
+                record = archive.response_at(url, clock.now()) if url else None
+                if record is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if self.headers.get('If-None-Match') == record.etag:
+                    self.send_response(304)
+                    self.send_header('ETag', record.etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = record.body
+                self.send_response(record.status)
+                for name, value in record.headers.items():
+                    if name != 'ETag':
+                        self.send_header(name, value)
+                self.send_header('ETag', record.etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def start(self):
+        """serve from a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,115 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from backend.config.settings import (
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+)
+
+# (connect, read) timeout used when a caller doesn't pass one
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+class ConnectionStats:
+    """Count requests, new connections and handshake time of the shared session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """reset all counters"""
+        with self._lock:
+            self.requests = 0
+            self.connections = 0
+            self.handshake_time = 0.0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connect(self, seconds):
+        with self._lock:
+            self.connections += 1
+            self.handshake_time += seconds
+
+    def snapshot(self):
+        """get a copy of the counters"""
+        with self._lock:
+            reused = max(0, self.requests - self.connections)
+            return {
+                'requests': self.requests,
+                'new_connections': self.connections,
+                'reused_connections': reused,
+                'reuse_ratio': reused / self.requests if self.requests else 0.0,
+                'handshake_time_total': self.handshake_time,
+                'handshake_time_avg': self.handshake_time / self.connections if self.connections else 0.0
+            }
+
+connection_stats = ConnectionStats()
+
+def _timed_connection(connection_cls):
+    """subclass a urllib3 connection so every TCP/TLS handshake is timed"""
+    class TimedConnection(connection_cls):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            connection_stats.record_connect(time.perf_counter() - start)
+
+    TimedConnection.__name__ = f"Timed{connection_cls.__name__}"
+    return TimedConnection
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _timed_connection(HTTPConnection)
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _timed_connection(HTTPSConnection)
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTP adapter whose connection pools report reuse statistics"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+    def send(self, request, **kwargs):
+        connection_stats.record_request()
+        return super().send(request, **kwargs)
+
+def create_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+    """
+    create a keep-alive session with pooled connections
+
+    Args:
+        pool_connections (int): number of hosts with a cached connection pool
+        pool_maxsize (int): keep-alive connections kept per host
+    """
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    })
+    return session
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """get the session shared by all MTA services"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def get_connection_stats():
+    """get connection reuse counts and handshake time of the shared session"""
+    return connection_stats.snapshot()
@@ -1,5 +1,6 @@
 from datetime import datetime
 from backend.services.mta.base import BaseMTAService
+from backend.services.mta.cache import feed_cache
 from backend.config.mta_endpoints import SUBWAY_FEEDS, SUBWAY_STATUS_URL
 
 class SubwayService(BaseMTAService):
@@ -7,13 +8,21 @@ class SubwayService(BaseMTAService):
         super().__init__()
         self.feeds = SUBWAY_FEEDS
         
-    def get_line_status(self, line_id):
-        """get specified subway line status"""
+    def _fetch_status_data(self):
+        """fetch the subway status JSON from the MTA"""
         response = self._make_request(SUBWAY_STATUS_URL)
         if not response:
             return None
             
-        data = self._parse_json_response(response)
+        return self._parse_json_response(response)
+        
+    def get_status_data(self):
+        """get the subway status JSON through the shared TTL cache"""
+        return feed_cache.get(('subway_status', 'all'), self._fetch_status_data)
+        
+    def get_line_status(self, line_id):
+        """get specified subway line status"""
+        data = self.get_status_data()
         if not data:
             return None
             
@@ -30,11 +39,7 @@ class SubwayService(BaseMTAService):
         
     def get_all_line_statuses(self):
         """get all subway line statuses"""
-        response = self._make_request(SUBWAY_STATUS_URL)
-        if not response:
-            return None
-            
-        data = self._parse_json_response(response)
+        data = self.get_status_data()
         if not data:
             return None
             
@@ -48,40 +53,47 @@ class SubwayService(BaseMTAService):
             
         return statuses
         
-    def get_line_feed(self, line_id):
+    def get_line_feed(self, line_id, use_cache=False):
         """get specified line's GTFS real-time data"""
         if line_id not in self.feeds:
             return None
             
+        if use_cache:
+            return self.get_cached_feed('subway', line_id)
         return self.get_feed('subway', line_id)
         
-    def get_all_feeds(self):
-        """get all line's GTFS real-time data"""
+    def get_all_feeds(self, concurrent=True, max_workers=None, timeout=None, skip_unchanged=False, use_cache=False):
+        """
+        get all line's GTFS real-time data
+        
+        Args:
+            concurrent (bool): fetch the feeds in parallel instead of one after another
+            max_workers (int): max feeds fetched at the same time (concurrent mode)
+            timeout (float): seconds allowed for each feed
+            skip_unchanged (bool): leave out feeds that have not changed since the last call
+            use_cache (bool): read the feeds through the shared TTL cache (concurrent mode)
+            
+        Returns:
+            dict: line_id -> parsed feed, feeds that failed are left out
+        """
+        if concurrent:
+            return self.get_feeds(
+                'subway', self.feeds, max_workers=max_workers, timeout=timeout,
+                skip_unchanged=skip_unchanged, use_cache=use_cache
+            )
+            
         feeds = {}
         for line_id in self.feeds:
-            feed = self.get_line_feed(line_id)
+            feed = self.get_feed('subway', line_id, timeout=timeout, skip_unchanged=skip_unchanged)
             if feed:
                 feeds[line_id] = feed
                 
         return feeds
         
-    def get_realtime_data(self):
-        """get real-time data for all subway lines"""
-        feeds = self.get_all_feeds()
+    def get_realtime_data(self, skip_unchanged=False, use_cache=False):
+        """get real-time data for all subway lines, optionally only from feeds that changed"""
+        feeds = self.get_all_feeds(skip_unchanged=skip_unchanged, use_cache=use_cache)
         if not feeds:
             return None
             
-        all_trip_updates = []
-        all_vehicle_positions = []
-        
-        for feed in feeds.values():
-            trip_updates = self.process_trip_updates(feed)
-            vehicle_positions = self.process_vehicle_positions(feed)
-            all_trip_updates.extend(trip_updates)
-            all_vehicle_positions.extend(vehicle_positions)
-            
-        return {
-            'trip_updates': all_trip_updates,
-            'vehicle_positions': all_vehicle_positions,
-            'timestamp': self.get_timestamp()
-        } 
\ No newline at end of file
+        return self.build_realtime_data(feeds)
\ No newline at end of file
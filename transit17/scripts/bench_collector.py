@@ -0,0 +1,125 @@
+"""
+Benchmark DataCollector.collect_data and the query layer offline by replaying
+a feed archive in-process into a scratch SQLite database.
+
+    python scripts/bench_collector.py --archive feeds.mtar
+    python scripts/bench_collector.py --cycles 10 --trips 200   # synthetic archive
+
+Each cycle moves the replay clock to the next recorded poll and runs one
+collection, so the same archive always produces the same database.
+"""
+import sys
+import os
+import argparse
+import statistics
+import tempfile
+import time
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_app, db
+from backend.config.mta_endpoints import SUBWAY_FEEDS, get_feed_url
+from backend.models import TripUpdate, StopTimeUpdate, VehiclePosition
+from backend.services.data.archive import RawFeedArchive
+from backend.services.data.collector import DataCollector
+from backend.services.data.query import DataQuery
+from backend.services.mta.replay import (
+    FeedArchive, FeedRecorder, ReplayClock, install_replay, uninstall_replay
+)
+from bench_common import build_sample_feed
+
+
+def build_synthetic_archive(path, cycles, trips, period=30):
+    """Record `cycles` polls of synthetic subway feeds, `period` seconds apart"""
+    recorder = FeedRecorder(path)
+    start = time.time() - cycles * period
+    for cycle in range(cycles):
+        recorded_at = start + cycle * period
+        for feed_id in SUBWAY_FEEDS:
+            feed = build_sample_feed(feed_id, n_trips=trips, timestamp=recorded_at - 1, seed=f"{feed_id}{cycle}")
+            recorder.record(
+                get_feed_url('subway', feed_id), 200,
+                {'Content-Type': 'application/x-protobuf'},
+                feed.SerializeToString(), recorded_at=recorded_at
+            )
+    recorder.close()
+
+
+def count_rows():
+    return {
+        'trip_updates': TripUpdate.query.count(),
+        'stop_time_updates': StopTimeUpdate.query.count(),
+        'vehicle_positions': VehiclePosition.query.count()
+    }
+
+
+def time_queries(repeat):
+    """Time a few DataQuery calls against the replayed data, seconds per call"""
+    route_id = db.session.query(TripUpdate.route_id).limit(1).scalar()
+    timings = {}
+    for name, call in (
+        ('latest_trip_updates', lambda: DataQuery.get_latest_trip_updates(route_id, limit=50)),
+        ('latest_trip_updates_all', lambda: DataQuery.get_latest_trip_updates(limit=50)),
+    ):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            call()
+        timings[name] = (time.perf_counter() - start) / repeat
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the collector on a replayed feed archive')
+    parser.add_argument('--archive', help='archive from scripts/replay_feeds.py record, synthetic if omitted')
+    parser.add_argument('--cycles', type=int, default=5, help='cycles of the synthetic archive')
+    parser.add_argument('--trips', type=int, default=200, help='trips per synthetic feed')
+    parser.add_argument('--query-repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_collector_')
+    archive_path = args.archive
+    if not archive_path:
+        archive_path = os.path.join(workdir, 'synthetic.mtar')
+        build_synthetic_archive(archive_path, args.cycles, args.trips)
+
+    archive = FeedArchive(archive_path)
+    clock = ReplayClock(archive.start)
+    replaced = install_replay(archive, clock)
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}"})
+    with app.app_context():
+        db.create_all()
+        collector = DataCollector()
+        collector.archive = collector.api_manager.archive = RawFeedArchive(os.path.join(workdir, 'archive'))
+        timings = []
+        previous = count_rows()
+        print(f"Replaying {len(archive.records)} responses from {len(archive.urls)} URLs")
+        try:
+            for cycle, snapshot_time in enumerate(archive.snapshot_times(), 1):
+                clock.set(snapshot_time)
+                collector.api_manager.scheduler.make_all_due()
+                start = time.perf_counter()
+                collector.collect_data()
+                elapsed = time.perf_counter() - start
+                timings.append(elapsed)
+
+                rows = count_rows()
+                new_rows = sum(rows.values()) - sum(previous.values())
+                previous = rows
+                print(f"  cycle {cycle:3d}: {elapsed * 1000:9.1f} ms  {new_rows:7d} rows  "
+                      f"{new_rows / elapsed if elapsed else 0:10.0f} rows/s")
+        finally:
+            uninstall_replay(replaced)
+
+        if timings:
+            total_rows = sum(previous.values())
+            print(f"collect_data mean {statistics.mean(timings) * 1000:.1f} ms, "
+                  f"max {max(timings) * 1000:.1f} ms, {total_rows / sum(timings):.0f} rows/s overall")
+        print('  ' + ', '.join(f"{table} {count}" for table, count in previous.items()))
+        for name, seconds in time_queries(args.query_repeat).items():
+            print(f"query {name:<26} {seconds * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Shared helpers for the benchmark scripts: synthetic GTFS-rt feeds and a
+local stub server standing in for the MTA feed endpoints.
+"""
+import hashlib
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from google.transit import gtfs_realtime_pb2
+
+
+def build_sample_feed(feed_id, n_trips=200, stops_per_trip=20, timestamp=None, seed=None):
+    """Build a FeedMessage shaped like an MTA subway feed"""
+    rng = random.Random(seed if seed is not None else feed_id)
+    timestamp = int(timestamp or time.time())
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = '1.0'
+    feed.header.timestamp = timestamp
+
+    for i in range(n_trips):
+        trip_id = f"{feed_id}_{i:05d}_{rng.randint(0, 999):03d}..N{rng.randint(1, 99):02d}R"
+        route_id = feed_id[0].upper()
+
+        entity = feed.entity.add()
+        entity.id = f"{i * 2 + 1:06d}"
+        trip_update = entity.trip_update
+        trip_update.trip.trip_id = trip_id
+        trip_update.trip.route_id = route_id
+        trip_update.trip.start_time = '08:00:00'
+        trip_update.trip.start_date = '20240101'
+        arrival = timestamp + rng.randint(0, 120)
+        for seq in range(stops_per_trip):
+            stop_update = trip_update.stop_time_update.add()
+            stop_update.stop_id = f"{route_id}{seq:02d}N"
+            stop_update.stop_sequence = seq
+            stop_update.arrival.time = arrival
+            stop_update.departure.time = arrival + 30
+            arrival += rng.randint(60, 180)
+
+        entity = feed.entity.add()
+        entity.id = f"{i * 2 + 2:06d}"
+        vehicle = entity.vehicle
+        vehicle.vehicle.id = f"{feed_id}-{i:05d}"
+        vehicle.trip.trip_id = trip_id
+        vehicle.trip.route_id = route_id
+        vehicle.current_stop_sequence = rng.randint(0, stops_per_trip - 1)
+        vehicle.current_status = rng.randint(0, 2)
+        vehicle.timestamp = timestamp - rng.randint(0, 30)
+        vehicle.position.latitude = 40.7 + rng.random() / 10
+        vehicle.position.longitude = -74.0 + rng.random() / 10
+
+    return feed
+
+
+class StubFeedServer:
+    """Local HTTP server answering every feed path with a canned payload after a delay"""
+
+    def __init__(self, payloads, delays=None, etags=False, host='127.0.0.1', port=0):
+        """
+        Args:
+            payloads (dict): URL path suffix -> response bytes
+            delays (dict): URL path suffix -> seconds to wait before answering
+            etags (bool): send ETags and answer matching If-None-Match with 304
+        """
+        self.payloads = payloads
+        self.delays = delays or {}
+        self.etags = etags
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                key = self.path.rsplit('/', 1)[-1]
+                body = stub.payloads.get(key)
+                time.sleep(stub.delays.get(key, 0))
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if stub.etags and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                if stub.etags:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'application/x-protobuf')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
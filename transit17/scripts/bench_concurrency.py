@@ -0,0 +1,145 @@
+"""
+Benchmark serving latency while the collector ingests at full rate.
+
+A writer process imports synthetic poll cycles back to back (no tracker, so
+every cycle writes every row) while reader threads run the queries behind the
+API against the same database. Each SQLite storage mode is run in turn:
+
+- rollback: SQLite defaults, readers wait while a cycle is being written
+- wal:      WAL mode, tuned pragmas, single writer connection and a
+            read-only reader pool (SQLITE_STORAGE_MODE = 'wal')
+"""
+import sys
+import os
+import argparse
+import multiprocessing
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_app, db
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.partitions import partition_manager
+from backend.services.data.query import DataQuery
+from bench_ingest import build_cycles
+
+
+def api_requests(route_id):
+    """the reads of a status page: latest trips and vehicles, the state of a route now"""
+    return [
+        ('latest_trip_updates', lambda: DataQuery.get_latest_trip_updates(route_id=route_id)),
+        ('latest_vehicle_positions', lambda: DataQuery.get_latest_vehicle_positions()),
+        ('trip_updates_at', lambda: DataQuery.get_trip_updates_at(datetime.now(), route_id=route_id)),
+    ]
+
+
+def writer(uri, mode, cycles, trips, stops, ready, stop, result):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SQLITE_STORAGE_MODE': mode})
+    cycles_data = build_cycles(cycles, trips, stops, 0.05)
+    with app.app_context():
+        RealtimeImporter.import_realtime_data(cycles_data[0], 'subway')
+        ready.set()
+        rows = written = 0
+        start = time.perf_counter()
+        while not stop.is_set():
+            counts = RealtimeImporter.import_realtime_data(cycles_data[written % len(cycles_data)], 'subway')
+            rows += counts['trip_updates'] + counts['stop_time_updates'] + counts['vehicle_positions']
+            written += 1
+        result.put((written, rows, time.perf_counter() - start))
+
+
+def reader(app, route_id, stop, latencies, errors):
+    with app.app_context():
+        requests = api_requests(route_id)
+        index = 0
+        while not stop.is_set():
+            name, request = requests[index % len(requests)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                request()
+            except Exception as e:
+                errors.append(f"{name}: {e.__class__.__name__}")
+                db.session.rollback()
+                continue
+            finally:
+                db.session.remove()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(mode, args, workdir):
+    uri = f"sqlite:///{os.path.join(workdir, mode + '.db')}"
+    setup_app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SQLITE_STORAGE_MODE': mode})
+    with setup_app.app_context():
+        db.create_all()
+        partition_manager.setup()
+        db.session.remove()
+        db.engine.dispose()
+
+    context = multiprocessing.get_context('spawn')
+    ready, stop, result = context.Event(), context.Event(), context.Queue()
+    process = context.Process(target=writer, args=(uri, mode, args.cycles, args.trips, args.stops, ready, stop, result))
+    process.start()
+    ready.wait()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SQLITE_STORAGE_MODE': mode}, readonly=True)
+    with app.app_context():
+        route_id = DataQuery.get_latest_trip_updates(limit=1)[0].route_id
+        db.session.remove()
+
+    reader_stop = threading.Event()
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=reader, args=(app, route_id, reader_stop, latencies, errors))
+        for _ in range(args.readers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    reader_stop.set()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    cycles, rows, elapsed = result.get()
+    process.join()
+
+    if latencies:
+        print(f"{mode:<9} {len(latencies) / args.duration:7.0f} req/s  p50 {percentile(latencies, 0.5):7.1f} ms  "
+              f"p95 {percentile(latencies, 0.95):7.1f} ms  p99 {percentile(latencies, 0.99):7.1f} ms  "
+              f"max {max(latencies):7.1f} ms  mean {statistics.mean(latencies):6.1f} ms  "
+              f"{len(errors)} errors  | ingest {cycles} cycles, {rows / elapsed:7.0f} rows/s")
+    else:
+        print(f"{mode:<9} no request completed, {len(errors)} errors")
+    for error in sorted(set(errors)):
+        print(f"          {errors.count(error)} x {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark API latency during ingest per SQLite storage mode')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per mode')
+    parser.add_argument('--readers', type=int, default=4, help='concurrent API request threads')
+    parser.add_argument('--cycles', type=int, default=5, help='distinct synthetic poll cycles, replayed in a loop')
+    parser.add_argument('--trips', type=int, default=100, help='trips per synthetic feed')
+    parser.add_argument('--stops', type=int, default=20, help='stop time updates per trip')
+    parser.add_argument('--mode', action='append', choices=['rollback', 'wal'], help='both if omitted')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_concurrency_')
+    print(f"{args.readers} reader threads for {args.duration:.0f} s per mode, writer ingesting "
+          f"{args.trips * 8} trips x {args.stops} stops per cycle back to back")
+    for mode in args.mode or ['rollback', 'wal']:
+        run(mode, args, workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import sys
+import os
+import argparse
+import glob
+import time
+import tracemalloc
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.transit import gtfs_realtime_pb2
+from backend.config.mta_endpoints import SUBWAY_FEEDS
+from backend.services.mta.base import BaseMTAService
+from bench_common import build_sample_feed
+
+
+def load_feeds(paths):
+    """Load recorded FeedMessages (raw protobuf files), or synthetic ones if none given"""
+    feeds = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, 'rb') as f:
+                feed = gtfs_realtime_pb2.FeedMessage()
+                feed.ParseFromString(f.read())
+                feeds.append(feed)
+    if not feeds:
+        feeds = [build_sample_feed(feed_id, n_trips=300) for feed_id in SUBWAY_FEEDS]
+    return feeds
+
+
+def two_pass_path(service, feeds):
+    for feed in feeds:
+        service.process_trip_updates(feed)
+        service.process_vehicle_positions(feed)
+
+
+def one_pass_path(service, feeds):
+    for feed in feeds:
+        service.decode_feed(feed)
+
+
+def measure(label, func, service, feeds, entities, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(service, feeds)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    func(service, feeds)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<18} {entities / elapsed:12,.0f} entities/s   {elapsed * 1000:8.1f} ms/pass   "
+          f"peak {peak / 1024 / 1024:7.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark decoding GTFS-rt feeds in one or two passes')
+    parser.add_argument('feeds', nargs='*', help='recorded FeedMessage files (globs allowed)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    feeds = load_feeds(args.feeds)
+    entities = sum(len(feed.entity) for feed in feeds)
+    print(f"{len(feeds)} feeds, {entities:,} entities")
+
+    service = BaseMTAService()
+    measure('two passes', two_pass_path, service, feeds, entities, args.repeat)
+    measure('one pass', one_pass_path, service, feeds, entities, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
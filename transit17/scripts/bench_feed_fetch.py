@@ -0,0 +1,68 @@
+import sys
+import os
+import argparse
+import random
+import statistics
+import time
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config import mta_endpoints
+from backend.config.mta_endpoints import SUBWAY_FEEDS
+from backend.services.mta.subway import SubwayService
+from backend.services.mta.session import connection_stats
+from bench_common import build_sample_feed, StubFeedServer
+
+
+def run_cycles(service, cycles, **kwargs):
+    """Fetch all subway feeds `cycles` times and return wall-clock seconds per cycle"""
+    timings = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        feeds = service.get_all_feeds(**kwargs)
+        timings.append(time.perf_counter() - start)
+        if len(feeds) != len(SUBWAY_FEEDS):
+            print(f"  partial cycle: {len(feeds)}/{len(SUBWAY_FEEDS)} feeds")
+    return timings
+
+
+def report(label, timings):
+    stats = connection_stats.snapshot()
+    print(
+        f"{label:<12} mean {statistics.mean(timings) * 1000:8.1f} ms   "
+        f"min {min(timings) * 1000:8.1f} ms   max {max(timings) * 1000:8.1f} ms   "
+        f"connections {stats['new_connections']} new / {stats['reused_connections']} reused, "
+        f"handshake {stats['handshake_time_total'] * 1000:.1f} ms"
+    )
+    connection_stats.reset()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sequential vs concurrent subway feed fetching')
+    parser.add_argument('--cycles', type=int, default=5)
+    parser.add_argument('--min-delay', type=float, default=0.05, help='fastest simulated feed latency (s)')
+    parser.add_argument('--max-delay', type=float, default=0.40, help='slowest simulated feed latency (s)')
+    parser.add_argument('--trips', type=int, default=200, help='trips per synthetic feed')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    payloads = {}
+    delays = {}
+    for feed_id, path in SUBWAY_FEEDS.items():
+        payloads[path] = build_sample_feed(feed_id, n_trips=args.trips).SerializeToString()
+        delays[path] = rng.uniform(args.min_delay, args.max_delay)
+
+    with StubFeedServer(payloads, delays) as server:
+        mta_endpoints.BASE_URL = server.base_url
+        service = SubwayService()
+
+        print(f"{len(SUBWAY_FEEDS)} feeds, latency {args.min_delay:.2f}-{args.max_delay:.2f}s, "
+              f"sum {sum(delays.values()):.2f}s, slowest {max(delays.values()):.2f}s")
+        report('sequential', run_cycles(service, args.cycles, concurrent=False))
+        report('concurrent', run_cycles(service, args.cycles, concurrent=True, max_workers=args.workers))
+
+
+if __name__ == '__main__':
+    main()
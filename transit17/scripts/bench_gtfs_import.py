@@ -0,0 +1,73 @@
+"""
+Benchmark the GTFS static importer on a synthetic feed the size of the
+subway's (about 20k trips and 500k+ stop times by default) and print the
+import time and peak RSS of every file.
+"""
+import sys
+import os
+import argparse
+import random
+import tempfile
+import zipfile
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_app, db
+from backend.services.data.importer import GTFSImporter
+
+
+def build_gtfs_zip(path, routes=30, stops=1500, trips=20000, stops_per_trip=30, seed=17):
+    """Write a GTFS zip with routes, stops, trips and stop times to path"""
+    rng = random.Random(seed)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as gtfs_zip:
+        gtfs_zip.writestr('routes.txt', 'agency_id,route_id,route_short_name,route_long_name,route_type,route_color\n' + ''.join(
+            f"MTA NYCT,R{route},R{route},Route {route} Local,1,{rng.randint(0, 0xFFFFFF):06X}\n" for route in range(routes)
+        ))
+        gtfs_zip.writestr('stops.txt', 'stop_id,stop_name,stop_lat,stop_lon,location_type,parent_station\n' + ''.join(
+            f"S{stop:04d},Station {stop},{40.5 + rng.random() * 0.4:.6f},{-74.1 + rng.random() * 0.4:.6f},0,\n"
+            for stop in range(stops)
+        ))
+        gtfs_zip.writestr('trips.txt', 'route_id,trip_id,service_id,trip_headsign,direction_id,shape_id\n' + ''.join(
+            f"R{trip % routes},T{trip:06d},{('Weekday', 'Saturday', 'Sunday')[trip % 3]},Terminal {trip % 7},{trip % 2},R{trip % routes}..N\n"
+            for trip in range(trips)
+        ))
+        with gtfs_zip.open('stop_times.txt', 'w') as f:
+            f.write(b'trip_id,arrival_time,departure_time,stop_id,stop_sequence,pickup_type,drop_off_type\n')
+            for trip in range(trips):
+                seconds = 4 * 3600 + rng.randint(0, 20 * 3600)
+                first_stop = rng.randint(0, stops - stops_per_trip)
+                lines = []
+                for sequence in range(1, stops_per_trip + 1):
+                    time_text = f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+                    lines.append(f"T{trip:06d},{time_text},{time_text},S{first_stop + sequence - 1:04d},{sequence},0,0\n")
+                    seconds += rng.randint(60, 180)
+                f.write(''.join(lines).encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the GTFS static importer')
+    parser.add_argument('--zip', help='GTFS zip to import, a synthetic one if omitted')
+    parser.add_argument('--trips', type=int, default=20000, help='trips of the synthetic feed')
+    parser.add_argument('--stops-per-trip', type=int, default=30)
+    parser.add_argument('--chunk-size', type=int, help='rows per insert statement')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_gtfs_')
+    zip_path = args.zip
+    if zip_path is None:
+        zip_path = os.path.join(workdir, 'gtfs.zip')
+        build_gtfs_zip(zip_path, trips=args.trips, stops_per_trip=args.stops_per_trip)
+    print(f"importing {zip_path} ({os.path.getsize(zip_path) / 1024 / 1024:.1f} MiB)")
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'gtfs.db')}"})
+    with app.app_context():
+        db.create_all()
+        importer = GTFSImporter(**({'chunk_size': args.chunk_size} if args.chunk_size else {}))
+        for stats in importer.import_gtfs(zip_path, 'subway'):
+            print(f"{stats['file']:<16} {stats['rows']:9d} rows  {stats['seconds']:7.2f} s  "
+                  f"{stats['rows'] / max(stats['seconds'], 0.001):9.0f} rows/s  peak RSS {stats['peak_rss_mb']} MiB")
+
+
+if __name__ == '__main__':
+    main()
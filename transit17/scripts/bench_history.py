@@ -0,0 +1,193 @@
+"""
+Benchmark the columnar position history against row storage.
+
+A synthetic day of vehicle reports (every vehicle every 30 s) is appended
+poll cycle by poll cycle to a PositionHistory and, for comparison, inserted
+into an indexed SQLite table shaped like vehicle_positions. The same
+analytics questions are then answered by both:
+
+- hour:   every position reported in one hour
+- track:  one vehicle over the whole day
+- route:  positions of one route over the day
+- counts: reports per route over the day
+- bbox:   reports inside a bounding box over the day
+"""
+import sys
+import os
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.data.history import PositionHistory
+
+
+def build_day(vehicles, interval, day, seed=17):
+    """poll cycles of one day: (trip updates, vehicle positions) per cycle"""
+    rng = random.Random(seed)
+    routes = [f"R{index}" for index in range(25)]
+    state = [
+        {'vehicle_id': f"V{index:04d}", 'trip': 0, 'route_id': rng.choice(routes),
+         'latitude': 40.6 + rng.random() * 0.3, 'longitude': -74.0 + rng.random() * 0.2}
+        for index in range(vehicles)
+    ]
+    start = datetime.combine(day, datetime.min.time())
+    for cycle in range(int(86400 / interval)):
+        timestamp = start + timedelta(seconds=cycle * interval)
+        trip_updates, positions = [], []
+        for index, vehicle in enumerate(state):
+            if rng.random() < 0.005:
+                vehicle['trip'] += 1
+                vehicle['route_id'] = rng.choice(routes)
+            trip_id = f"{vehicle['vehicle_id']}_{vehicle['trip']}"
+            vehicle['latitude'] += rng.uniform(-0.001, 0.001)
+            vehicle['longitude'] += rng.uniform(-0.001, 0.001)
+            trip_updates.append({'trip_id': trip_id, 'route_id': vehicle['route_id']})
+            positions.append({
+                'vehicle_id': vehicle['vehicle_id'],
+                'trip_id': trip_id,
+                'current_stop_sequence': cycle % 40,
+                'current_status': cycle % 3,
+                'timestamp': timestamp,
+                'position': {'latitude': vehicle['latitude'], 'longitude': vehicle['longitude'],
+                             'speed': None, 'bearing': None}
+            })
+        yield {'trip_updates': trip_updates, 'vehicle_positions': positions}
+
+
+def timed(function, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark columnar position history queries against SQLite rows')
+    parser.add_argument('--vehicles', type=int, default=300, help='vehicles reporting all day')
+    parser.add_argument('--interval', type=int, default=30, help='seconds between reports')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query, the best is reported')
+    parser.add_argument('--no-sqlite', action='store_true', help='skip the SQLite comparison')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_history_')
+    day = (datetime.now() - timedelta(days=1)).date()
+    history = PositionHistory(os.path.join(workdir, 'history'))
+    connection = None
+    if not args.no_sqlite:
+        connection = sqlite3.connect(os.path.join(workdir, 'rows.db'))
+        connection.execute("""
+            CREATE TABLE vehicle_positions (
+                id INTEGER PRIMARY KEY, vehicle_id TEXT, trip_id TEXT, route_id TEXT, timestamp DATETIME,
+                latitude FLOAT, longitude FLOAT, current_status INTEGER, current_stop_sequence INTEGER
+            )""")
+        connection.execute("CREATE INDEX ix_vp_timestamp ON vehicle_positions (timestamp)")
+        connection.execute("CREATE INDEX ix_vp_vehicle ON vehicle_positions (vehicle_id, timestamp)")
+        connection.execute("CREATE INDEX ix_vp_route ON vehicle_positions (route_id, timestamp)")
+
+    rows = 0
+    append_seconds = insert_seconds = 0.0
+    for cycle in build_day(args.vehicles, args.interval, day):
+        start = time.perf_counter()
+        rows += history.append_cycle('subway', cycle)
+        append_seconds += time.perf_counter() - start
+        if connection is not None:
+            routes = {trip['trip_id']: trip['route_id'] for trip in cycle['trip_updates']}
+            start = time.perf_counter()
+            connection.executemany(
+                "INSERT INTO vehicle_positions (vehicle_id, trip_id, route_id, timestamp, latitude, longitude, "
+                "current_status, current_stop_sequence) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(vehicle['vehicle_id'], vehicle['trip_id'], routes[vehicle['trip_id']],
+                  vehicle['timestamp'].isoformat(' '), vehicle['position']['latitude'],
+                  vehicle['position']['longitude'], vehicle['current_status'], vehicle['current_stop_sequence'])
+                 for vehicle in cycle['vehicle_positions']]
+            )
+            connection.commit()
+            insert_seconds += time.perf_counter() - start
+    history.close()
+    stats = history.get_stats()['subway']
+    print(f"{rows} positions in one day: columnar append {rows / append_seconds:,.0f} rows/s, "
+          f"{stats['bytes_stored'] / rows:.1f} bytes/row on disk")
+    if connection is not None:
+        print(f"{'':<8} SQLite insert {rows / insert_seconds:,.0f} rows/s, "
+              f"{os.path.getsize(os.path.join(workdir, 'rows.db')) / rows:.1f} bytes/row on disk")
+
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    hour_start = day_start + timedelta(hours=8)
+    hour_end = hour_start + timedelta(hours=1)
+    bbox = (40.7, 40.8, -73.95, -73.85)
+
+    def history_counts():
+        positions = history.query('subway', day_start, day_end, decode=False)
+        history_day = history.load_day('subway', day)
+        counts = np.bincount(positions['route'], minlength=len(history_day.dictionaries['route']))
+        return dict(zip(history_day.dictionaries['route'][counts > 0], counts[counts > 0]))
+
+    def history_bbox():
+        positions = history.query('subway', day_start, day_end, decode=False)
+        latitude, longitude = positions['latitude'], positions['longitude']
+        return int(np.count_nonzero((latitude >= bbox[0]) & (latitude < bbox[1]) &
+                                    (longitude >= bbox[2]) & (longitude < bbox[3])))
+
+    history_queries = {
+        'hour': lambda: len(history.query('subway', hour_start, hour_end)['timestamp']),
+        'track': lambda: len(history.track('subway', 'V0007', day_start, day_end)['timestamp']),
+        'route': lambda: len(history.query('subway', day_start, day_end, route_id='R3')['timestamp']),
+        'counts': history_counts,
+        'bbox': history_bbox
+    }
+
+    def sql(query, parameters):
+        return connection.execute(query, parameters).fetchall()
+
+    sqlite_queries = {
+        'hour': lambda: len(sql("SELECT * FROM vehicle_positions WHERE timestamp >= ? AND timestamp < ?",
+                                (hour_start.isoformat(' '), hour_end.isoformat(' ')))),
+        'track': lambda: len(sql("SELECT * FROM vehicle_positions WHERE vehicle_id = ? AND timestamp >= ? "
+                                 "AND timestamp < ? ORDER BY timestamp",
+                                 ('V0007', day_start.isoformat(' '), day_end.isoformat(' ')))),
+        'route': lambda: len(sql("SELECT * FROM vehicle_positions WHERE route_id = ? AND timestamp >= ? "
+                                 "AND timestamp < ?", ('R3', day_start.isoformat(' '), day_end.isoformat(' ')))),
+        # analytics code working on rows: load the day, aggregate in Python
+        'counts': lambda: Counter(row[3] for row in sql(
+            "SELECT * FROM vehicle_positions WHERE timestamp >= ? AND timestamp < ?",
+            (day_start.isoformat(' '), day_end.isoformat(' ')))),
+        'bbox': lambda: sum(1 for row in sql(
+            "SELECT * FROM vehicle_positions WHERE timestamp >= ? AND timestamp < ?",
+            (day_start.isoformat(' '), day_end.isoformat(' ')))
+            if bbox[0] <= row[5] < bbox[1] and bbox[2] <= row[6] < bbox[3])
+    }
+
+    print(f"{'query':<8} {'columnar':>12} {'sqlite':>12}  result")
+    for name, query in history_queries.items():
+        history_ms, result = timed(query, args.repeat)
+        line = f"{name:<8} {history_ms:9.1f} ms"
+        if connection is not None:
+            sqlite_ms, sqlite_result = timed(sqlite_queries[name], max(1, args.repeat // 2))
+            line += f" {sqlite_ms:9.1f} ms"
+            if name == 'counts':
+                assert {key: int(value) for key, value in result.items()} == dict(sqlite_result)
+            elif name == 'bbox':
+                # coordinates are float32 columns, points on the box edge may round across it
+                assert abs(result - sqlite_result) <= rows * 1e-4, (name, result, sqlite_result)
+            else:
+                assert result == sqlite_result, (name, result, sqlite_result)
+        summary = f"{len(result)} routes" if name == 'counts' else result
+        print(f"{line}  {summary}")
+
+
+if __name__ == '__main__':
+    main()
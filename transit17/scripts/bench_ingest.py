@@ -0,0 +1,139 @@
+"""
+Benchmark realtime ingest into scratch SQLite databases:
+
+- per-row: the RealtimeImporter methods, one transaction per trip / vehicle
+- batch:   import_realtime_data, one transaction per poll cycle
+- changes: import_realtime_data with a ChangeTracker, only new or changed
+           entities plus end markers
+
+Between cycles a fraction (--change-rate) of the trips and vehicles change
+and about 1% of the trips end and are replaced by new ones, as in a real feed.
+"""
+import sys
+import os
+import argparse
+import copy
+import random
+import statistics
+import tempfile
+import time
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_app, db
+from backend.config.mta_endpoints import SUBWAY_FEEDS
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.importer import RealtimeImporter
+from backend.services.mta.base import BaseMTAService
+from bench_common import build_sample_feed
+
+
+def build_cycles(cycles, trips, stops, change_rate, seed=17):
+    """Realtime data of `cycles` subway poll cycles, as the collector gets it"""
+    rng = random.Random(seed)
+    start = int(time.time()) - cycles * 30
+    service = BaseMTAService()
+    feeds = {}
+    for feed_id in SUBWAY_FEEDS:
+        feeds[feed_id] = service.decode_feed(
+            build_sample_feed(feed_id, n_trips=trips, stops_per_trip=stops, timestamp=start)
+        )
+
+    data = []
+    for cycle in range(cycles):
+        header_timestamp = start + cycle * 30
+        trip_updates = []
+        vehicle_positions = []
+        for feed_id, (feed_trips, feed_vehicles) in feeds.items():
+            if cycle:
+                for index in range(len(feed_trips)):
+                    if rng.random() < 0.01:
+                        # the trip ended, a new one starts
+                        feed_trips[index] = dict(feed_trips[index], trip_id=f"{feed_trips[index]['trip_id']}+{cycle}")
+                        feed_vehicles[index] = dict(feed_vehicles[index], trip_id=feed_trips[index]['trip_id'])
+                    if rng.random() < change_rate:
+                        delay = rng.randint(15, 90)
+                        feed_trips[index] = dict(feed_trips[index], stop_updates=[
+                            dict(stop, arrival_time=stop['arrival_time'] + delay,
+                                 departure_time=stop['departure_time'] + delay)
+                            for stop in feed_trips[index]['stop_updates']
+                        ])
+                    if rng.random() < change_rate:
+                        position = dict(feed_vehicles[index]['position'], latitude=feed_vehicles[index]['position']['latitude'] + 0.001)
+                        feed_vehicles[index] = dict(feed_vehicles[index], position=position)
+            for entity in feed_trips + feed_vehicles:
+                entity['feed_id'] = feed_id
+            trip_updates.extend(copy.copy(trip) for trip in feed_trips)
+            vehicle_positions.extend(copy.copy(vehicle) for vehicle in feed_vehicles)
+        data.append({
+            'trip_updates': trip_updates,
+            'vehicle_positions': vehicle_positions,
+            'feeds': {feed_id: header_timestamp for feed_id in feeds}
+        })
+    return data
+
+
+def ingest_per_row(service_data, tracker):
+    rows = 0
+    for trip_update in service_data['trip_updates']:
+        RealtimeImporter.import_trip_update(trip_update, 'subway')
+        rows += 1 + len(trip_update['stop_updates'])
+    for vehicle_position in service_data['vehicle_positions']:
+        RealtimeImporter.import_vehicle_position(vehicle_position, 'subway')
+        rows += 1
+    return rows
+
+
+def ingest_batch(service_data, tracker):
+    counts = RealtimeImporter.import_realtime_data(service_data, 'subway', tracker=tracker)
+    return counts['trip_updates'] + counts['stop_time_updates'] + counts['vehicle_positions']
+
+
+def run(label, ingest, cycles_data, workdir, tracker=None):
+    db_path = os.path.join(workdir, label + '.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{db_path}"})
+    with app.app_context():
+        db.create_all()
+        timings = []
+        rows = 0
+        for service_data in cycles_data:
+            start = time.perf_counter()
+            rows += ingest(service_data, tracker)
+            timings.append(time.perf_counter() - start)
+        db.session.remove()
+        db.engine.dispose()
+
+    entities = sum(
+        len(data['trip_updates']) + len(data['vehicle_positions'])
+        + sum(len(trip['stop_updates']) for trip in data['trip_updates'])
+        for data in cycles_data
+    )
+    print(f"{label:<8} cycle latency mean {statistics.mean(timings) * 1000:8.1f} ms  "
+          f"max {max(timings) * 1000:8.1f} ms  {entities / sum(timings):8.0f} rows/s ingested  "
+          f"{rows:8d} rows written  db {os.path.getsize(db_path) / 1024 / 1024:6.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-row, batched and change-capture realtime ingest')
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--trips', type=int, default=100, help='trips per synthetic feed')
+    parser.add_argument('--stops', type=int, default=20, help='stop time updates per trip')
+    parser.add_argument('--change-rate', type=float, default=0.05, help='share of entities changing per cycle')
+    parser.add_argument('--skip-per-row', action='store_true', help='the per-row path is slow, skip it')
+    args = parser.parse_args()
+
+    cycles_data = build_cycles(args.cycles, args.trips, args.stops, args.change_rate)
+    per_cycle = len(cycles_data[0]['trip_updates'])
+    print(f"{args.cycles} cycles of {len(SUBWAY_FEEDS)} feeds, {per_cycle} trips and "
+          f"{per_cycle * args.stops} stop time updates per cycle, {args.change_rate:.0%} changing")
+
+    workdir = tempfile.mkdtemp(prefix='bench_ingest_')
+    if not args.skip_per_row:
+        run('per-row', ingest_per_row, cycles_data, workdir)
+    run('batch', ingest_batch, cycles_data, workdir)
+    run('changes', ingest_batch, cycles_data, workdir, tracker=ChangeTracker())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Measure what interning the string ids saves in database size and index depth.
+
+The realtime partitions of a database (a recorded one with --database, else
+a scratch database filled with synthetic poll cycles through the collector's
+import path) are compared with a twin holding the same rows and indexes with
+the ids as strings, as they were stored before interning. Both are vacuumed
+into fresh files first, so page fill does not depend on the insert order.
+Sizes and b-tree depths come from SQLite's dbstat table; the interned side
+includes the interned_ids dictionary.
+"""
+import sys
+import os
+import argparse
+import sqlite3
+import tempfile
+import time
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_app, db
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.interning import interned_columns
+from backend.services.data.partitions import PARTITIONED_TABLES, partition_manager
+from bench_ingest import build_cycles
+
+
+def fill(path, cycles, trips, stops, change_rate):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}"})
+    with app.app_context():
+        db.create_all()
+        partition_manager.setup()
+        tracker = ChangeTracker()
+        start = time.perf_counter()
+        for cycle in build_cycles(cycles, trips, stops, change_rate):
+            RealtimeImporter.import_realtime_data(cycle, 'subway', tracker=tracker)
+        print(f"ingested {cycles} cycles in {time.perf_counter() - start:.1f} s")
+        db.session.remove()
+        db.engine.dispose()
+
+
+def build_twin(connection, twin_path):
+    """copy every partition into twin_path with its ids decoded, and its indexes"""
+    connection.execute(f"ATTACH DATABASE '{twin_path}' AS twin")
+    partitions = [
+        (table_name, name) for table_name in PARTITIONED_TABLES
+        for (name,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?", (f"{table_name}_p[0-9]*",)
+        )
+    ]
+    for table_name, name in partitions:
+        interned = set(interned_columns(table_name))
+        columns = [row[1] for row in connection.execute(f"PRAGMA table_info({name})")]
+        definitions = ', '.join(
+            f"{column} VARCHAR(50)" if column in interned else column for column in columns
+        )
+        connection.execute(f"CREATE TABLE twin.{name} ({definitions})")
+        selects = ', '.join(
+            f"(SELECT value FROM interned_ids WHERE id = {column})" if column in interned else column
+            for column in columns
+        )
+        connection.execute(f"INSERT INTO twin.{name} SELECT {selects} FROM {name}")
+        for index, unique, origin in [row[1:4] for row in connection.execute(f"PRAGMA index_list({name})")]:
+            if origin != 'c':
+                continue
+            index_columns = ', '.join(row[2] for row in connection.execute(f"PRAGMA index_info({index})"))
+            connection.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX twin.{index} ON {name} ({index_columns})"
+            )
+    connection.commit()
+    connection.execute("DETACH DATABASE twin")
+    return [name for _, name in partitions]
+
+
+def measure(path, partitions, extra=()):
+    """bytes and b-tree depth of the partitions, their indexes and the extra tables"""
+    connection = sqlite3.connect(path)
+    objects = {
+        name: table for name, table in connection.execute("SELECT name, tbl_name FROM sqlite_master")
+        if table in set(partitions) | set(extra)
+    }
+    stats = {'table_bytes': 0, 'index_bytes': 0, 'table_depth': 0, 'index_depth': 0}
+    for name, pages, size, depth in connection.execute(
+        "SELECT name, count(*), sum(pgsize), max(length(path) - length(replace(path, '/', ''))) "
+        "FROM dbstat GROUP BY name"
+    ):
+        if name not in objects:
+            continue
+        kind = 'table' if name == objects[name] else 'index'
+        stats[f"{kind}_bytes"] += size
+        stats[f"{kind}_depth"] = max(stats[f"{kind}_depth"], depth)
+    rows = sum(connection.execute(f"SELECT count(*) FROM {name}").fetchone()[0] for name in partitions)
+    connection.close()
+    return stats, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure database size and index depth saved by interned ids')
+    parser.add_argument('--database', help='SQLite database with recorded data, a synthetic one if omitted')
+    parser.add_argument('--cycles', type=int, default=240, help='synthetic poll cycles (30 s apart)')
+    parser.add_argument('--trips', type=int, default=100, help='trips per synthetic feed')
+    parser.add_argument('--stops', type=int, default=20, help='stop time updates per trip')
+    parser.add_argument('--change-rate', type=float, default=0.2, help='share of trips and vehicles changing per cycle')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_interning_')
+    path = os.path.abspath(args.database) if args.database else os.path.join(workdir, 'interned.db')
+    if not args.database:
+        fill(path, args.cycles, args.trips, args.stops, args.change_rate)
+    twin_path = os.path.join(workdir, 'strings.db')
+    connection = sqlite3.connect(path)
+    partitions = build_twin(connection, twin_path)
+    connection.execute(f"VACUUM INTO '{os.path.join(workdir, 'interned_vacuumed.db')}'")
+    connection.close()
+    connection = sqlite3.connect(twin_path)
+    connection.execute(f"VACUUM INTO '{os.path.join(workdir, 'strings_vacuumed.db')}'")
+    connection.close()
+
+    interned, rows = measure(os.path.join(workdir, 'interned_vacuumed.db'), partitions, extra=('interned_ids',))
+    strings, _ = measure(os.path.join(workdir, 'strings_vacuumed.db'), partitions)
+    print(f"{rows} realtime rows in {len(partitions)} partitions")
+    print(f"{'':<14} {'strings':>12} {'interned':>12}")
+    for key, label in (('table_bytes', 'tables'), ('index_bytes', 'indexes')):
+        print(f"{label:<14} {strings[key] / 2 ** 20:9.1f} MiB {interned[key] / 2 ** 20:9.1f} MiB  "
+              f"{1 - interned[key] / strings[key]:6.1%} smaller")
+    total_strings = strings['table_bytes'] + strings['index_bytes']
+    total_interned = interned['table_bytes'] + interned['index_bytes']
+    print(f"{'total':<14} {total_strings / 2 ** 20:9.1f} MiB {total_interned / 2 ** 20:9.1f} MiB  "
+          f"{1 - total_interned / total_strings:6.1%} smaller, {total_interned / rows:.0f} vs "
+          f"{total_strings / rows:.0f} bytes/row")
+    print(f"{'max depth':<14} {'':>3}table {strings['table_depth']}, index {strings['index_depth']}"
+          f" {'':>3}table {interned['table_depth']}, index {interned['index_depth']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Compare the current-state queries answered from the live state with the
+same queries answered from the database.
+
+Synthetic poll cycles are imported into a scratch database and fed to a
+LiveState publishing to a scratch file, as the collector does. Each query is
+then timed twice: through a LiveStateReader of that file, and with no live
+state, which makes the serving code fall back to the database. The cost of a
+cycle for the collector (staging, swap and publish) and for a serving
+process (loading a new generation) is printed as well.
+"""
+import sys
+import os
+import argparse
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_app, db
+from backend.services.data import live_state
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.partitions import partition_manager
+from backend.services.data.query import DataQuery
+from bench_ingest import build_cycles
+from serve_data import MTARequestHandler
+
+
+def current_state_queries(app, route_id):
+    handler = SimpleNamespace(app=app)
+    return [
+        ('DataQuery.get_route_status', lambda: DataQuery.get_route_status(route_id)),
+        ('DataQuery.get_latest_vehicle_positions', lambda: DataQuery.get_latest_vehicle_positions(route_id)),
+        ('serve_data.get_vehicle_positions', lambda: MTARequestHandler.get_vehicle_positions(handler)),
+        ('serve_data.get_arrival_times', lambda: MTARequestHandler.get_arrival_times(handler)),
+    ]
+
+
+def time_call(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark current-state queries from the live state and the database')
+    parser.add_argument('--cycles', type=int, default=20, help='synthetic poll cycles (30 s apart)')
+    parser.add_argument('--trips', type=int, default=100, help='trips per synthetic feed')
+    parser.add_argument('--stops', type=int, default=20, help='stop time updates per trip')
+    parser.add_argument('--repeat', type=int, default=200, help='calls per query')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_live_state_')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}"})
+    state = live_state.LiveState(os.path.join(workdir, 'live_state.pickle'))
+    cycles = build_cycles(args.cycles, args.trips, args.stops, 0.2)
+    # the last cycle is current, so arrivals fall in the next 30 minutes
+    shift = int(time.time()) - max(cycles[-1]['feeds'].values())
+    for cycle in cycles:
+        cycle['feeds'] = {feed_id: timestamp + shift for feed_id, timestamp in cycle['feeds'].items()}
+
+    update_times, swap_times = [], []
+    with app.app_context():
+        db.create_all()
+        partition_manager.setup()
+        tracker = ChangeTracker()
+        for cycle in cycles:
+            RealtimeImporter.import_realtime_data(cycle, 'subway', tracker=tracker)
+            start = time.perf_counter()
+            state.update('subway', cycle)
+            update_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            state.swap()
+            swap_times.append(time.perf_counter() - start)
+
+        reader = live_state.LiveStateReader(state.path, check_interval=0)
+        start = time.perf_counter()
+        snapshot = reader.current()
+        load_time = time.perf_counter() - start
+        stats = snapshot.get_stats()
+        print(f"live state: generation {stats['generation']}, {stats['trips']} trips, {stats['vehicles']} vehicles, "
+              f"{stats['arrivals']} arrivals, {os.path.getsize(state.path) / 2 ** 20:.1f} MiB published")
+        print(f"per cycle: update {statistics.median(update_times) * 1000:.1f} ms, swap and publish "
+              f"{statistics.median(swap_times) * 1000:.1f} ms (collector); load {load_time * 1000:.1f} ms (server)")
+
+        route_id = snapshot.trip_updates(limit=1)[0].route_id
+        reader.check_interval = live_state.LIVE_STATE_CHECK_INTERVAL
+        no_live_state = live_state.LiveStateReader(os.path.join(workdir, 'missing.pickle'))
+        print(f"{'median per call':<42} {'database':>12} {'live state':>12}")
+        for name, call in current_state_queries(app, route_id):
+            live_state.live_state_reader = no_live_state
+            database = time_call(call, args.repeat)
+            live_state.live_state_reader = reader
+            live = time_call(call, args.repeat)
+            print(f"{name:<42} {database * 1e6:9.0f} us {live * 1e6:9.1f} us  {database / live:7.0f}x")
+        db.session.remove()
+        db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
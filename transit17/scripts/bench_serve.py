@@ -0,0 +1,157 @@
+"""
+Load test /api/status of scripts/serve_data.py.
+
+A scratch working directory gets a database with a synthetic static feed and
+a few synthetic poll cycles (backend/data/mta_data.db, where the servers look
+for it relative to their working directory), the collector's live state and
+a copy of passenger_view.html. Each server script is started there in turn,
+on the first free port from 5000, and --clients threads request the path
+back to back for --duration seconds over fresh connections. Requests per
+second, latency percentiles and bytes received per request are printed per
+server. With --conditional the clients poll like browsers: they accept gzip
+and send the ETag of their previous response, so unchanged payloads are
+answered 304 (counted as successful requests).
+
+Compare with an older version of the server by extracting it first:
+
+    git show <commit>:transit17/scripts/serve_data.py > /tmp/serve_data_old.py
+    python scripts/bench_serve.py --compare /tmp/serve_data_old.py
+"""
+import sys
+import os
+import argparse
+import http.client
+import re
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+# Add project root directory to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from backend import create_app, db
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.importer import GTFSImporter, RealtimeImporter
+from backend.services.data.live_state import LiveState
+from backend.services.data.partitions import partition_manager
+from bench_gtfs_import import build_gtfs_zip
+from bench_ingest import build_cycles
+
+
+def prepare(workdir, trips, cycles):
+    """database, live state and static files in workdir, laid out like the project directory"""
+    data_dir = os.path.join(workdir, 'backend', 'data')
+    os.makedirs(data_dir)
+    zip_path = os.path.join(workdir, 'gtfs.zip')
+    build_gtfs_zip(zip_path, stops=500, trips=trips, stops_per_trip=20)
+    cycles_data = build_cycles(cycles, 100, 20, 0.2)
+    shift = int(time.time()) - max(cycles_data[-1]['feeds'].values())
+    state = LiveState(os.path.join(data_dir, 'live_state.pickle'))
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(data_dir, 'mta_data.db')}"})
+    with app.app_context():
+        db.create_all()
+        partition_manager.setup()
+        GTFSImporter().import_gtfs(zip_path, 'subway')
+        tracker = ChangeTracker()
+        for cycle in cycles_data:
+            cycle['feeds'] = {feed_id: timestamp + shift for feed_id, timestamp in cycle['feeds'].items()}
+            RealtimeImporter.import_realtime_data(cycle, 'subway', tracker=tracker)
+            state.update('subway', cycle)
+            state.swap()
+        db.session.remove()
+        db.engine.dispose()
+    shutil.copy(os.path.join(project_root, 'frontend', 'templates', 'passenger_view.html'), workdir)
+
+
+def start_server(script, workdir, log_path, timeout=60):
+    """start a server script in workdir, return the process and its port once it listens"""
+    env = dict(os.environ, PYTHONPATH=project_root)
+    log = open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, script], cwd=workdir, env=env, stdout=log, stderr=log)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with open(log_path) as f:
+            match = re.search(r'Server running on http://localhost:(\d+)', f.read())
+        if match:
+            return process, int(match.group(1))
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{script} did not start, see {log_path}")
+
+
+def load(port, path, clients, duration, conditional=False):
+    """latencies of successful requests, the failed ones and the body bytes received"""
+    latencies = []
+    errors = []
+    received = []
+    stop = time.perf_counter() + duration
+
+    def client():
+        headers = {'Accept-Encoding': 'gzip'} if conditional else {}
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                connection = http.client.HTTPConnection('localhost', port, timeout=30)
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                received.append(len(response.read()))
+                connection.close()
+                if response.status in (200, 304):
+                    latencies.append(time.perf_counter() - start)
+                    if conditional and response.getheader('ETag'):
+                        headers['If-None-Match'] = response.getheader('ETag')
+                else:
+                    errors.append(response.status)
+            except OSError as e:
+                errors.append(type(e).__name__)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test /api/status of serve_data.py')
+    parser.add_argument('--compare', action='append', default=[], help='another server script to load test first')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per server')
+    parser.add_argument('--path', default='/api/status')
+    parser.add_argument('--trips', type=int, default=5000, help='trips of the synthetic static feed')
+    parser.add_argument('--cycles', type=int, default=10, help='synthetic poll cycles')
+    parser.add_argument('--conditional', action='store_true', help='accept gzip and revalidate with If-None-Match')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_serve_')
+    prepare(workdir, args.trips, args.cycles)
+    print(f"{args.clients} clients, {args.duration:.0f} s per server, GET {args.path}"
+          f"{' (conditional, gzip)' if args.conditional else ''}")
+    print(f"{'server':<40} {'requests':>9} {'req/s':>8} {'p50':>9} {'p99':>9} {'errors':>7} {'bytes/req':>10}")
+    for index, script in enumerate(args.compare + [os.path.join(project_root, 'scripts', 'serve_data.py')]):
+        process, port = start_server(os.path.abspath(script), workdir, os.path.join(workdir, f"server{index}.log"))
+        try:
+            load(port, args.path, 1, 1)  # warm up
+            latencies, errors, received = load(port, args.path, args.clients, args.duration, args.conditional)
+        finally:
+            process.terminate()
+            process.wait()
+        if len(latencies) >= 2:
+            percentiles = statistics.quantiles(latencies, n=100)
+            p50, p99 = f"{percentiles[49] * 1000:6.1f} ms", f"{percentiles[98] * 1000:6.1f} ms"
+        else:
+            p50 = p99 = '-'
+        print(f"{os.path.basename(script):<40} {len(latencies):9d} {len(latencies) / args.duration:8.1f} "
+              f"{p50:>9} {p99:>9} {len(errors):7d} {sum(received) / max(len(received), 1):10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Compare the event stream of scripts/serve_data.py with pulling full snapshots.
+
+A scratch working directory is prepared like bench_serve.py does, and the
+server is started there. This script then plays the collector: every
+--interval seconds it stages a synthetic poll cycle into the live state and
+publishes a new generation.
+
+Two phases with --clients clients each, half of them subscribed to one
+route:
+
+- pull: once per cycle every client downloads the full state it follows,
+  as dashboards polling on a timer do (here the snapshot event of
+  /api/stream, the connection is closed after it)
+- stream: every client stays connected to /api/stream and reads the
+  deltas, next to one client that connects and never reads
+
+Bytes received per client and cycle, server CPU per cycle (from
+/proc/<pid>/stat) and, for the stream, the delay from publishing a
+generation to a client receiving its delta are printed per phase.
+"""
+import sys
+import os
+import argparse
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+# Add project root directory to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from backend.services.data.live_state import LiveState
+from bench_ingest import build_cycles
+from bench_serve import prepare, start_server
+
+
+def cpu_seconds(pid):
+    """user and system CPU time of a process"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class Collector:
+    """publishes a synthetic poll cycle every interval, remembering when each generation went out"""
+
+    def __init__(self, path, cycles, interval):
+        self.state = LiveState(path)
+        self.cycles = cycles
+        self.interval = interval
+        self.published = {}  # generation -> time.time()
+
+    def run(self, count):
+        for cycle in self.cycles[:count]:
+            time.sleep(self.interval)
+            shift = int(time.time()) - max(cycle['feeds'].values())
+            cycle = dict(cycle, feeds={feed_id: timestamp + shift for feed_id, timestamp in cycle['feeds'].items()})
+            self.state.update('subway', cycle)
+            snapshot = self.state.swap()
+            self.published[snapshot.generation] = time.time()
+
+
+def read_events(port, query, stop):
+    """connect to /api/stream and yield (event, generation, bytes, time received) until stop is set"""
+    sock = socket.create_connection(('localhost', port))
+    sock.settimeout(0.5)
+    sock.sendall(f"GET /api/stream{query} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    buffer = b''
+    try:
+        while not stop.is_set():
+            try:
+                data = sock.recv(1 << 16)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            buffer += data
+            while b'\n\n' in buffer:
+                block, buffer = buffer.split(b'\n\n', 1)
+                fields = dict(line.split(b': ', 1) for line in block.split(b'\n') if b': ' in line)
+                if b'event' in fields:
+                    yield fields[b'event'].decode(), int(fields[b'id']), len(block) + 2, time.time()
+    finally:
+        sock.close()
+
+
+def pull_client(port, query, interval, stop, events):
+    while not stop.is_set():
+        for event in read_events(port, query, stop):
+            events.append(event)
+            break  # the snapshot, sent first
+        stop.wait(interval)
+
+
+def stream_client(port, query, interval, stop, events):
+    events.extend(read_events(port, query, stop))
+
+
+def run_phase(target, args_of_client, clients, collector, cycles, pid):
+    stop = threading.Event()
+    results = [[] for _ in range(clients)]
+    threads = [threading.Thread(target=target, args=args_of_client(index) + (stop, results[index]))
+               for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(collector.interval)  # connected, first snapshots read
+    start_cpu = cpu_seconds(pid)
+    collector.run(cycles)
+    time.sleep(2)  # the last generation reaches the clients
+    cpu = cpu_seconds(pid) - start_cpu
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare /api/stream with pulling full snapshots')
+    parser.add_argument('--clients', type=int, default=20, help='clients per phase')
+    parser.add_argument('--cycles', type=int, default=10, help='collector cycles per phase')
+    parser.add_argument('--interval', type=float, default=3, help='seconds between collector cycles')
+    parser.add_argument('--trips', type=int, default=100, help='trips per synthetic feed')
+    parser.add_argument('--change-rate', type=float, default=0.2, help='share of trips and vehicles changed per cycle')
+    parser.add_argument('--route', default='A', help='route followed by half of the stream clients')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_stream_')
+    prepare(workdir, 5000, 1)
+    state_path = os.path.join(workdir, 'backend', 'data', 'live_state.pickle')
+    cycles = build_cycles(2 * args.cycles + 1, args.trips, 20, args.change_rate)[1:]
+    collector = Collector(state_path, cycles, args.interval)
+    process, port = start_server(os.path.join(project_root, 'scripts', 'serve_data.py'), workdir,
+                                 os.path.join(workdir, 'server.log'))
+    phases = {}
+    try:
+        for name, target in (('pull', pull_client), ('stream', stream_client)):
+            collector.cycles = cycles[len(collector.published):]
+            if name == 'stream':
+                slow = socket.create_connection(('localhost', port))
+                slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+                slow.sendall(b"GET /api/stream HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            phases[name] = run_phase(
+                target, lambda index: (port, f"?route={args.route}" if index % 2 else '', args.interval),
+                args.clients, collector, args.cycles, process.pid
+            )
+        slow.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"{args.clients} clients, {args.cycles} cycles {args.interval:.0f} s apart, change rate {args.change_rate}")
+    print(f"{'':<24} {'bytes/client/cycle':>19} {'server CPU/cycle':>17} {'delay p50':>10} {'delay max':>10}")
+    for name, (results, cpu) in phases.items():
+        for label, indexes in (('everything', range(0, args.clients, 2)),
+                               (f"route={args.route}", range(1, args.clients, 2))):
+            received, delays = [], []
+            for index in indexes:
+                for event, generation, size, received_at in results[index]:
+                    # the stream's initial snapshot is not part of the cycles
+                    if generation in collector.published and (name == 'pull' or event == 'delta'):
+                        received.append(size)
+                        if name == 'stream':
+                            delays.append(received_at - collector.published[generation])
+            per_cycle = sum(received) / max(len(indexes), 1) / args.cycles
+            p50 = f"{statistics.median(delays) * 1000:7.0f} ms" if delays else '-'
+            worst = f"{max(delays) * 1000:7.0f} ms" if delays else '-'
+            print(f"{name + ', ' + label:<24} {per_cycle:19.0f} {'':>17} {p50:>10} {worst:>10}")
+        print(f"{name + ', all clients':<24} {'':>19} {cpu / args.cycles * 1000:14.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
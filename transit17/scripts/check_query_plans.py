@@ -0,0 +1,127 @@
+"""
+Check that the queries behind the API use the indexes meant for them.
+
+Every query shape is run through EXPLAIN QUERY PLAN against a database (a
+scratch one with a few synthetic poll cycles if --database is omitted);
+each table or partition the plan reads must be searched through the
+expected index rather than scanned. Exits with status 1 if any plan does
+not match.
+"""
+import sys
+import os
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import desc
+from backend import create_app, db
+from backend.models import ServiceAlert, StopTime, StopTimeUpdate, Trip, TripUpdate, VehiclePosition
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.partitions import partition_manager
+
+
+def query_shapes():
+    """(name, query, table, index) of the queries behind the API, index names without the partition suffix"""
+    now = datetime.now()
+    active = (ServiceAlert.active_period_start <= now) & (
+        (ServiceAlert.active_period_end >= now) | (ServiceAlert.active_period_end.is_(None))
+    )
+    return [
+        ('latest trips of a route',
+         TripUpdate.query.filter_by(end_marker=False, route_id='A').order_by(desc(TripUpdate.feed_timestamp)).limit(10),
+         'trip_updates', 'ix_trip_updates_route_id_feed_timestamp'),
+        ('trip states of a route at a time',
+         TripUpdate.query.filter(TripUpdate.route_id == 'A', TripUpdate.feed_timestamp <= now),
+         'trip_updates', 'ix_trip_updates_route_id_feed_timestamp'),
+        ('latest vehicles of a route',
+         VehiclePosition.query.filter_by(end_marker=False, route_id='A').order_by(
+             desc(VehiclePosition.feed_timestamp)).limit(10),
+         'vehicle_positions', 'ix_vehicle_positions_route_id_feed_timestamp'),
+        ('recent vehicles of a route',
+         VehiclePosition.query.filter(VehiclePosition.route_id == 'A',
+                                      VehiclePosition.feed_timestamp >= now - timedelta(minutes=5)).limit(10),
+         'vehicle_positions', 'ix_vehicle_positions_route_id_feed_timestamp'),
+        ('next arrivals at a stop',
+         StopTimeUpdate.query.filter(StopTimeUpdate.stop_id == '101N', StopTimeUpdate.arrival_time >= now,
+                                     StopTimeUpdate.arrival_time <= now + timedelta(minutes=30)).order_by(
+             StopTimeUpdate.arrival_time).limit(5),
+         'stop_time_updates', 'ix_stop_time_updates_stop_id_arrival_time'),
+        ('next arrivals',
+         StopTimeUpdate.query.filter(StopTimeUpdate.arrival_time >= now,
+                                     StopTimeUpdate.arrival_time <= now + timedelta(minutes=30)).order_by(
+             StopTimeUpdate.arrival_time).limit(50),
+         'stop_time_updates', 'ix_stop_time_updates_arrival_time'),
+        ('next scheduled departures at a stop',
+         StopTime.query.join(Trip).filter(StopTime.stop_id == '101N', StopTime.departure_seconds >= 3600).order_by(
+             StopTime.departure_seconds).limit(5),
+         'stop_times', 'ix_stop_times_stop_id_departure_seconds'),
+        ('active alerts',
+         ServiceAlert.query.filter(active).limit(10),
+         'service_alerts', 'ix_service_alerts_active_period'),
+        ('active alerts of a route',
+         ServiceAlert.query.filter(active, ServiceAlert.informed_entity_id == 'A'),
+         'service_alerts', 'ix_service_alerts_entity_active_period'),
+    ]
+
+
+def explain(query):
+    compiled = query.statement.compile(db.engine)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    connection = db.session.connection()
+    return [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters)]
+
+
+def check(name, query, table_name, index_name):
+    """the plan lines of every partition (or the table) of table_name must use index_name"""
+    plan = explain(query)
+    if table_name in ('trip_updates', 'stop_time_updates', 'vehicle_positions'):
+        tables = [partition_manager.partition_name(table_name, key) for key in partition_manager.partitions(table_name)]
+        indexes = {table: index_name.replace(table_name, table, 1) for table in tables}
+    else:
+        indexes = {table_name: index_name}
+    problems = []
+    for table, index in indexes.items():
+        lines = [line for line in plan if line.split(' ')[1:2] == [table]]
+        if not lines:
+            problems.append(f"{table} not in plan")
+        elif not all(f"INDEX {index} " in f"{line} " for line in lines):
+            problems.append('; '.join(lines))
+    print(f"{'ok  ' if not problems else 'FAIL'} {name}: {index_name}")
+    for problem in problems:
+        print(f"       {problem}")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the query plans of the API queries')
+    parser.add_argument('--database', help='SQLite database file, a scratch database if omitted')
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args()
+
+    if args.database:
+        uri = f"sqlite:///{os.path.abspath(args.database)}"
+    else:
+        uri = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='check_query_plans_'), 'plans.db')}"
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri})
+    with app.app_context():
+        db.create_all()
+        partition_manager.setup()
+        if not args.database:
+            from bench_ingest import build_cycles
+            for cycle in build_cycles(2, 20, 10, 0.5):
+                RealtimeImporter.import_realtime_data(cycle, 'subway')
+            db.session.execute('ANALYZE')
+
+        ok = True
+        for name, query, table_name, index_name in query_shapes():
+            if args.verbose:
+                print('\n'.join(f"       {line}" for line in explain(query)))
+            ok = check(name, query, table_name, index_name) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
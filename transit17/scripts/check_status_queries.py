@@ -0,0 +1,133 @@
+"""
+Check that /api/status of scripts/serve_data.py runs a constant number of
+SQL statements.
+
+Scratch databases of two sizes get a static feed whose routes and stops
+match synthetic poll cycles, plus a few active service alerts. The status
+payload is built against each, once from the live state and once from the
+database alone, counting the statements sent to SQLite. Exits with status 1
+if the count grows with the data.
+"""
+import sys
+import os
+import argparse
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from backend import create_app, db
+from backend.config.mta_endpoints import SUBWAY_FEEDS
+from backend.models import ServiceAlert
+from backend.services.data import live_state
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.importer import GTFSImporter, RealtimeImporter
+from backend.services.data.partitions import partition_manager
+from bench_ingest import build_cycles
+from serve_data import MTARequestHandler
+
+STOPS_PER_TRIP = 10
+
+
+def build_static_zip(path, extra_routes):
+    """routes and stops of the synthetic subway feeds, plus extra routes serving the same stops, to path"""
+    lines = [feed_id[0].upper() for feed_id in SUBWAY_FEEDS]
+    routes = lines + [f"X{route}" for route in range(extra_routes)]
+    trips = [(route, f"{route}_{trip}", lines[index % len(lines)])
+             for index, route in enumerate(routes) for trip in range(3)]
+    with zipfile.ZipFile(path, 'w') as gtfs_zip:
+        gtfs_zip.writestr('routes.txt', 'agency_id,route_id,route_short_name,route_long_name,route_type\n' + ''.join(
+            f"MTA NYCT,{route},{route},Line {route},1\n" for route in routes
+        ))
+        gtfs_zip.writestr('stops.txt', 'stop_id,stop_name,stop_lat,stop_lon\n' + ''.join(
+            f"{line}{seq:02d}N,Station {line}{seq:02d},40.7,-74.0\n" for line in lines for seq in range(STOPS_PER_TRIP)
+        ))
+        gtfs_zip.writestr('trips.txt', 'route_id,trip_id,service_id\n' + ''.join(
+            f"{route},{trip_id},Weekday\n" for route, trip_id, _ in trips
+        ))
+        gtfs_zip.writestr('stop_times.txt', 'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n' + ''.join(
+            f"{trip_id},08:{seq:02d}:00,08:{seq:02d}:30,{line}{seq:02d}N,{seq}\n"
+            for _, trip_id, line in trips for seq in range(STOPS_PER_TRIP)
+        ))
+
+
+def count_statements(app, state_path):
+    """statements and non-empty sections of one status payload, with the live state at state_path"""
+    live_state.live_state_reader = live_state.LiveStateReader(state_path, check_interval=0)
+    live_state.live_state_reader.current()  # load the snapshot before counting
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # a request handler without a connection, only its sections are called
+    handler = MTARequestHandler.__new__(MTARequestHandler)
+    handler.server = SimpleNamespace(app=app)
+    with app.app_context():
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            data = handler.get_status()
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        db.session.remove()
+    return len(statements), sorted(key for key, section in data.items() if section)
+
+
+def prepare(workdir, size):
+    """scratch database and live state of one size"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, f'status_{size}.db')}"})
+    state = live_state.LiveState(os.path.join(workdir, f'live_state_{size}.pickle'))
+    cycles = build_cycles(3, size, STOPS_PER_TRIP, 0.2)
+    shift = int(datetime.now().timestamp()) - max(cycles[-1]['feeds'].values())
+    with app.app_context():
+        db.create_all()
+        partition_manager.setup()
+        zip_path = os.path.join(workdir, f'gtfs_{size}.zip')
+        build_static_zip(zip_path, size)
+        GTFSImporter().import_gtfs(zip_path, 'subway')
+        now = datetime.now()
+        db.session.add_all(
+            ServiceAlert(header_text=f"{line} trains are delayed", description_text='Signal problems',
+                         active_period_start=now - timedelta(hours=1), feed_timestamp=now, agency_id='subway')
+            for line in ('A', 'G', 'X1')
+        )
+        db.session.commit()
+        tracker = ChangeTracker()
+        for cycle in cycles:
+            cycle['feeds'] = {feed_id: timestamp + shift for feed_id, timestamp in cycle['feeds'].items()}
+            RealtimeImporter.import_realtime_data(cycle, 'subway', tracker=tracker)
+            state.update('subway', cycle)
+            state.swap()
+        db.session.remove()
+    return app, state.path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that /api/status runs a constant number of statements')
+    parser.add_argument('--sizes', type=int, nargs=2, default=[5, 50],
+                        help='trips per synthetic feed and extra static routes of the two databases')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='check_status_queries_')
+    counts = {}
+    print(f"{'size':>6} {'live state':>12} {'database':>12}  sections with data")
+    for size in args.sizes:
+        app, state_path = prepare(workdir, size)
+        live, live_sections = count_statements(app, state_path)
+        database, database_sections = count_statements(app, os.path.join(workdir, 'missing.pickle'))
+        counts[size] = (live, database)
+        print(f"{size:6d} {live:12d} {database:12d}  {', '.join(live_sections)} / {', '.join(database_sections)}")
+
+    if len(set(counts.values())) > 1:
+        print("statement count of /api/status grows with the data")
+        sys.exit(1)
+    print("statement count of /api/status is constant")
+
+
+if __name__ == '__main__':
+    main()
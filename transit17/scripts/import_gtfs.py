@@ -1,12 +1,13 @@
 import sys
 import os
 import logging
-from datetime import datetime
 
 # Add project root directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backend import create_app, db
+from backend import create_app
+from backend.services.data.gtfs_staging import ParallelGTFSImporter
+from backend.services.data.gtfs_versions import GTFSUpdater
 from backend.services.data.importer import GTFSImporter
 from backend.config.settings import GTFS_URLS
 
@@ -17,19 +18,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def import_gtfs_data():
-    """Import GTFS static data for all agencies"""
+def import_gtfs_data(full=False):
+    """
+    Import GTFS static data for all agencies
+
+    By default every feed is applied as a new version: unchanged files are
+    skipped and only changed rows are written. full=True bulk loads every
+    file instead, for an empty database.
+    """
     app = create_app()
     with app.app_context():
-        importer = GTFSImporter()
+        importer = GTFSImporter() if full else GTFSUpdater()
         
         for agency_id, url in GTFS_URLS.items():
             try:
                 logger.info(f"Importing GTFS data for {agency_id}")
-                importer.import_gtfs(url, agency_id)
+                if full:
+                    for stats in importer.import_gtfs(url, agency_id):
+                        logger.info(f"{agency_id} {stats['file']}: {stats['rows']} rows in {stats['seconds']} s, "
+                                    f"peak RSS {stats['peak_rss_mb']} MiB")
+                else:
+                    result = importer.update_gtfs(url, agency_id)
+                    for file_name, stats in result['files'].items():
+                        logger.info(f"{agency_id} {file_name}: {stats}")
+                    logger.info(f"{agency_id} is at version {result['version']} after {result['seconds']} s")
                 logger.info(f"Successfully imported GTFS data for {agency_id}")
             except Exception as e:
                 logger.error(f"Error importing GTFS data for {agency_id}: {e}")
 
+def import_gtfs_parallel(urls=GTFS_URLS, workers=None):
+    """
+    Parse every file of every agency in a process pool into staging tables,
+    then swap them in for the live tables in one transaction
+    """
+    app = create_app()
+    with app.app_context():
+        importer = ParallelGTFSImporter(**({'workers': workers} if workers else {}))
+        result = importer.import_all(urls)
+        for stats in sorted(result['workers'], key=lambda stats: -stats['seconds']):
+            logger.info(f"worker {stats['pid']}: {stats['agency_id']} {stats['file']} {stats['rows']} rows "
+                        f"in {stats['seconds']} s, peak RSS {stats['peak_rss_mb']} MiB")
+        logger.info(f"download {result['download']} s, parse {result['parse']} s, merge {result['merge']} s, "
+                    f"total {result['total']} s; versions {result['versions']}")
+        return result
+
 if __name__ == '__main__':
-    import_gtfs_data() 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Import GTFS static data for all agencies')
+    parser.add_argument('--full', action='store_true', help='bulk load every file instead of applying changes')
+    parser.add_argument('--parallel', action='store_true',
+                        help='rebuild the static tables of all agencies with a process pool and staging tables')
+    parser.add_argument('--workers', type=int, help='worker processes of --parallel')
+    args = parser.parse_args()
+    if args.parallel:
+        import_gtfs_parallel(workers=args.workers)
+    else:
+        import_gtfs_data(full=args.full)
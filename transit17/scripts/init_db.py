@@ -4,18 +4,74 @@ import os
 # Add project root directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
 from backend import create_app, db
+from backend.services.data.importer import GTFSImporter
+from backend.services.data.partitions import PARTITIONED_TABLES, partition_manager
 from backend.models import (
     TripUpdate, StopTimeUpdate, VehiclePosition, ServiceAlert,
-    Route, Stop, Trip, StopTime
+    Route, Stop, Trip, StopTime, route_stops
 )
 
+def add_missing_columns():
+    """Add columns that were added to the models after the tables were created"""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        # the realtime tables are views, the partition manager migrates their partitions
+        if table.name in PARTITIONED_TABLES or not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_sql = CreateColumn(column).compile(dialect=db.engine.dialect)
+                db.session.execute(f"ALTER TABLE {table.name} ADD COLUMN {column_sql}")
+                print(f"Added column {table.name}.{column.name}")
+    db.session.commit()
+
+def add_missing_indexes():
+    """Create indexes that were added to the models after the tables were created"""
+    for table in db.metadata.sorted_tables:
+        if table.name in PARTITIONED_TABLES:
+            continue
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def fill_schedule_seconds():
+    """Compute the integer schedule times of stop times imported before they existed"""
+    for column in ('arrival', 'departure'):
+        text_column = f"trim({column}_time)"
+        seconds = (
+            f"CAST(substr({text_column}, 1, instr({text_column}, ':') - 1) AS INTEGER) * 3600 + "
+            f"CAST(substr({text_column}, instr({text_column}, ':') + 1, 2) AS INTEGER) * 60 + "
+            f"CAST(substr({text_column}, -2) AS INTEGER)"
+        )
+        result = db.session.execute(
+            f"UPDATE stop_times SET {column}_seconds = {seconds} "
+            f"WHERE {column}_seconds IS NULL AND {column}_time LIKE '%:%:%'"
+        )
+        if result.rowcount:
+            print(f"Filled stop_times.{column}_seconds of {result.rowcount} rows")
+    db.session.commit()
+
+def fill_route_stops():
+    """Build the stop -> routes index of stop times imported before it was maintained"""
+    if db.session.query(route_stops).first() is None and db.session.query(StopTime.id).first() is not None:
+        GTFSImporter.refresh_route_stops()
+        print(f"Filled route_stops with {db.session.query(route_stops).count()} rows")
+    db.session.commit()
+
 def init_db():
     """Initialize database"""
     app = create_app()
     with app.app_context():
         # Create all tables
         db.create_all()
+        add_missing_columns()
+        fill_schedule_seconds()
+        fill_route_stops()
+        add_missing_indexes()
+        partition_manager.setup()
         print("Database initialized successfully.")
 
 def clear_db():
@@ -0,0 +1,76 @@
+"""
+Rebuild the realtime tables from the raw feed archive.
+
+    python scripts/rebuild_from_archive.py --info
+    python scripts/rebuild_from_archive.py --start 2024-01-01T06:00 --end 2024-01-01T10:00
+    python scripts/rebuild_from_archive.py --feed subway/ace --start 2024-01-01T06:00
+"""
+import sys
+import os
+import argparse
+from datetime import datetime
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import create_app
+from backend.services.data.archive import RawFeedArchive
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.importer import RealtimeImporter
+from backend.services.mta.base import BaseMTAService
+
+
+def show_info(archive):
+    stats = archive.get_stats()
+    if not stats:
+        print("Archive is empty")
+        return
+    for feed, feed_stats in stats.items():
+        print(f"{feed:<20} {feed_stats['snapshots']:7d} snapshots in {feed_stats['segments']} segments "
+              f"({feed_stats['first_day']} - {feed_stats['last_day']}), "
+              f"{feed_stats['bytes_stored'] / 1024 / 1024:.1f} MiB stored, ratio {feed_stats['compression_ratio']}")
+
+
+def rebuild(archive, feeds, start, end, tracker=None):
+    service = BaseMTAService()
+    for feed_type, feed_id in feeds:
+        snapshots = rows = 0
+        for timestamp, feed in archive.iter_snapshots(feed_type, feed_id, start, end):
+            trip_updates, vehicle_positions = service.decode_feed(feed)
+            for entity in trip_updates + vehicle_positions:
+                entity['feed_id'] = feed_id
+            counts = RealtimeImporter.import_realtime_data({
+                'trip_updates': trip_updates,
+                'vehicle_positions': vehicle_positions,
+                'feeds': {feed_id: timestamp}
+            }, feed_type, feed_timestamp=datetime.fromtimestamp(timestamp), tracker=tracker)
+            rows += counts['trip_updates'] + counts['stop_time_updates'] + counts['vehicle_positions']
+            snapshots += 1
+        print(f"{feed_type}/{feed_id}: {snapshots} snapshots, {rows} rows imported")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild realtime tables from the raw feed archive')
+    parser.add_argument('--info', action='store_true', help='only describe the archive')
+    parser.add_argument('--feed', action='append', help='feed_type/feed_id, all archived feeds if omitted')
+    parser.add_argument('--start', type=datetime.fromisoformat, help='local ISO time')
+    parser.add_argument('--end', type=datetime.fromisoformat, help='local ISO time')
+    parser.add_argument('--full', action='store_true', help='write every snapshot in full instead of only changes')
+    args = parser.parse_args()
+
+    archive = RawFeedArchive()
+    if args.info:
+        show_info(archive)
+        return
+
+    feeds = [tuple(feed.split('/', 1)) for feed in args.feed] if args.feed else archive.feeds()
+    start = int(args.start.timestamp()) if args.start else None
+    end = int(args.end.timestamp()) if args.end else None
+
+    app = create_app()
+    with app.app_context():
+        rebuild(archive, feeds, start, end, tracker=None if args.full else ChangeTracker())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Record MTA feed responses to an archive and replay them offline.
+
+    python scripts/replay_feeds.py record feeds.mtar --duration 600
+    python scripts/replay_feeds.py serve feeds.mtar --speed 10 --port 8765
+    python scripts/replay_feeds.py info feeds.mtar
+
+`serve` runs a local stand-in for the MTA endpoints; start the collector or
+app with the printed MTA_BASE_URL / MTA_STATUS_URL to use it.
+"""
+import sys
+import os
+import argparse
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.config.mta_endpoints import BASE_URL, SUBWAY_STATUS_URL
+from backend.services.mta import MTAServiceFactory
+from backend.services.mta.manager import APIManager
+from backend.services.mta.replay import (
+    FeedArchive, ReplayClock, ReplayServer, install_recorder, uninstall_recorder
+)
+
+
+def record(args):
+    """Poll the real feeds on the collector's schedule and record every response"""
+    manager = APIManager()
+    recorder = install_recorder(args.archive)
+    deadline = time.time() + args.duration
+    print(f"Recording to {args.archive} for {args.duration}s...")
+    try:
+        while time.time() < deadline:
+            manager.get_all_data()
+            MTAServiceFactory.get_service('subway').get_status_data()
+            print(f"  {datetime.now().strftime('%H:%M:%S')} {recorder.records} responses recorded")
+            time.sleep(min(max(0.5, manager.seconds_until_next_poll()), max(0.0, deadline - time.time())))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        uninstall_recorder(recorder)
+    print(f"Recorded {recorder.records} responses")
+
+
+def serve(args):
+    """Serve an archive over HTTP, following a replay clock"""
+    archive = FeedArchive(args.archive)
+    clock = ReplayClock(archive.start, speed=args.speed)
+    server = ReplayServer(archive, clock, host=args.host, port=args.port)
+    print(f"Replaying {len(archive.records)} responses at {args.speed}x on {server.address}")
+    print(f"  MTA_BASE_URL={server.address}{urlsplit(BASE_URL).path}")
+    print(f"  MTA_STATUS_URL={server.address}{urlsplit(SUBWAY_STATUS_URL).path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+def info(args):
+    """Print what an archive contains"""
+    archive = FeedArchive(args.archive)
+    if not archive.records:
+        print("Archive is empty")
+        return
+    print(f"{args.archive}: {len(archive.records)} responses, {os.path.getsize(args.archive) / 1024:.1f} KiB")
+    print(f"  from {datetime.fromtimestamp(archive.start)} to {datetime.fromtimestamp(archive.end)} "
+          f"({archive.end - archive.start:.0f}s)")
+    for url in archive.urls:
+        count = sum(1 for record in archive.records if record.url == url)
+        print(f"  {count:5d}  {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and replay MTA feed responses')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help='record live feed responses')
+    record_parser.add_argument('archive')
+    record_parser.add_argument('--duration', type=float, default=300, help='seconds to record')
+    record_parser.set_defaults(func=record)
+
+    serve_parser = subparsers.add_parser('serve', help='serve an archive as a local MTA stand-in')
+    serve_parser.add_argument('archive')
+    serve_parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 1 = real time')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.set_defaults(func=serve)
+
+    info_parser = subparsers.add_parser('info', help='describe an archive')
+    info_parser.add_argument('archive')
+    info_parser.set_defaults(func=info)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
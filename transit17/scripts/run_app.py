@@ -7,5 +7,5 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from backend import create_app
 
 if __name__ == '__main__':
-    app = create_app()
+    app = create_app(readonly=True)
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -1,4 +1,10 @@
+import sys
+import os
+
+# Add project root directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from backend.services.data.scheduler import DataScheduler
 
 if __name__ == '__main__':
-    DataScheduler.run_scheduler() 
\ No newline at end of file
+    DataScheduler.run_scheduler()
@@ -1,5 +1,6 @@
 import sys
 import os
+import signal
 
 # Add project root directory to Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -15,6 +16,8 @@ logging.basicConfig(
 )
 
 if __name__ == '__main__':
+    # stopping the service raises SystemExit, so the collector flushes its archive and history
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app = create_app()
     with app.app_context():
         collector = DataCollector()
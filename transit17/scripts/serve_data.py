@@ -1,26 +1,120 @@
 import os
 import sys
 import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from datetime import datetime, timedelta
 import logging
 from pathlib import Path
 import socket
 import time
+from urllib.parse import urlsplit
+from google.transit import gtfs_realtime_pb2
 
 # Add the project root directory to the Python path
 project_root = str(Path(__file__).parent.parent)
 sys.path.insert(0, project_root)
 
-from backend import create_app
-from backend.models.static import Route, Stop, Trip, StopTime
-from backend.models.realtime import ServiceAlert, VehiclePosition, StopTimeUpdate
-from backend.config.settings import StorageConfig
+from backend import create_app, db
+from sqlalchemy import desc, func
+from backend.models.static import Route, Stop, route_stops
+from backend.models.realtime import ServiceAlert, TripUpdate, VehiclePosition, StopTimeUpdate
+from backend.config.settings import SERVE_WORKERS, SERVE_BACKLOG, SERVE_REQUEST_TIMEOUT
+from backend.services.data.live_state import current_snapshot
+from backend.services.data.query import current_trip_updates, current_vehicles
+from backend.services.data.live_stream import LiveStream, Subscription
+from backend.services.data.payloads import PayloadCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# files served from memory: URL path -> content type and candidate files, the first existing one is read
+STATIC_FILES = {
+    '/passenger_view.html': ('text/html', ['passenger_view.html',
+                                           os.path.join(project_root, 'frontend', 'templates', 'passenger_view.html')])
+}
+
+# payloads materialized once per live state generation: URL path -> handler method building it
+PAYLOADS = {
+    '/api/status': 'get_status'
+}
+
+class DeadlineExceeded(Exception):
+    """The request ran past its deadline"""
+
+@contextmanager
+def query_deadline(deadline):
+    """
+    interrupt SQLite statements of the current session still running at the
+    deadline (a time.monotonic() value), they fail with "interrupted"
+    """
+    connection = db.session.connection().connection
+    connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+    try:
+        yield
+    finally:
+        connection.set_progress_handler(None, 10000)
+
+def first_rows_per_key(columns, key_column, order_by, limit, *filters):
+    """
+    Get the first `limit` rows by order_by of every value of key_column, in
+    one query: rows numbered by a row_number() window, instead of a query
+    per key
+
+    Args:
+        columns (tuple): model columns to select, key_column among them
+        filters: filter the rows before they are numbered
+
+    Returns:
+        list: rows with the columns as attributes
+    """
+    ranked = db.session.query(
+        *columns, func.row_number().over(partition_by=key_column, order_by=order_by).label('rank')
+    ).filter(*filters).subquery()
+    return db.session.query(*(ranked.c[column.key] for column in columns)).filter(
+        ranked.c.rank <= limit
+    ).order_by(ranked.c.rank).all()
+
+def stop_status(schedule_relationship):
+    """name of a GTFS-rt stop time update schedule relationship, stored as its number"""
+    if schedule_relationship is None or schedule_relationship == '':
+        return 'Unknown'
+    try:
+        return gtfs_realtime_pb2.TripUpdate.StopTimeUpdate.ScheduleRelationship.Name(int(schedule_relationship))
+    except ValueError:
+        return str(schedule_relationship)
+
+def accepts_gzip(accept_encoding):
+    """whether an Accept-Encoding header allows gzip (not with q=0)"""
+    for coding in (accept_encoding or '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            quality = params.replace(' ', '')
+            if not quality.startswith('q='):
+                return True
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+def load_static_files():
+    """read the static files into memory, path -> (content type, body)"""
+    files = {}
+    for path, (content_type, candidates) in STATIC_FILES.items():
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                with open(candidate, 'rb') as f:
+                    files[path] = (content_type, f.read())
+                break
+        else:
+            logger.warning(f"No file found for {path}")
+    return files
+
 def find_available_port(start_port=5000, max_port=5050):
     """Find an available port to run the server on"""
     for port in range(start_port, max_port + 1):
@@ -32,77 +126,205 @@ def find_available_port(start_port=5000, max_port=5050):
             continue
     raise RuntimeError(f"No available ports found between {start_port} and {max_port}")
 
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTP server handling connections on a fixed pool of worker threads
+
+    Accepted connections wait for a free worker; once `backlog` of them are
+    waiting, new ones are answered 503 right away instead of queueing
+    without bound. The Flask app, the static files and the materialized
+    payloads are shared by all workers. Event stream connections are handed
+    over to the LiveStream thread once their headers are sent, freeing the
+    worker.
+    """
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, app, workers=SERVE_WORKERS, backlog=SERVE_BACKLOG,
+                 request_timeout=SERVE_REQUEST_TIMEOUT):
+        super().__init__(server_address, handler_class)
+        self.app = app
+        self.static_files = load_static_files()
+        self.payloads = PayloadCache()
+        self.stream = LiveStream(app)
+        self.request_timeout = request_timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='serve')
+        self.slots = threading.BoundedSemaphore(workers + backlog)
+        self.local = threading.local()
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.reject(request)
+            self.shutdown_request(request)
+            return
+        self.pool.submit(self.process_request_worker, request, client_address, time.monotonic())
+
+    def process_request_worker(self, request, client_address, accepted_at):
+        # the deadline counts from the accept, time spent waiting for a worker included
+        self.local.deadline = accepted_at + self.request_timeout
+        self.local.detached = False
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            # a detached connection belongs to the live stream now
+            if not self.local.detached:
+                self.shutdown_request(request)
+            self.slots.release()
+
+    def reject(self, request):
+        body = json.dumps({'error': 'Server busy'}).encode()
+        try:
+            request.sendall(
+                b'HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\nRetry-After: 1\r\n'
+                + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+            )
+        except OSError:
+            pass
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+        self.stream.close()
+
 class MTARequestHandler(BaseHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        self.app = create_app()
-        super().__init__(*args, **kwargs)
+    # socket timeout of each connection, so a slow client cannot hold a worker
+    timeout = SERVE_REQUEST_TIMEOUT
+
+    @property
+    def app(self):
+        return self.server.app
+
+    def send_body(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_payload(self, payload):
+        """send a materialized payload, gzipped if accepted, 304 if the client has it"""
+        gzipped = accepts_gzip(self.headers.get('Accept-Encoding'))
+        headers = {
+            'ETag': payload.gzip_etag if gzipped else payload.etag,
+            'Cache-Control': 'no-cache',  # revalidate every time, unchanged payloads cost a 304
+            'Vary': 'Accept-Encoding',
+            'Access-Control-Allow-Origin': '*'
+        }
+        if payload.matches(self.headers.get('If-None-Match')):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        if gzipped:
+            headers['Content-Encoding'] = 'gzip'
+        self.send_body(200, 'application/json', payload.gzip_body if gzipped else payload.body, headers)
+
+    def open_stream(self, query):
+        """answer with an event stream of the live state and hand the connection to the server's LiveStream"""
+        if current_snapshot() is None:
+            self.send_body(503, 'application/json', json.dumps({'error': 'No live state'}).encode(),
+                           {'Retry-After': '30'})
+            return
+        if not self.server.stream.accepts():
+            self.send_body(503, 'application/json', json.dumps({'error': 'Server busy'}).encode(),
+                           {'Retry-After': '1'})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')  # no buffering by an nginx in front
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(b'retry: 3000\n\n')  # reconnect after 3 s, the new connection starts with a snapshot
+        self.server.local.detached = self.server.stream.add(self.connection, Subscription.from_query(query))
+
+    def build_payload(self, method, deadline):
+        with self.app.app_context(), query_deadline(deadline):
+            return getattr(self, method)(deadline)
 
     def do_GET(self):
+        deadline = self.server.local.deadline
         try:
-            if self.path == '/api/status':
-                with self.app.app_context():
-                    # Set request timeout
-                    socket.setdefaulttimeout(10)  # 10 seconds timeout
-                    
-                    data = {
-                        'service_status': self.get_service_status(),
-                        'subway_lines': self.get_subway_lines_status(),
-                        'stations': self.get_major_stations(),
-                        'alerts': self.get_service_alerts(),
-                        'vehicle_positions': self.get_vehicle_positions(),
-                        'arrival_times': self.get_arrival_times()
-                    }
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(data).encode())
-            elif self.path == '/passenger_view.html':
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html')
-                self.end_headers()
-                with open('passenger_view.html', 'rb') as f:
-                    self.wfile.write(f.read())
+            if time.monotonic() > deadline:
+                raise DeadlineExceeded()
+            url = urlsplit(self.path)
+            if url.path == '/api/stream':
+                self.open_stream(url.query)
+            elif url.path in PAYLOADS:
+                # built by the first request of a generation, later ones only send its bytes
+                method = PAYLOADS[url.path]
+                self.send_payload(self.server.payloads.get(url.path, lambda: self.build_payload(method, deadline)))
+            elif url.path in self.server.static_files:
+                content_type, body = self.server.static_files[url.path]
+                self.send_body(200, content_type, body)
             else:
                 self.send_response(404)
+                self.send_header('Content-Length', '0')
                 self.end_headers()
         except socket.timeout:
+            # the client stopped reading, there is no one left to answer
             logger.error("Request timed out")
-            self.send_response(504)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': 'Request timed out'}).encode())
         except Exception as e:
+            # interrupted queries fail with OperationalError
+            if isinstance(e, DeadlineExceeded) or time.monotonic() > deadline:
+                logger.error("Request timed out")
+                self.send_body(504, 'application/json', json.dumps({'error': 'Request timed out'}).encode())
+                return
             logger.error(f"Error handling request: {str(e)}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            self.send_body(500, 'application/json', json.dumps({'error': str(e)}).encode())
+
+    def get_status(self, deadline=None):
+        """payload of /api/status, built in the caller's app context"""
+        data = {}
+        for key, section in (
+            ('service_status', self.get_service_status),
+            ('subway_lines', self.get_subway_lines_status),
+            ('stations', self.get_major_stations),
+            ('alerts', self.get_service_alerts),
+            ('vehicle_positions', self.get_vehicle_positions),
+            ('arrival_times', self.get_arrival_times)
+        ):
+            data[key] = section()
+            # sections log and swallow their errors, interrupted queries included
+            if deadline is not None and time.monotonic() > deadline:
+                raise DeadlineExceeded()
+        return data
+
+    def get_active_alerts(self):
+        """active service alerts, queried once per request and shared by the sections"""
+        alerts = getattr(self, '_active_alerts', None)
+        if alerts is None:
+            now = datetime.now()
+            alerts = self._active_alerts = ServiceAlert.query.filter(
+                (ServiceAlert.active_period_start <= now) &
+                ((ServiceAlert.active_period_end >= now) | (ServiceAlert.active_period_end.is_(None)))
+            ).all()
+        return alerts
 
     def get_service_status(self):
         try:
-            with self.app.app_context():
-                # Check for active service alerts
-                active_alerts = ServiceAlert.query.filter(
-                    (ServiceAlert.active_period_start <= datetime.now()) &
-                    ((ServiceAlert.active_period_end >= datetime.now()) | (ServiceAlert.active_period_end.is_(None)))
-                ).limit(10).all()  # Limit query results
-
-                status = {
-                    'subway': 'Good Service',
-                    'lirr': 'Good Service',
-                    'mnr': 'Good Service'
-                }
+            # Check for active service alerts
+            active_alerts = self.get_active_alerts()
+
+            status = {
+                'subway': 'Good Service',
+                'lirr': 'Good Service',
+                'mnr': 'Good Service'
+            }
 
-                for alert in active_alerts:
-                    if 'subway' in alert.header_text.lower():
-                        status['subway'] = 'Service Alert'
-                    elif 'lirr' in alert.header_text.lower():
-                        status['lirr'] = 'Service Alert'
-                    elif 'mnr' in alert.header_text.lower():
-                        status['mnr'] = 'Service Alert'
+            for alert in active_alerts:
+                if 'subway' in alert.header_text.lower():
+                    status['subway'] = 'Service Alert'
+                elif 'lirr' in alert.header_text.lower():
+                    status['lirr'] = 'Service Alert'
+                elif 'mnr' in alert.header_text.lower():
+                    status['mnr'] = 'Service Alert'
 
-                return status
+            return status
         except Exception as e:
             logger.error(f"Error getting service status: {str(e)}")
             return {
@@ -113,158 +335,201 @@ class MTARequestHandler(BaseHTTPRequestHandler):
 
     def get_subway_lines_status(self):
         try:
-            with self.app.app_context():
-                subway_routes = Route.query.filter(Route.agency_id == 'MTA NYCT').limit(20).all()  # Limit query results
-                status = {}
-                
-                for route in subway_routes:
-                    status[route.route_short_name] = {
-                        'status': 'Good Service',
-                        'vehicles': []
-                    }
-                    
-                    # Get vehicle positions for this route
-                    vehicles = VehiclePosition.query.filter(
-                        VehiclePosition.trip_id.in_(
-                            Trip.query.filter_by(route_id=route.route_id).with_entities(Trip.trip_id)
-                        ),
-                        VehiclePosition.feed_timestamp >= datetime.now() - timedelta(minutes=5)
-                    ).limit(10).all()  # Limit query results
-                    
-                    for vehicle in vehicles:
-                        status[route.route_short_name]['vehicles'].append({
-                            'id': vehicle.vehicle_id,
-                            'current_stop': vehicle.current_stop_sequence,
-                            'status': vehicle.current_status,
-                            'timestamp': vehicle.feed_timestamp.isoformat()
-                        })
-                    
-                    # Check for alerts affecting this route
-                    active_alerts = ServiceAlert.query.filter(
-                        (ServiceAlert.active_period_start <= datetime.now()) &
-                        ((ServiceAlert.active_period_end >= datetime.now()) | (ServiceAlert.active_period_end.is_(None))) &
-                        (ServiceAlert.header_text.like(f'%{route.route_short_name}%'))
-                    ).first()
-                    
-                    if active_alerts:
-                        status[route.route_short_name]['status'] = 'Service Alert'
-                
-                return status
+            subway_routes = Route.query.filter(Route.agency_id == 'MTA NYCT').limit(20).all()  # Limit query results
+            since = datetime.now() - timedelta(minutes=5)
+
+            # Vehicle positions of every route, at most 10 each
+            live = current_snapshot()
+            if live is not None:
+                vehicles = [
+                    vehicle for route in subway_routes
+                    for vehicle in live.vehicle_positions(route.route_id, since=since, limit=10)
+                ]
+            else:
+                vehicles = first_rows_per_key(
+                    (VehiclePosition.route_id, VehiclePosition.vehicle_id, VehiclePosition.current_stop_sequence,
+                     VehiclePosition.current_status, VehiclePosition.feed_timestamp),
+                    VehiclePosition.route_id, desc(VehiclePosition.feed_timestamp), 10,
+                    VehiclePosition.route_id.in_([route.route_id for route in subway_routes]),
+                    # the latest version of every vehicle: unchanged vehicles are not written again
+                    VehiclePosition.id.in_(current_vehicles())
+                )
+            vehicles_by_route = {}
+            for vehicle in vehicles:
+                vehicles_by_route.setdefault(vehicle.route_id, []).append({
+                    'id': vehicle.vehicle_id,
+                    'current_stop': vehicle.current_stop_sequence,
+                    'status': vehicle.current_status,
+                    'timestamp': vehicle.feed_timestamp.isoformat()
+                })
+
+            # Alerts mentioning a route (header LIKE '%name%', case-insensitive like SQLite's LIKE)
+            headers = [(alert.header_text or '').lower() for alert in self.get_active_alerts()]
+
+            status = {}
+            for route in subway_routes:
+                name = route.route_short_name
+                status[name] = {
+                    'status': 'Service Alert' if name and any(name.lower() in header for header in headers)
+                    else 'Good Service',
+                    'vehicles': vehicles_by_route.get(route.route_id, [])
+                }
+            return status
         except Exception as e:
             logger.error(f"Error getting subway lines status: {str(e)}")
             return {}
 
     def get_major_stations(self):
         try:
-            with self.app.app_context():
-                stations = {}
-                stops = Stop.query.limit(50).all()  # Limit query results
-                
-                for stop in stops:
-                    if stop.stop_name not in stations:
-                        stations[stop.stop_name] = {
-                            'name': stop.stop_name,
-                            'lines': set(),
-                            'status': 'Good Service',
-                            'arrivals': []
-                        }
-                    
-                    # Get all routes passing through this station
-                    routes = Route.query.join(Trip).join(StopTime).filter(
-                        StopTime.stop_id == stop.stop_id
-                    ).limit(10).all()  # Limit query results
-                    
-                    for route in routes:
-                        if route.route_short_name:  # Ensure route_short_name is not None
-                            stations[stop.stop_name]['lines'].add(route.route_short_name)
-                        
-                        # Get real-time arrival information for this station
-                        arrivals = StopTimeUpdate.query.filter(
-                            StopTimeUpdate.stop_id == stop.stop_id,
-                            StopTimeUpdate.arrival_time >= datetime.now(),
-                            StopTimeUpdate.arrival_time <= datetime.now() + timedelta(minutes=30)
-                        ).order_by(StopTimeUpdate.arrival_time).limit(5).all()
-                        
-                        for arrival in arrivals:
-                            stations[stop.stop_name]['arrivals'].append({
-                                'route': route.route_short_name or 'Unknown',
-                                'arrival_time': arrival.arrival_time.isoformat() if arrival.arrival_time else None,
-                                'status': arrival.schedule_relationship or 'Unknown'
-                            })
-                
-                # Convert to list and sort (by number of lines)
-                station_list = []
-                for station in stations.values():
-                    station['lines'] = ', '.join(sorted(station['lines']))
-                    station_list.append(station)
-                
-                # Sort by number of lines and return top 10
-                return sorted(station_list, key=lambda x: len(x['lines']), reverse=True)[:10]
+            stops = Stop.query.limit(50).all()  # Limit query results
+            stop_ids = [stop.stop_id for stop in stops]
+
+            # All routes passing through these stops, from the route_stops index
+            lines = db.session.query(route_stops.c.stop_id, Route.route_id, Route.route_short_name).join(
+                Route, Route.route_id == route_stops.c.route_id
+            ).filter(route_stops.c.stop_id.in_(stop_ids)).all()
+            route_names = {line.route_id: line.route_short_name for line in lines}
+
+            # Real-time arrivals at these stops in the next 30 minutes, at most 5 each
+            now = datetime.now()
+            live = current_snapshot()
+            if live is not None:
+                arrivals = [{
+                    'stop_id': arrival.stop_id,
+                    'route': route_names.get(arrival.route_id) or 'Unknown',
+                    'arrival_time': arrival.time.isoformat(),
+                    'status': stop_status(arrival.schedule_relationship)
+                } for stop_id in stop_ids for arrival in live.arrivals(stop_id, now, now + timedelta(minutes=30), 5)]
+            else:
+                arrivals = [{
+                    'stop_id': arrival.stop_id,
+                    'route': route_names.get(arrival.route_id) or 'Unknown',
+                    'arrival_time': arrival.arrival_time.isoformat(),
+                    'status': stop_status(arrival.schedule_relationship)
+                } for arrival in first_rows_per_key(
+                    (StopTimeUpdate.stop_id, StopTimeUpdate.route_id, StopTimeUpdate.arrival_time,
+                     StopTimeUpdate.schedule_relationship),
+                    StopTimeUpdate.stop_id, StopTimeUpdate.arrival_time, 5,
+                    StopTimeUpdate.stop_id.in_(stop_ids),
+                    StopTimeUpdate.trip_update_id.in_(current_trip_updates()),
+                    StopTimeUpdate.arrival_time >= now,
+                    StopTimeUpdate.arrival_time <= now + timedelta(minutes=30)
+                )]
+
+            stations = {}
+            station_of_stop = {}
+            for stop in stops:
+                station_of_stop[stop.stop_id] = stations.setdefault(stop.stop_name, {
+                    'name': stop.stop_name,
+                    'lines': set(),
+                    'status': 'Good Service',
+                    'arrivals': []
+                })
+            for line in lines:
+                if line.route_short_name:  # Ensure route_short_name is not None
+                    station_of_stop[line.stop_id]['lines'].add(line.route_short_name)
+            for arrival in arrivals:
+                station_of_stop[arrival.pop('stop_id')]['arrivals'].append(arrival)
+
+            for station in stations.values():
+                station['lines'] = ', '.join(sorted(station['lines']))
+                station['arrivals'].sort(key=lambda arrival: arrival['arrival_time'])
+
+            # Sort by number of lines and return top 10
+            return sorted(stations.values(), key=lambda station: len(station['lines']), reverse=True)[:10]
         except Exception as e:
             logger.error(f"Error getting major stations: {str(e)}")
             return []
 
     def get_service_alerts(self):
         try:
-            with self.app.app_context():
-                alerts = ServiceAlert.query.filter(
-                    (ServiceAlert.active_period_start <= datetime.now()) &
-                    ((ServiceAlert.active_period_end >= datetime.now()) | (ServiceAlert.active_period_end.is_(None)))
-                ).limit(10).all()  # Limit query results
-                
-                return [{
-                    'header': alert.header_text,
-                    'description': alert.description_text,
-                    'start_time': alert.active_period_start.isoformat() if alert.active_period_start else None,
-                    'end_time': alert.active_period_end.isoformat() if alert.active_period_end else None
-                } for alert in alerts]
+            alerts = self.get_active_alerts()[:10]  # Limit results
+            
+            return [{
+                'header': alert.header_text,
+                'description': alert.description_text,
+                'start_time': alert.active_period_start.isoformat() if alert.active_period_start else None,
+                'end_time': alert.active_period_end.isoformat() if alert.active_period_end else None
+            } for alert in alerts]
         except Exception as e:
             logger.error(f"Error getting service alerts: {str(e)}")
             return []
 
     def get_vehicle_positions(self):
         try:
-            with self.app.app_context():
-                vehicles = VehiclePosition.query.filter(
-                    VehiclePosition.feed_timestamp >= datetime.now() - timedelta(minutes=5)
-                ).limit(50).all()  # Limit query results
-                
+            live = current_snapshot()
+            if live is not None:
                 return [{
                     'trip_id': vehicle.trip_id,
                     'vehicle_id': vehicle.vehicle_id,
                     'current_stop': vehicle.current_stop_sequence,
                     'status': vehicle.current_status,
                     'timestamp': vehicle.feed_timestamp.isoformat()
-                } for vehicle in vehicles]
+                } for vehicle in live.vehicle_positions(since=datetime.now() - timedelta(minutes=5), limit=50)]
+
+            vehicles = VehiclePosition.query.filter(
+                VehiclePosition.id.in_(current_vehicles())
+            ).order_by(desc(VehiclePosition.feed_timestamp)).limit(50).all()  # Limit query results
+            
+            return [{
+                'trip_id': vehicle.trip_id,
+                'vehicle_id': vehicle.vehicle_id,
+                'current_stop': vehicle.current_stop_sequence,
+                'status': vehicle.current_status,
+                'timestamp': vehicle.feed_timestamp.isoformat()
+            } for vehicle in vehicles]
         except Exception as e:
             logger.error(f"Error getting vehicle positions: {str(e)}")
             return []
 
     def get_arrival_times(self):
         try:
-            with self.app.app_context():
-                arrivals = StopTimeUpdate.query.filter(
-                    StopTimeUpdate.arrival_time >= datetime.now(),
-                    StopTimeUpdate.arrival_time <= datetime.now() + timedelta(minutes=30)
-                ).order_by(StopTimeUpdate.arrival_time).limit(50).all()  # Limit query results
-                
+            live = current_snapshot()
+            if live is not None:
+                now = datetime.now()
                 return [{
                     'stop_id': arrival.stop_id,
-                    'trip_update_id': arrival.trip_update_id,  # Use trip_update_id instead of trip_id
-                    'arrival_time': arrival.arrival_time.isoformat() if arrival.arrival_time else None,
-                    'status': arrival.schedule_relationship or 'Unknown'
-                } for arrival in arrivals]
+                    'trip_id': arrival.trip_id,
+                    'arrival_time': arrival.time.isoformat(),
+                    'status': stop_status(arrival.schedule_relationship)
+                } for arrival in live.arrivals(start=now, end=now + timedelta(minutes=30), limit=50)]
+
+            arrivals = db.session.query(
+                StopTimeUpdate.stop_id, TripUpdate.trip_id, StopTimeUpdate.arrival_time,
+                StopTimeUpdate.schedule_relationship
+            ).join(TripUpdate, TripUpdate.id == StopTimeUpdate.trip_update_id).filter(
+                StopTimeUpdate.trip_update_id.in_(current_trip_updates()),
+                StopTimeUpdate.arrival_time >= datetime.now(),
+                StopTimeUpdate.arrival_time <= datetime.now() + timedelta(minutes=30)
+            ).order_by(StopTimeUpdate.arrival_time).limit(50).all()  # Limit query results
+
+            return [{
+                'stop_id': arrival.stop_id,
+                'trip_id': arrival.trip_id,
+                'arrival_time': arrival.arrival_time.isoformat(),
+                'status': stop_status(arrival.schedule_relationship)
+            } for arrival in arrivals]
         except Exception as e:
             logger.error(f"Error getting arrival times: {str(e)}")
             return []
 
-def run_server(port=None):
+def run_server(port=None, workers=SERVE_WORKERS, backlog=SERVE_BACKLOG):
     if port is None:
         port = find_available_port()
     server_address = ('', port)
-    httpd = HTTPServer(server_address, MTARequestHandler)
-    logger.info(f'Server running on http://localhost:{port}')
-    httpd.serve_forever()
+    # one app, and its reader connection pool, for every request
+    httpd = PooledHTTPServer(server_address, MTARequestHandler, create_app(readonly=True),
+                             workers=workers, backlog=backlog)
+    logger.info(f'Server running on http://localhost:{port} with {workers} workers')
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
 
 if __name__ == '__main__':
-    run_server() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Serve /api/status, /api/stream and the passenger view')
+    parser.add_argument('--port', type=int, help='port to listen on, the first free one from 5000 if omitted')
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help='threads handling requests')
+    parser.add_argument('--backlog', type=int, default=SERVE_BACKLOG, help='connections waiting for a worker')
+    args = parser.parse_args()
+    run_server(args.port, args.workers, args.backlog)
@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+# Add project root directory to Python path, and scripts/ for serve_data
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+sys.path.insert(0, os.path.join(project_root, 'scripts'))
+
+from backend import create_app, db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """app on a scratch database with every table created"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}"})
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
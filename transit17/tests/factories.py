@@ -0,0 +1,74 @@
+"""Small deterministic GTFS static and GTFS-rt feeds for the tests"""
+import copy
+import zipfile
+from google.transit import gtfs_realtime_pb2
+from backend.services.mta.base import BaseMTAService
+
+
+def build_feed(feed_id, trips=3, stops=3, timestamp=1700000000):
+    """a FeedMessage with one trip update and one vehicle per trip, route = first letter of feed_id"""
+    route_id = feed_id[0].upper()
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = '1.0'
+    feed.header.timestamp = timestamp
+    for index in range(trips):
+        trip_id = f"{feed_id}_{index:03d}..N"
+        trip_update = feed.entity.add(id=f"trip-{index}").trip_update
+        trip_update.trip.trip_id = trip_id
+        trip_update.trip.route_id = route_id
+        trip_update.trip.start_time = '08:00:00'
+        trip_update.trip.start_date = '20240101'
+        for seq in range(stops):
+            stop_update = trip_update.stop_time_update.add(stop_id=f"{route_id}{seq:02d}N", stop_sequence=seq)
+            stop_update.arrival.time = timestamp + 120 * (index + seq + 1)
+            stop_update.departure.time = stop_update.arrival.time + 30
+
+        vehicle = feed.entity.add(id=f"vehicle-{index}").vehicle
+        vehicle.vehicle.id = f"{feed_id}-{index:03d}"
+        vehicle.trip.trip_id = trip_id
+        vehicle.trip.route_id = route_id
+        vehicle.current_stop_sequence = index % stops
+        vehicle.timestamp = timestamp - index
+        vehicle.position.latitude = 40.7 + index / 100
+        vehicle.position.longitude = -74.0
+    return feed
+
+
+def realtime_data(feed_ids=('ace', 'g'), trips=3, stops=3, timestamp=1700000000):
+    """one poll cycle of build_feed feeds, as BaseMTAService.build_realtime_data returns it"""
+    return BaseMTAService().build_realtime_data({
+        feed_id: build_feed(feed_id, trips, stops, timestamp) for feed_id in feed_ids
+    })
+
+
+def next_cycle(cycle, seconds=30):
+    """cycle polled again seconds later: the first trip a minute late, the last trip and vehicle gone"""
+    cycle = copy.deepcopy(cycle)
+    for stop in cycle['trip_updates'][0]['stop_updates']:
+        stop['arrival_time'] += 60
+    del cycle['trip_updates'][-1], cycle['vehicle_positions'][-1]
+    cycle['feeds'] = {feed_id: timestamp + seconds for feed_id, timestamp in cycle['feeds'].items()}
+    return cycle
+
+
+def write_feed(path, routes, stops, trips):
+    """
+    GTFS zip of routes (route_id -> name), stops (stop_id -> name) and
+    trips (trip_id -> (route_id, [stop_id, ...])); routes.txt has no
+    agency_id, the routes belong to the agency of the update
+    """
+    with zipfile.ZipFile(path, 'w') as gtfs_zip:
+        gtfs_zip.writestr('routes.txt', 'route_id,route_short_name,route_long_name,route_type\n' + ''.join(
+            f"{route_id},{route_id},{name},2\n" for route_id, name in routes.items()
+        ))
+        gtfs_zip.writestr('stops.txt', 'stop_id,stop_name,stop_lat,stop_lon\n' + ''.join(
+            f"{stop_id},{name},40.7,-73.9\n" for stop_id, name in stops.items()
+        ))
+        gtfs_zip.writestr('trips.txt', 'route_id,trip_id,service_id\n' + ''.join(
+            f"{route_id},{trip_id},Weekday\n" for trip_id, (route_id, _) in trips.items()
+        ))
+        gtfs_zip.writestr('stop_times.txt', 'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n' + ''.join(
+            f"{trip_id},08:{seq:02d}:00,08:{seq:02d}:30,{stop_id},{seq}\n"
+            for trip_id, (_, trip_stops) in trips.items() for seq, stop_id in enumerate(trip_stops)
+        ))
+    return str(path)
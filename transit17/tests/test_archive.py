@@ -0,0 +1,60 @@
+import time
+from google.transit import gtfs_realtime_pb2
+from backend.services.data.archive import RawFeedArchive
+
+
+def feed(timestamp, entities=2):
+    message = gtfs_realtime_pb2.FeedMessage()
+    message.header.gtfs_realtime_version = '2.0'
+    message.header.timestamp = timestamp
+    for index in range(entities):
+        message.entity.add(id=str(index))
+    return message
+
+
+def archived(root, feed_id):
+    return [timestamp for timestamp, _ in RawFeedArchive(root).iter_snapshots('lirr', feed_id)]
+
+
+def test_close_writes_pending_snapshots(tmp_path):
+    start = int(time.time())
+    archive = RawFeedArchive(str(tmp_path))
+    archive.append('lirr', 'lirr', feed(start))
+    archive.append('lirr', 'lirr', feed(start + 30))
+    assert archived(str(tmp_path), 'lirr') == []  # far from a full chunk
+
+    archive.close()
+    assert archived(str(tmp_path), 'lirr') == [start, start + 30]
+
+
+def test_pending_snapshots_are_written_after_max_pending_seconds(tmp_path):
+    start = int(time.time())
+    archive = RawFeedArchive(str(tmp_path), max_pending_seconds=0.05)
+    archive.append('lirr', 'quiet', feed(start))
+    archive.append('lirr', 'busy', feed(start))
+    time.sleep(0.1)
+    # any append writes the chunks that waited too long, those of other feeds too
+    archive.append('lirr', 'busy', feed(start + 30))
+
+    assert archived(str(tmp_path), 'quiet') == [start]
+    assert archived(str(tmp_path), 'busy') == [start, start + 30]
+    archive.close()
+
+
+def test_a_reopened_segment_drops_what_a_crash_left_behind(tmp_path):
+    start = int(time.time())
+    archive = RawFeedArchive(str(tmp_path))
+    archive.append('lirr', 'lirr', feed(start))
+    archive.close()
+    feed_dir = tmp_path / 'lirr' / 'lirr'
+    path = str(next(feed_dir.glob('*.idx')))[:-4]
+    # killed while writing the next chunk and its index entries
+    with open(f"{path}.seg", 'ab') as f:
+        f.write(b'FSC1\x01partial chunk')
+    with open(f"{path}.idx", 'ab') as f:
+        f.write(b'\x00' * 7)
+
+    archive = RawFeedArchive(str(tmp_path))
+    archive.append('lirr', 'lirr', feed(start + 30))
+    archive.close()
+    assert archived(str(tmp_path), 'lirr') == [start, start + 30]
@@ -0,0 +1,70 @@
+from backend.services.mta import manager
+from backend.services.mta.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from backend.services.mta.feed_tracker import feed_tracker
+from backend.services.mta.manager import APIManager
+
+
+def test_failures_back_off_then_open_the_breaker():
+    breaker = CircuitBreaker('subway/ace', failure_threshold=3, reset_timeout=30, max_backoff=100)
+    breaker.record_failure(now=0)
+    assert breaker.state == CLOSED and breaker.retry_delay(now=0) == 2
+    assert not breaker.allow_request(now=1) and breaker.allow_request(now=2)
+    breaker.record_failure(now=2)
+    assert breaker.retry_delay(now=2) == 4
+
+    breaker.record_failure(now=6)
+    assert breaker.state == OPEN
+    assert not breaker.allow_request(now=35)
+    assert breaker.retry_delay(now=35) == 1
+
+
+def test_half_open_probe_closes_or_reopens_with_doubled_backoff():
+    breaker = CircuitBreaker('subway/ace', failure_threshold=1, reset_timeout=30, max_backoff=100)
+    breaker.record_failure(now=0)
+    # one probe once the backoff has passed
+    assert breaker.allow_request(now=30)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request(now=30)
+
+    breaker.record_failure(now=31)
+    assert (breaker.state, breaker.retry_delay(now=31)) == (OPEN, 60)
+    assert breaker.allow_request(now=91)
+    breaker.record_failure(now=91)
+    assert breaker.retry_delay(now=91) == 100  # capped at max_backoff
+
+    assert breaker.allow_request(now=191)
+    breaker.record_success(now=192)
+    assert breaker.state == CLOSED and breaker.allow_request(now=192)
+    stats = breaker.to_dict(now=192)
+    assert (stats['failures'], stats['opens'], stats['backoff_time']) == (3, 3, 190)
+
+
+class TimingOutService:
+    """a service none of whose feeds arrive in time"""
+
+    def __init__(self):
+        self.requested = []
+
+    def get_feeds(self, service_type, feed_ids, **kwargs):
+        self.requested.append(service_type)
+        return {}
+
+
+def test_failed_feeds_are_kept_off_the_poll_list_without_blocking(monkeypatch):
+    service = TimingOutService()
+    requested = service.requested
+    monkeypatch.setattr(manager.MTAServiceFactory, 'get_service', lambda service_type: service)
+    feed_tracker.reset()
+    api_manager = APIManager()
+
+    # every feed times out: one failure on each breaker, retried after 2 seconds
+    assert api_manager.get_all_data() == {}
+    assert len(requested) == len(manager.SERVICE_FEEDS)
+    assert {breaker.consecutive_failures for breaker in api_manager.breakers.values()} == {1}
+
+    # due again, but the breakers hold the retries back
+    requested.clear()
+    api_manager.scheduler.make_all_due()
+    assert api_manager.get_all_data() == {}
+    assert requested == []
+    assert api_manager.seconds_until_next_poll() > 1
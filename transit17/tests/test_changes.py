@@ -0,0 +1,44 @@
+import time
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.partitions import partition_manager
+from factories import next_cycle, realtime_data
+
+
+def test_diff_writes_changes_and_ends_what_left_a_polled_feed(app):
+    partition_manager.setup()
+    # recent headers: versions older than the refresh interval are written again
+    cycle = realtime_data(timestamp=int(time.time()))
+    RealtimeImporter.import_realtime_data(cycle, 'subway', tracker=ChangeTracker())
+
+    # a new tracker starts from the versions stored in the database
+    tracker = ChangeTracker()
+    changes = tracker.diff('subway', cycle)
+    assert (changes.trip_updates, changes.vehicle_positions, changes.ended_trips, changes.ended_vehicles) == \
+        ([], [], [], [])
+    assert changes.unchanged == len(cycle['trip_updates']) + len(cycle['vehicle_positions'])
+
+    polled = next_cycle(cycle)
+    changes = tracker.diff('subway', polled)
+    assert [trip['trip_id'] for trip in changes.trip_updates] == [polled['trip_updates'][0]['trip_id']]
+    assert changes.vehicle_positions == []
+    assert [trip['trip_id'] for trip in changes.ended_trips] == [cycle['trip_updates'][-1]['trip_id']]
+    assert [vehicle['trip_id'] for vehicle in changes.ended_vehicles] == [cycle['vehicle_positions'][-1]['trip_id']]
+
+    # not applied yet: the same cycle gives the same changes, afterwards none
+    assert len(tracker.diff('subway', polled).trip_updates) == 1
+    changes.apply()
+    changes = tracker.diff('subway', polled)
+    assert (changes.trip_updates, changes.ended_trips, changes.ended_vehicles) == ([], [], [])
+
+
+def test_diff_only_ends_entities_of_the_polled_feeds(app):
+    partition_manager.setup()
+    now = int(time.time())
+    tracker = ChangeTracker()
+    tracker.diff('subway', realtime_data(feed_ids=('ace', 'g'), timestamp=now)).apply()
+
+    # the g feed failed to download: its entities are missing but did not end
+    polled = realtime_data(feed_ids=('ace',), timestamp=now)
+    changes = tracker.diff('subway', polled)
+    assert (changes.trip_updates, changes.ended_trips, changes.ended_vehicles) == ([], [], [])
@@ -0,0 +1,39 @@
+import logging
+from datetime import timedelta
+from types import SimpleNamespace
+from backend.config.settings import StorageConfig
+from backend.services.data import collector
+from backend.services.data.collector import DataCollector
+
+
+def test_maintenance_runs_once_per_cleanup_interval(monkeypatch):
+    calls = []
+    monkeypatch.setattr(collector.DataCleanup, 'cleanup_all', staticmethod(lambda: calls.append('cleanup')))
+    # a collector without feeds, only its maintenance is run
+    data_collector = DataCollector.__new__(DataCollector)
+    data_collector.archive = SimpleNamespace(prune=lambda: calls.append('archive'))
+    data_collector.history = SimpleNamespace(prune=lambda: calls.append('history'))
+    data_collector.logger = logging.getLogger(__name__)
+    data_collector.last_cleanup = None
+
+    data_collector.run_maintenance()
+    data_collector.run_maintenance()
+    assert calls == ['archive', 'history', 'cleanup']
+
+    data_collector.last_cleanup -= timedelta(minutes=StorageConfig.CLEANUP_INTERVAL)
+    data_collector.run_maintenance()
+    assert calls == ['archive', 'history', 'cleanup'] * 2
+
+
+def test_feeds_polled_without_changes_are_confirmed_in_the_live_state():
+    confirmed = []
+    data_collector = DataCollector.__new__(DataCollector)
+    data_collector.api_manager = SimpleNamespace(get_all_data=lambda: {}, unchanged_feeds={'subway': ['ace', 'g']})
+    data_collector.live_state = SimpleNamespace(
+        confirm=lambda agency_id, feed_ids: confirmed.append((agency_id, feed_ids)),
+        swap=lambda: confirmed.append('swap')
+    )
+    data_collector.logger = logging.getLogger(__name__)
+
+    data_collector.collect_data()
+    assert confirmed == [('subway', ['ace', 'g']), 'swap']
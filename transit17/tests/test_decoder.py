@@ -0,0 +1,39 @@
+from unittest import mock
+from backend.services.mta.base import BaseMTAService
+from factories import build_feed
+
+
+def without_timestamps(trip_updates):
+    return [dict(trip_update, timestamp=None) for trip_update in trip_updates]
+
+
+def test_decode_feed_matches_the_per_kind_methods():
+    feed = build_feed('ace', trips=5, stops=4)
+    skipped = feed.entity[0].trip_update.stop_time_update[2]
+    skipped.schedule_relationship = skipped.SKIPPED
+    service = BaseMTAService()
+
+    trip_updates, vehicle_positions = service.decode_feed(feed)
+    assert without_timestamps(trip_updates) == without_timestamps(service.process_trip_updates(feed))
+    assert vehicle_positions == service.process_vehicle_positions(feed)
+    assert [stop['schedule_relationship'] for stop in trip_updates[0]['stop_updates']] == [0, 0, 1, 0]
+    assert service.decode_feed(None) == ([], [])
+
+
+def test_decode_feed_takes_the_time_once_per_feed():
+    service = BaseMTAService()
+    with mock.patch.object(service, 'get_timestamp', wraps=service.get_timestamp) as get_timestamp:
+        trip_updates, _ = service.decode_feed(build_feed('ace', trips=5))
+        service.process_trip_updates(build_feed('ace', trips=5))
+    assert get_timestamp.call_count == 2
+    assert len({trip_update['timestamp'] for trip_update in trip_updates}) == 1
+
+
+def test_build_realtime_data_tags_entities_with_their_feed():
+    feeds = {feed_id: build_feed(feed_id, timestamp=1700000000 + index)
+             for index, feed_id in enumerate(('ace', 'g'))}
+    data = BaseMTAService().build_realtime_data(feeds)
+
+    assert data['feeds'] == {'ace': 1700000000, 'g': 1700000001}
+    assert [trip_update['feed_id'] for trip_update in data['trip_updates']] == ['ace'] * 3 + ['g'] * 3
+    assert [vehicle['feed_id'] for vehicle in data['vehicle_positions']] == ['ace'] * 3 + ['g'] * 3
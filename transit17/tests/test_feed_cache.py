@@ -0,0 +1,54 @@
+import threading
+import time
+from backend.services.mta.cache import FeedCache
+
+
+def test_concurrent_misses_share_one_load():
+    cache = FeedCache(ttl=60, stale_ttl=0)
+    calls = []
+
+    def loader():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return 'feed'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(('subway', 'ace'), loader)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['feed'] * 5
+    assert len(calls) == 1
+    assert cache.get(('subway', 'ace'), loader) == 'feed'
+    stats = cache.get_stats()
+    assert (stats['misses'], stats['coalesced'], stats['hits']) == (1, 4, 1)
+
+
+def test_stale_entries_are_served_while_one_refresh_runs():
+    cache = FeedCache(ttl=0.05, stale_ttl=60)
+    versions = iter(['v1', 'v2'])
+
+    def loader():
+        return next(versions)
+
+    assert cache.get(('subway', 'ace'), loader) == 'v1'
+    time.sleep(0.1)
+    # stale: the old value now, the new one after the background refresh
+    assert cache.get(('subway', 'ace'), loader) == 'v1'
+    deadline = time.monotonic() + 1
+    while cache.get(('subway', 'ace'), loader, ttl=60) != 'v2' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get(('subway', 'ace'), loader, ttl=60) == 'v2'
+    assert cache.get_stats()['refreshes'] == 1
+
+
+def test_failed_loads_are_not_cached():
+    cache = FeedCache(ttl=60, stale_ttl=0)
+    assert cache.get(('subway', 'ace'), lambda: None) is None
+    assert cache.get(('subway', 'ace'), lambda: 'feed') == 'feed'
+    cache.invalidate(('subway', 'ace'))
+    assert cache.get(('subway', 'ace'), lambda: 'new feed') == 'new feed'
+    assert cache.get_stats()['errors'] == 1
@@ -0,0 +1,86 @@
+import time
+from types import SimpleNamespace
+import pytest
+from backend.config.mta_endpoints import SUBWAY_FEEDS, get_feed_url
+from backend.services.mta.base import BaseMTAService
+from backend.services.mta.feed_tracker import feed_tracker
+from factories import build_feed
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """
+    a service answering every subway feed from memory after delays[feed_id]
+    seconds, with versions[feed_id] = (ETag, header timestamp) if set, and a
+    304 to requests carrying that ETag
+    """
+    feed_tracker.reset()
+    service = BaseMTAService()
+    service.delays = {}
+    service.versions = {}
+    service.sent = []
+    urls = {get_feed_url('subway', feed_id): feed_id for feed_id in SUBWAY_FEEDS}
+
+    def make_request(url, timeout=None, headers=None):
+        feed_id = urls[url]
+        service.sent.append((feed_id, headers or {}))
+        time.sleep(service.delays.get(feed_id, 0))
+        etag, timestamp = service.versions.get(feed_id, (None, 1700000000))
+        if etag and (headers or {}).get('If-None-Match') == etag:
+            return SimpleNamespace(status_code=304, headers={'ETag': etag}, content=b'')
+        return SimpleNamespace(status_code=200, headers={'ETag': etag} if etag else {},
+                               content=build_feed(feed_id, timestamp=timestamp).SerializeToString())
+
+    monkeypatch.setattr(service, '_make_request', make_request)
+    yield service
+    feed_tracker.reset()
+
+
+def test_feeds_are_fetched_concurrently(service):
+    service.delays = {feed_id: 0.2 for feed_id in SUBWAY_FEEDS}
+    started = time.perf_counter()
+    feeds = service.get_feeds('subway', SUBWAY_FEEDS, max_workers=len(SUBWAY_FEEDS), timeout=5)
+    assert time.perf_counter() - started < 0.2 * len(SUBWAY_FEEDS) / 2
+    assert sorted(feeds) == sorted(SUBWAY_FEEDS)
+    assert feeds['g'].header.timestamp == 1700000000
+
+
+def test_a_feed_past_the_deadline_is_left_out_and_not_marked_seen(service):
+    service.delays = {'g': 0.3}
+    feeds = service.get_feeds('subway', ['ace', 'g'], max_workers=2, timeout=0.1, skip_unchanged=True)
+    assert sorted(feeds) == ['ace']
+    time.sleep(0.4)  # the late request completes in the background
+
+    service.delays = {}
+    feeds = service.get_feeds('subway', ['ace', 'g'], max_workers=2, timeout=1, skip_unchanged=True)
+    # ace was returned before and is skipped, g was never returned and comes now
+    assert sorted(feeds) == ['g']
+    assert feed_tracker.last_outcome(('subway', 'ace')) == 'unchanged'
+
+
+def test_unchanged_feeds_are_answered_304_or_skipped_by_header_timestamp(service):
+    service.versions = {'ace': ('"v1"', 1700000000)}
+    assert service.get_feed('subway', 'ace', skip_unchanged=True).header.timestamp == 1700000000
+    assert service.get_feed('subway', 'g', skip_unchanged=True) is not None
+
+    # ace: the ETag is sent back and the server answers 304
+    assert service.get_feed('subway', 'ace', skip_unchanged=True) is None
+    assert service.sent[-1] == ('ace', {'If-None-Match': '"v1"'})
+    assert feed_tracker.last_outcome(('subway', 'ace')) == 'not_modified'
+    # g has no ETag: downloaded again, but its header timestamp did not advance
+    assert service.get_feed('subway', 'g', skip_unchanged=True) is None
+    assert feed_tracker.last_outcome(('subway', 'g')) == 'unchanged'
+
+    service.versions = {'ace': ('"v2"', 1700000030), 'g': (None, 1700000030)}
+    assert service.get_feed('subway', 'ace', skip_unchanged=True).header.timestamp == 1700000030
+    assert service.get_feed('subway', 'g', skip_unchanged=True).header.timestamp == 1700000030
+    assert feed_tracker.conditional_headers(get_feed_url('subway', 'ace')) == {'If-None-Match': '"v2"'}
+    stats = feed_tracker.get_stats()['subway/g']
+    assert (stats['updated'], stats['unchanged']) == (2, 1)
+
+
+def test_peek_feed_header_reads_only_the_header():
+    content = build_feed('ace', trips=50, timestamp=1700000123).SerializeToString()
+    assert BaseMTAService()._peek_feed_header(content).timestamp == 1700000123
+    assert BaseMTAService()._peek_feed_header(b'') is None
+    assert BaseMTAService()._peek_feed_header(b'\x0a\xff') is None
@@ -0,0 +1,42 @@
+from backend import db
+from backend.models import FeedVersion, Route, Stop, StopTime, feed_row_hashes
+from backend.services.data.gtfs_staging import ParallelGTFSImporter
+from backend.services.data.gtfs_versions import GTFSUpdater
+from factories import write_feed
+
+
+def agency_rows(agency_id):
+    active = FeedVersion.query.filter_by(agency_id=agency_id, active=True).count()
+    hashes = db.session.query(feed_row_hashes).filter_by(agency_id=agency_id).count()
+    return active, hashes
+
+
+def test_import_all_replaces_every_agency_and_drops_those_left_out(app, tmp_path):
+    lirr = write_feed(tmp_path / 'lirr.zip', {'1': 'Babylon'}, {'1': 'Penn Station', '2': 'Jamaica'},
+                      {'L1': ('1', ['1', '2'])})
+    mnr = write_feed(tmp_path / 'mnr.zip', {'1': 'Hudson', '2': 'Harlem'}, {'1': 'Grand Central', '3': 'Harlem'},
+                     {'M1': ('2', ['1', '3'])})
+    importer = ParallelGTFSImporter(workers=2)
+
+    result = importer.import_all({'lirr': lirr, 'mnr': mnr})
+    db.session.remove()
+    assert sorted(result['versions']) == ['lirr', 'mnr']
+    # shared ids stay with the first agency, as in a sequential import
+    assert Route.query.filter_by(route_id='1').one().route_long_name == 'Babylon'
+    assert sorted(stop.stop_id for stop in Stop.query) == ['1', '2', '3']
+    assert [stop_time.stop_id for stop_time in StopTime.query.filter_by(trip_id='M1')] == ['1', '3']
+    assert agency_rows('mnr')[0] == 1
+
+    # MNR left out: its rows, versions and row hashes are gone
+    db.session.remove()
+    importer.import_all({'lirr': lirr})
+    db.session.remove()
+    assert sorted(stop.stop_id for stop in Stop.query) == ['1', '2']
+    assert agency_rows('mnr') == (0, 0)
+    assert agency_rows('lirr')[0] == 1
+
+    # so its next update of an unchanged file imports it again
+    result = GTFSUpdater().update_gtfs(mnr, 'mnr')
+    assert result['files']['stops.txt'] != 'unchanged'
+    assert sorted(stop.stop_id for stop in Stop.query) == ['1', '2', '3']
+    assert Route.query.filter_by(route_id='2').one().route_long_name == 'Harlem'
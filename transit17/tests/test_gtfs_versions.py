@@ -0,0 +1,65 @@
+from backend.models import Route, Stop, StopTime, Trip
+from backend.services.data.gtfs_versions import GTFSUpdater
+from factories import write_feed
+
+
+def test_update_applies_only_the_difference(app, tmp_path):
+    updater = GTFSUpdater()
+    stops = {'1': 'Penn Station', '2': 'Jamaica'}
+    trips = {'T1': ('1', ['1', '2'])}
+    updater.update_gtfs(write_feed(tmp_path / 'v1.zip', {'1': 'Babylon'}, stops, trips), 'lirr')
+
+    result = updater.update_gtfs(
+        write_feed(tmp_path / 'v2.zip', {'1': 'Babylon'}, {'1': 'Penn Station', '3': 'Hicksville'},
+                   {'T1': ('1', ['1', '3'])}), 'lirr'
+    )
+
+    assert result['files']['routes.txt'] == 'unchanged'
+    assert {key: result['files']['stops.txt'][key] for key in ('inserted', 'updated', 'deleted')} == \
+        {'inserted': 1, 'updated': 0, 'deleted': 1}
+    assert result['files']['stop_times.txt']['updated'] == 1
+    assert sorted(stop.stop_id for stop in Stop.query) == ['1', '3']
+    assert [stop_time.stop_id for stop_time in StopTime.query.order_by(StopTime.stop_sequence)] == ['1', '3']
+
+
+def test_agencies_sharing_ids_keep_their_rows(app, tmp_path):
+    updater = GTFSUpdater()
+    updater.update_gtfs(
+        write_feed(tmp_path / 'lirr.zip', {'1': 'Babylon'}, {'1': 'Penn Station', '2': 'Jamaica'},
+                   {'L1': ('1', ['1', '2'])}), 'lirr'
+    )
+    updater.update_gtfs(
+        write_feed(tmp_path / 'mnr1.zip', {'1': 'Hudson'}, {'1': 'Grand Central', '3': 'Harlem'},
+                   {'M1': ('1', ['1', '3'])}), 'mnr'
+    )
+
+    # the agency that imported an id first keeps its row
+    route = Route.query.filter_by(route_id='1').first()
+    assert (route.agency_id, route.route_long_name) == ('lirr', 'Babylon')
+    assert Stop.query.filter_by(stop_id='1').one().stop_name == 'Penn Station'
+
+    # an MNR feed without stop 1 and with a changed route 1 leaves LIRR's rows alone
+    updater.update_gtfs(
+        write_feed(tmp_path / 'mnr2.zip', {'1': 'Hudson Line'}, {'3': 'Harlem'},
+                   {'M1': ('1', ['3'])}), 'mnr'
+    )
+    route = Route.query.filter_by(route_id='1').first()
+    assert (route.agency_id, route.route_long_name) == ('lirr', 'Babylon')
+    assert Stop.query.filter_by(stop_id='1').one().stop_name == 'Penn Station'
+    assert sorted(stop.stop_id for stop in Stop.query) == ['1', '2', '3']
+    assert [stop_time.stop_id for stop_time in StopTime.query.filter_by(trip_id='L1')] == ['1', '2']
+    assert sorted(trip.trip_id for trip in Trip.query) == ['L1', 'M1']
+
+    # once LIRR drops route 1, MNR's next update claims it, even with an unchanged feed file
+    updater.update_gtfs(
+        write_feed(tmp_path / 'lirr2.zip', {'2': 'Port Washington'}, {'1': 'Penn Station', '2': 'Jamaica'},
+                   {'L1': ('2', ['1', '2'])}), 'lirr'
+    )
+    assert Route.query.filter_by(route_id='1').first() is None
+    result = updater.update_gtfs(
+        write_feed(tmp_path / 'mnr3.zip', {'1': 'Hudson Line'}, {'3': 'Harlem'},
+                   {'M1': ('1', ['3'])}), 'mnr'
+    )
+    assert result['files']['routes.txt'] != 'unchanged'
+    route = Route.query.filter_by(route_id='1').first()
+    assert (route.agency_id, route.route_long_name) == ('mnr', 'Hudson Line')
@@ -0,0 +1,45 @@
+import os
+from datetime import datetime
+from backend.services.data.history import COLUMNS, PositionHistory
+
+
+def positions(count, start, vehicle='V1'):
+    return [{
+        'vehicle_id': vehicle,
+        'trip_id': f"T{index}",
+        'route_id': 'A',
+        'timestamp': start + index,
+        'position': {'latitude': 40.7, 'longitude': -73.9},
+        'current_status': 1,
+        'current_stop_sequence': index
+    } for index in range(count)]
+
+
+def test_reopened_day_is_cut_to_the_shortest_column(tmp_path):
+    start = int(datetime.now().replace(hour=12, minute=0, second=0, microsecond=0).timestamp())
+    history = PositionHistory(str(tmp_path))
+    history.append('lirr', positions(3, start))
+    history.close()
+
+    # a crash in the middle of a write: some columns got the new row, one only half of it
+    day = history.days('lirr')[0]
+    path = os.path.join(str(tmp_path), 'lirr', day)
+    with open(os.path.join(path, 'timestamp.col'), 'ab') as f:
+        f.write(COLUMNS['timestamp'].type(start + 99).tobytes())
+    with open(os.path.join(path, 'latitude.col'), 'ab') as f:
+        f.write(b'\x00\x00')
+    with open(os.path.join(path, 'trip.dict'), 'a') as f:
+        f.write('T9')
+
+    history = PositionHistory(str(tmp_path))
+    history.append('lirr', positions(2, start + 10, vehicle='V2'))
+    history.close()
+
+    loaded = history.load_day('lirr', day)
+    assert loaded.rows == 5
+    assert {os.path.getsize(os.path.join(path, f"{column}.col")) // dtype.itemsize
+            for column, dtype in COLUMNS.items()} == {5}
+    assert list(loaded['timestamp']) == [start, start + 1, start + 2, start + 10, start + 11]
+    assert list(loaded.dictionaries['vehicle'][loaded['vehicle']]) == ['V1', 'V1', 'V1', 'V2', 'V2']
+    assert list(loaded.dictionaries['trip'][loaded['trip']]) == ['T0', 'T1', 'T2', 'T0', 'T1']
+    assert list(loaded['stop_sequence']) == [0, 1, 2, 0, 1]
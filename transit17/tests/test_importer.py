@@ -0,0 +1,37 @@
+import logging
+import zipfile
+from backend import db
+from backend.models import Route, StopTime
+from backend.models.static import route_stops
+from backend.services.data.importer import GTFSImporter
+from factories import write_feed
+
+
+def test_import_gtfs_bulk_inserts_every_file(app, tmp_path):
+    path = write_feed(tmp_path / 'subway.zip', {'A': 'Eighth Avenue', 'C': 'Eighth Avenue Local'},
+                      {'A01': 'Inwood', 'A02': '207 St', 'A03': 'Dyckman St'},
+                      {'T1': ('A', ['A01', 'A02', 'A03']), 'T2': ('C', ['A02', 'A03'])})
+
+    stats = GTFSImporter().import_gtfs(path, 'subway')
+
+    assert {result['file']: result['rows'] for result in stats} == \
+        {'routes.txt': 2, 'stops.txt': 3, 'trips.txt': 2, 'stop_times.txt': 5}
+    # routes.txt has no agency_id, the routes belong to the imported agency
+    assert {route.agency_id for route in Route.query} == {'subway'}
+    assert sorted(db.session.execute(route_stops.select()).fetchall()) == \
+        [('A', 'A01'), ('A', 'A02'), ('A', 'A03'), ('C', 'A02'), ('C', 'A03')]
+    stop_times = StopTime.query.filter_by(trip_id='T1').order_by(StopTime.stop_sequence).all()
+    assert [(stop_time.arrival_time, stop_time.departure_seconds) for stop_time in stop_times] == \
+        [('08:00:00', 28830), ('08:01:00', 28890), ('08:02:00', 28950)]
+
+
+def test_import_gtfs_logs_missing_files(app, tmp_path, caplog):
+    path = tmp_path / 'routes_only.zip'
+    with zipfile.ZipFile(path, 'w') as gtfs_zip:
+        gtfs_zip.writestr('routes.txt', 'route_id,route_short_name\nA,A\n')
+
+    with caplog.at_level(logging.WARNING, logger='backend.services.data.importer'):
+        stats = GTFSImporter().import_gtfs(str(path), 'subway')
+
+    assert [result['file'] for result in stats] == ['routes.txt']
+    assert 'stop_times.txt missing from GTFS data of subway' in caplog.text
@@ -0,0 +1,39 @@
+from sqlalchemy import text
+from backend import db
+from backend.models import TripUpdate, VehiclePosition
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.interning import IdResolver, interned_columns
+from backend.services.data.partitions import partition_manager
+from factories import realtime_data
+
+
+def test_ids_are_stored_as_codes_and_read_as_strings(app):
+    partition_manager.setup()
+    RealtimeImporter.import_realtime_data(realtime_data(), 'subway')
+
+    stored = db.session.execute(text("SELECT trip_id, route_id, agency_id FROM trip_updates")).fetchall()
+    assert all(isinstance(value, int) for row in stored for value in row)
+    assert sorted(trip.trip_id for trip in TripUpdate.query.filter_by(route_id='G')) == \
+        ['g_000..N', 'g_001..N', 'g_002..N']
+    assert VehiclePosition.query.filter(VehiclePosition.trip_id.in_(['ace_001..N', 'g_002..N'])).count() == 2
+    # a string that was never interned matches nothing
+    assert TripUpdate.query.filter_by(route_id='Z').count() == 0
+    assert 'trip_id' in interned_columns('trip_updates') and 'id' not in interned_columns('trip_updates')
+
+
+def test_resolver_reuses_committed_codes_and_forgets_rolled_back_ones(app):
+    resolver = IdResolver()
+    codes = resolver.resolve(['A', 'B', None])
+    assert sorted(codes) == ['A', 'B']
+    db.session.commit()
+    resolver.commit()
+    assert resolver.resolve(['A', 'B']) == codes
+    assert resolver.get_stats()['hits'] == 2
+
+    resolver.resolve(['C'])
+    db.session.rollback()
+    resolver.rollback()
+    # C is interned again in the next transaction, the rolled back code is not reused from the cache
+    assert resolver.resolve(['C'])['C'] == db.session.execute(
+        text("SELECT id FROM interned_ids WHERE value = 'C'")).scalar()
+    assert resolver.get_stats()['misses'] == 4
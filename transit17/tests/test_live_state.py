@@ -0,0 +1,61 @@
+import os
+import pickle
+import time
+from backend.config.settings import LIVE_STATE_MAX_AGE
+from backend.services.data import live_state
+from backend.services.data.live_state import LiveSnapshot, LiveState, LiveStateReader, _HEADER, _HEADER_MAGIC
+from factories import realtime_data
+
+
+def test_reader_reloads_new_generations_only(tmp_path):
+    path = str(tmp_path / 'live_state.pickle')
+    state = LiveState(path)
+    state.publish(LiveSnapshot(1, {}))
+    reader = LiveStateReader(path, check_interval=0)
+    assert reader.current().generation == 1
+
+    # a cycle without new feeds touches the file, it is not loaded again
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert reader.current().generation == 1
+    assert reader.get_stats()['loads'] == 1
+
+    # a new generation written over the same inode with the same size is loaded
+    with open(path, 'r+b') as f:
+        f.write(_HEADER.pack(_HEADER_MAGIC, 2))
+        pickle.dump(LiveSnapshot(2, {}), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2000))
+    assert (os.stat(path).st_ino, os.stat(path).st_size) == (stat.st_ino, stat.st_size)
+    assert reader.current().generation == 2
+    assert reader.get_stats()['loads'] == 2
+
+
+def test_snapshots_published_without_header_still_load(tmp_path):
+    path = str(tmp_path / 'live_state.pickle')
+    with open(path, 'wb') as f:
+        pickle.dump(LiveSnapshot(7, {}), f)
+    assert LiveStateReader(path, check_interval=0).current().generation == 7
+    assert LiveState(path).snapshot.generation == 7
+
+
+def test_feeds_polled_without_changes_stay_in_the_live_state(tmp_path, monkeypatch):
+    state = LiveState(str(tmp_path / 'live_state.pickle'))
+    state.update('subway', realtime_data(('ace',)))
+    generation = state.swap().generation
+
+    # fresh feeds are not staged again, the generation stays
+    assert state.confirm('subway', ['ace']) == 0
+    assert state.swap().generation == generation
+
+    # past half of the maximum age the feed is renewed with the time of the poll
+    now = time.time()
+    monkeypatch.setattr(live_state.time, 'time', lambda: now + LIVE_STATE_MAX_AGE * 0.75)
+    assert state.confirm('subway', ['ace', 'g']) == 1
+    snapshot = state.swap()
+    assert snapshot.generation == generation + 1
+    monkeypatch.setattr(live_state.time, 'time', lambda: now + LIVE_STATE_MAX_AGE * 1.5)
+    assert len(snapshot.trip_updates()) == 3
+
+    # a feed that is not confirmed ages out
+    monkeypatch.setattr(live_state.time, 'time', lambda: now + LIVE_STATE_MAX_AGE * 2)
+    assert snapshot.trip_updates() == []
@@ -0,0 +1,28 @@
+import time
+from backend.services.data.live_state import LiveState
+from backend.services.data.live_stream import LiveView, diff_views
+from factories import next_cycle, realtime_data
+
+
+def test_diff_views_lists_updated_and_removed_entities(tmp_path):
+    state = LiveState(str(tmp_path / 'live_state.pickle'))
+    cycle = realtime_data(timestamp=int(time.time()))  # arrivals are upcoming ones
+    state.update('subway', cycle)
+    previous = LiveView(state.swap(), [])
+
+    # a later poll: the first trip delayed, the last trip and vehicle gone
+    polled = next_cycle(cycle)
+    state.update('subway', polled)
+    current = LiveView(state.swap(), [])
+
+    delayed = polled['trip_updates'][0]
+    ended_trip, ended_vehicle = cycle['trip_updates'][-1], cycle['vehicle_positions'][-1]
+    changes = diff_views(previous, current)
+    assert changes['trips'] == ([], [f"subway:{ended_trip['trip_id']}:{ended_trip['start_date']}"])
+    assert changes['vehicles'][0] == []
+    assert [previous.vehicles[key].item['trip_id'] for key in changes['vehicles'][1]] == [ended_vehicle['trip_id']]
+    updated, removed = changes['arrivals']
+    assert updated and {current.arrivals[key].item['trip_id'] for key in updated} == {delayed['trip_id']}
+    assert {previous.arrivals[key].item['trip_id'] for key in removed} <= {ended_trip['trip_id']}
+    assert changes['alerts'] == ([], [])
+    assert diff_views(current, current) == {kind: ([], []) for kind in LiveView.KINDS}
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from backend import db
+from backend.models import TripUpdate
+from backend.services.data.partitions import PARTITIONED_TABLES, PartitionManager
+
+
+def object_names(kind):
+    return {row[0] for row in db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = :kind"), {'kind': kind}
+    )}
+
+
+def test_setup_turns_the_tables_into_views_over_partitions(app):
+    manager = PartitionManager()
+    manager.setup()
+    key = manager.partition_key(datetime.now())
+    assert set(PARTITIONED_TABLES) <= object_names('view')
+    for table_name in PARTITIONED_TABLES:
+        assert manager.partitions(table_name) == [key]
+    assert TripUpdate.query.count() == 0
+
+    # set up again in another process: nothing changes
+    PartitionManager().setup()
+    for table_name in PARTITIONED_TABLES:
+        assert manager.partitions(table_name) == [key]
+    assert set(PARTITIONED_TABLES) <= object_names('view')
+
+
+def test_drop_before_drops_expired_partitions_and_keeps_the_newest(app):
+    manager = PartitionManager()
+    manager.setup()
+    current = manager.partition_key(datetime.now())
+    old = manager.partition_key(datetime(2020, 1, 1))
+    manager.ensure_partition('trip_updates', old)
+    assert manager.partitions('trip_updates') == [old, current]
+    assert manager.partitions('stop_time_updates') == [old, current]
+
+    assert manager.drop_before('trip_updates', datetime(2021, 1, 1)) == 1
+    assert manager.partitions('trip_updates') == [current]
+    assert manager.partitions('stop_time_updates') == [current]
+    assert manager.drop_before('trip_updates', datetime.now() + timedelta(days=1)) == 0
+    assert manager.partitions('trip_updates') == [current]
+    assert TripUpdate.query.count() == 0
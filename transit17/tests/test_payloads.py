@@ -0,0 +1,40 @@
+import gzip
+import json
+from types import SimpleNamespace
+from backend.services.data import payloads
+from backend.services.data.payloads import PayloadCache
+
+
+def test_payloads_are_built_once_per_generation(monkeypatch):
+    snapshot = SimpleNamespace(generation=1)
+    monkeypatch.setattr(payloads, 'current_snapshot', lambda: snapshot)
+    builds = []
+
+    def build():
+        builds.append(snapshot.generation)
+        return {'generation': snapshot.generation}
+
+    cache = PayloadCache(max_age=60)
+    payload = cache.get('/api/status', build)
+    assert cache.get('/api/status', build) is payload
+    assert json.loads(payload.body) == {'generation': 1}
+    assert gzip.decompress(payload.gzip_body) == payload.body
+    assert payload.matches(payload.etag) and payload.matches(f'"other", {payload.gzip_etag}')
+    assert not payload.matches('"other"') and not payload.matches(None)
+
+    snapshot.generation = 2
+    assert json.loads(cache.get('/api/status', build).body) == {'generation': 2}
+    cache.invalidate('/api/status')
+    cache.get('/api/status', build)
+    assert builds == [1, 2, 2]
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_payloads_expire_after_max_age(monkeypatch):
+    monkeypatch.setattr(payloads, 'current_snapshot', lambda: None)
+    cache = PayloadCache(max_age=0)
+    first = cache.get('/api/status', lambda: {'count': 1})
+    second = cache.get('/api/status', lambda: {'count': 1})
+    assert second is not first
+    # the same body keeps its ETag
+    assert second.etag == first.etag
@@ -0,0 +1,59 @@
+import pytest
+from backend.services.mta.poll_scheduler import FeedPollScheduler
+
+ACE = ('subway', 'ace')
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = FeedPollScheduler([ACE, ('subway', 'g')])
+    monkeypatch.setattr(scheduler, '_jitter', lambda: 0.0)
+    return scheduler
+
+
+def next_due(scheduler, key=ACE):
+    """the time a feed is due next, in the seconds of the now arguments"""
+    return next(stats for stats in scheduler.get_stats(now=0) if stats['feed'] == '/'.join(key))['seconds_until_due']
+
+
+def test_the_period_is_learned_from_header_timestamps(scheduler):
+    assert scheduler.due_feeds(now=0) == [ACE, ('subway', 'g')]
+    # period unknown: probed every FEED_POLL_MIN_INTERVAL seconds
+    scheduler.record_poll(ACE, 1000, now=1001)
+    assert next_due(scheduler) == 1006
+    scheduler.record_poll(ACE, None, now=1006)
+    assert next_due(scheduler) == 1011
+
+    # a 30 s period: polled FEED_POLL_DELAY seconds after the next expected update
+    scheduler.record_poll(ACE, 1030, now=1031)
+    assert next_due(scheduler) == 1062
+    assert scheduler.due_feeds(now=1061) == [('subway', 'g')]
+    # found on the first try: the delay shrinks
+    scheduler.record_poll(ACE, 1060, now=1062)
+    assert next_due(scheduler) == 1091.75
+
+
+def test_late_updates_back_off_and_grow_the_delay(scheduler):
+    scheduler.record_poll(ACE, 1000, now=1001)
+    scheduler.record_poll(ACE, 1030, now=1032)
+    assert next_due(scheduler) == 1061.75
+    # the update is late: looked for again FEED_POLL_RETRY_INTERVAL seconds later
+    scheduler.record_poll(ACE, None, now=1062)
+    assert next_due(scheduler) == 1067
+    scheduler.record_poll(ACE, 1060, now=1067)
+    # the delay grew by a second, polls come later after the expected update
+    assert next_due(scheduler) == 1092.75
+    stats = scheduler.get_stats(now=1067)[0]
+    assert (stats['polls'], stats['updates'], stats['wasted_polls'], stats['poll_delay']) == (4, 3, 1, 2.75)
+
+
+def test_failures_and_deferrals_push_the_next_poll_back(scheduler):
+    scheduler.record_failure(ACE, now=10, retry_in=20)
+    assert next_due(scheduler) == 30
+    scheduler.defer(ACE, 40, now=10)
+    assert next_due(scheduler) == 50
+    scheduler.defer(ACE, 5, now=10)
+    assert next_due(scheduler) == 50
+    assert scheduler.seconds_until_next_poll(now=10) == 0.0  # g is still due
+    scheduler.make_all_due()
+    assert scheduler.due_feeds(now=0) == [ACE, ('subway', 'g')]
@@ -0,0 +1,27 @@
+from backend.services.data import live_state
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.partitions import partition_manager
+from backend.services.data.query import DataQuery
+from factories import realtime_data
+
+
+def test_latest_rows_match_the_live_state(app, tmp_path, monkeypatch):
+    partition_manager.setup()
+    state = live_state.LiveState(str(tmp_path / 'live_state.pickle'))
+    tracker = ChangeTracker()
+    # the last trip and vehicle of every feed end in the second cycle
+    for cycle in (realtime_data(trips=3), realtime_data(trips=2, timestamp=1700000030)):
+        RealtimeImporter.import_realtime_data(cycle, 'subway', tracker=tracker)
+        state.update('subway', cycle)
+        state.swap()
+
+    def latest(path):
+        monkeypatch.setattr(live_state, 'live_state_reader', live_state.LiveStateReader(path, check_interval=0))
+        return (sorted(trip.trip_id for trip in DataQuery.get_latest_trip_updates(limit=100)),
+                sorted(vehicle.trip_id for vehicle in DataQuery.get_latest_vehicle_positions(limit=100)))
+
+    trips, vehicles = latest(str(tmp_path / 'missing.pickle'))
+    assert (trips, vehicles) == latest(state.path)
+    assert trips == ['ace_000..N', 'ace_001..N', 'g_000..N', 'g_001..N']
+    assert vehicles == trips
@@ -0,0 +1,59 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import desc
+from backend import db
+from backend.models import StopTimeUpdate, TripUpdate, VehiclePosition
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.partitions import partition_manager
+from factories import realtime_data
+
+
+@pytest.fixture
+def analyzed(app):
+    """two poll cycles two hours apart, so in two partitions, with statistics"""
+    partition_manager.setup()
+    now = int(time.time())
+    for timestamp in (now - 7200, now):
+        RealtimeImporter.import_realtime_data(realtime_data(trips=10, timestamp=timestamp), 'subway')
+    db.session.execute('ANALYZE')
+    return app
+
+
+def searched_indexes(query, table_name):
+    """the index every partition of table_name is read through, None where it is scanned"""
+    compiled = query.statement.compile(db.engine)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    plan = [row[3] for row in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters)]
+    indexes = {}
+    for line in plan:
+        words = line.split(' ')
+        if words[0] in ('SCAN', 'SEARCH') and words[1].startswith(f"{table_name}_p"):
+            index = words[4] if words[0] == 'SEARCH' and words[2:4] == ['USING', 'INDEX'] else None
+            indexes[words[1]] = index and index.replace(words[1], table_name, 1)
+    return indexes
+
+
+def test_ingest_copies_the_route_of_the_trip(analyzed):
+    assert {(vehicle.trip_id[0], vehicle.route_id) for vehicle in VehiclePosition.query} == {('a', 'A'), ('g', 'G')}
+    assert {(stop.stop_id[0], stop.route_id) for stop in StopTimeUpdate.query} == {('A', 'A'), ('G', 'G')}
+
+
+def test_route_and_stop_queries_search_their_indexes(analyzed):
+    now = datetime.now()
+    shapes = [
+        (TripUpdate.query.filter_by(end_marker=False, route_id='A').order_by(desc(TripUpdate.feed_timestamp)).limit(10),
+         'trip_updates', 'ix_trip_updates_route_id_feed_timestamp'),
+        (VehiclePosition.query.filter(VehiclePosition.route_id == 'A',
+                                      VehiclePosition.feed_timestamp >= now - timedelta(minutes=5)).limit(10),
+         'vehicle_positions', 'ix_vehicle_positions_route_id_feed_timestamp'),
+        (StopTimeUpdate.query.filter(StopTimeUpdate.stop_id == 'A01N', StopTimeUpdate.arrival_time >= now,
+                                     StopTimeUpdate.arrival_time <= now + timedelta(minutes=30)).order_by(
+             StopTimeUpdate.arrival_time).limit(5),
+         'stop_time_updates', 'ix_stop_time_updates_stop_id_arrival_time'),
+    ]
+    for query, table_name, index_name in shapes:
+        assert searched_indexes(query, table_name) == {
+            partition_manager.partition_name(table_name, key): index_name
+            for key in partition_manager.partitions(table_name)
+        }
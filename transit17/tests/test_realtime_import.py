@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import event
+from backend import db
+from backend.models import StopTimeUpdate, TripUpdate, VehiclePosition
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.partitions import partition_manager
+from factories import realtime_data
+
+
+def test_a_cycle_is_inserted_in_batches_in_one_transaction(app):
+    partition_manager.setup()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO trip_updates_p') or statement.startswith('INSERT INTO stop_time'):
+            statements.append(len(parameters) if executemany else 1)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        counts = RealtimeImporter.import_realtime_data(realtime_data(trips=5, stops=3), 'subway', chunk_size=4)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert counts == {'trip_updates': 10, 'stop_time_updates': 30, 'vehicle_positions': 10, 'unchanged': 0, 'ended': 0}
+    # 10 trip updates and 30 stop time updates, 4 rows per statement
+    assert statements == [4, 4, 2] + [4] * 7 + [2]
+    trip = TripUpdate.query.filter_by(trip_id='g_004..N').one()
+    assert [stop.stop_id for stop in StopTimeUpdate.query.filter_by(trip_update_id=trip.id)] == ['G00N', 'G01N', 'G02N']
+
+
+def test_a_failed_cycle_leaves_nothing_behind(app, monkeypatch):
+    partition_manager.setup()
+    insert_partitioned = RealtimeImporter._insert_partitioned.__func__
+
+    def failing_insert(cls, group, rows, chunk_size):
+        if group == 'vehicle_positions':
+            raise RuntimeError('disk full')
+        insert_partitioned(cls, group, rows, chunk_size)
+
+    monkeypatch.setattr(RealtimeImporter, '_insert_partitioned', classmethod(failing_insert))
+    with pytest.raises(RuntimeError):
+        RealtimeImporter.import_realtime_data(realtime_data(), 'subway')
+    assert (TripUpdate.query.count(), StopTimeUpdate.query.count(), VehiclePosition.query.count()) == (0, 0, 0)
@@ -0,0 +1,40 @@
+import requests
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from backend.services.mta.replay import FeedArchive, ReplayClock, install_recorder, install_replay, uninstall_recorder
+
+
+class CanonicalAdapter(BaseAdapter):
+    """answers every request with a 200 whose url is a canonical form of the requested one"""
+
+    def send(self, request, **kwargs):
+        response = Response()
+        response.request = request
+        response.url = request.url.replace('feeds.test', 'cdn.feeds.test')
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({'ETag': '"v1"', 'Content-Type': 'application/x-protobuf'})
+        response._content = b'feed ' + request.path_url.encode()
+        return response
+
+    def close(self):
+        pass
+
+
+def test_recorded_responses_replay_under_the_requested_url(tmp_path):
+    url = 'https://feeds.test/nyct%2Fgtfs-ace'
+    live = requests.Session()
+    live.mount('https://', CanonicalAdapter())
+    recorder = install_recorder(str(tmp_path / 'feeds.mtar'), live)
+    live.get(url)
+    uninstall_recorder(recorder, live)
+
+    archive = FeedArchive(str(tmp_path / 'feeds.mtar'))
+    assert archive.urls == [url]
+    replay = requests.Session()
+    install_replay(archive, ReplayClock(archive.end), replay)
+    response = replay.get(url)
+    assert response.status_code == 200
+    assert response.content == b'feed /nyct%2Fgtfs-ace'
+    assert replay.get(url, headers={'If-None-Match': '"v1"'}).status_code == 304
+    archive.close()
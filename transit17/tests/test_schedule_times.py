@@ -0,0 +1,44 @@
+import time
+import zipfile
+from datetime import date, datetime
+from backend.services.data.importer import GTFSImporter, gtfs_seconds
+from backend.services.data.query import DataQuery, service_day_start
+
+
+def test_gtfs_times_count_past_midnight():
+    assert gtfs_seconds('8:05:00') == 29100
+    assert gtfs_seconds('25:30:15') == 91815
+
+
+def test_next_departures_include_trips_of_yesterday_running_past_midnight(app, tmp_path):
+    path = tmp_path / 'late.zip'
+    departures = {'LATE': '24:10:00', 'EARLY': '00:05:00', 'MORNING': '06:00:00', 'EVENING': '23:50:00'}
+    with zipfile.ZipFile(path, 'w') as gtfs_zip:
+        gtfs_zip.writestr('routes.txt', 'route_id,route_short_name,route_type\n1,1,1\n')
+        gtfs_zip.writestr('stops.txt', 'stop_id,stop_name,stop_lat,stop_lon\n101N,Van Cortlandt Park,40.9,-73.9\n')
+        gtfs_zip.writestr('trips.txt', 'route_id,trip_id,service_id\n' + ''.join(
+            f"1,{trip_id},Weekday\n" for trip_id in departures
+        ))
+        gtfs_zip.writestr('stop_times.txt', 'trip_id,arrival_time,departure_time,stop_id,stop_sequence\n' + ''.join(
+            f"{trip_id},{departure},{departure},101N,1\n" for trip_id, departure in departures.items()
+        ))
+    GTFSImporter().import_gtfs(str(path), 'subway')
+
+    next_departures = DataQuery.get_next_departures('101N', at=datetime(2024, 3, 5, 0, 0), limit=3)
+    assert [(departure, service_date, stop_time.trip_id) for departure, service_date, stop_time in next_departures] == [
+        (datetime(2024, 3, 5, 0, 5), date(2024, 3, 5), 'EARLY'),
+        (datetime(2024, 3, 5, 0, 10), date(2024, 3, 4), 'LATE'),
+        (datetime(2024, 3, 5, 6, 0), date(2024, 3, 5), 'MORNING'),
+    ]
+
+
+def test_service_days_start_twelve_hours_before_noon(monkeypatch):
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    try:
+        assert service_day_start(date(2024, 3, 5)) == datetime(2024, 3, 5, 0, 0)
+        # the day clocks spring forward starts at 23:00 the evening before
+        assert service_day_start(date(2024, 3, 10)) == datetime(2024, 3, 9, 23, 0)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
@@ -0,0 +1,156 @@
+import http.client
+import socket
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from sqlalchemy.exc import OperationalError
+from backend import db
+from backend.services.data import live_state
+from backend.services.data.changes import ChangeTracker
+from backend.services.data.gtfs_versions import GTFSUpdater
+from backend.services.data.importer import RealtimeImporter
+from backend.services.data.partitions import partition_manager
+from factories import next_cycle, realtime_data, write_feed
+from serve_data import MTARequestHandler, PooledHTTPServer, query_deadline
+
+
+@pytest.fixture
+def serve(app, tmp_path, monkeypatch):
+    """start a PooledHTTPServer on the scratch database, without a live state"""
+    monkeypatch.setattr(live_state, 'live_state_reader',
+                        live_state.LiveStateReader(str(tmp_path / 'missing.pickle'), check_interval=0))
+    servers = []
+
+    def start(**kwargs):
+        server = PooledHTTPServer(('127.0.0.1', 0), MTARequestHandler, app, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def get(port, path, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('GET', path, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def sections(app, state_path):
+    """vehicle, arrival and line sections of /api/status, with the live state at state_path"""
+    live_state.live_state_reader = live_state.LiveStateReader(state_path, check_interval=0)
+    handler = MTARequestHandler.__new__(MTARequestHandler)
+    handler.server = SimpleNamespace(app=app)
+    with app.app_context():
+        return handler.get_vehicle_positions(), handler.get_arrival_times(), handler.get_subway_lines_status()
+
+
+def test_database_fallbacks_match_the_live_state(app, tmp_path):
+    stops = {f"{route_id}{seq:02d}N": f"{route_id}{seq:02d}N" for route_id in 'AG' for seq in range(3)}
+    GTFSUpdater().update_gtfs(write_feed(
+        tmp_path / 'subway.zip', {'A': 'Eighth Avenue', 'G': 'Crosstown'}, stops,
+        {'TA': ('A', [stop_id for stop_id in stops if stop_id[0] == 'A']),
+         'TG': ('G', [stop_id for stop_id in stops if stop_id[0] == 'G'])}
+    ), 'subway')
+    partition_manager.setup()
+    state = live_state.LiveState(str(tmp_path / 'live_state.pickle'))
+    tracker = ChangeTracker()
+    # three change-captured cycles: some trips and vehicles unchanged, one delayed, some ended
+    cycle = realtime_data(timestamp=int(time.time()) - 60)
+    for _ in range(3):
+        RealtimeImporter.import_realtime_data(cycle, 'subway', tracker=tracker)
+        state.update('subway', cycle)
+        state.swap()
+        cycle = next_cycle(cycle)
+    db.session.remove()
+
+    live_vehicles, live_arrivals, live_lines = sections(app, state.path)
+    vehicles, arrivals, lines = sections(app, str(tmp_path / 'missing.pickle'))
+
+    # the last trip of each cycle ended in the next one
+    assert sorted(vehicle['trip_id'] for vehicle in vehicles) == sorted(vehicle['trip_id'] for vehicle in live_vehicles) == \
+        ['ace_000..N', 'ace_001..N', 'ace_002..N', 'g_000..N']
+    # the same keys and values from both paths
+    assert sorted(arrivals, key=lambda arrival: sorted(arrival.items())) == \
+        sorted(live_arrivals, key=lambda arrival: sorted(arrival.items()))
+    assert {name: len(line['vehicles']) for name, line in lines.items()} == \
+        {name: len(line['vehicles']) for name, line in live_lines.items()}
+
+
+def test_status_sections_keep_their_stations_and_keys(app, tmp_path, monkeypatch):
+    # A00N-A02N get the arrivals of the ace feed; the last five stops also
+    # serve route B but come after the first 50 stops, which are the stations
+    stop_ids = [f"A{seq:02d}N" for seq in range(3)] + [f"S{seq:02d}" for seq in range(3, 50)]
+    shared = [f"X{seq:02d}" for seq in range(5)]
+    GTFSUpdater().update_gtfs(write_feed(
+        tmp_path / 'subway.zip', {'A': 'Eighth Avenue', 'B': 'Sixth Avenue'},
+        {stop_id: stop_id for stop_id in stop_ids + shared},
+        {'T1': ('A', stop_ids + shared), 'T2': ('B', shared)}
+    ), 'subway')
+    partition_manager.setup()
+    RealtimeImporter.import_realtime_data(realtime_data(feed_ids=('ace',), timestamp=int(time.time())), 'subway')
+
+    handler = MTARequestHandler.__new__(MTARequestHandler)
+    handler.server = SimpleNamespace(app=app)
+    monkeypatch.setattr(live_state, 'live_state_reader',
+                        live_state.LiveStateReader(str(tmp_path / 'missing.pickle'), check_interval=0))
+    stations = handler.get_major_stations()
+    arrivals = handler.get_arrival_times()
+
+    assert len(stations) == 10
+    assert {station['lines'] for station in stations} == {'A'}
+    first = next(station for station in stations if station['name'] == 'A00N')
+    assert [set(arrival) for arrival in first['arrivals']] == [{'route', 'arrival_time', 'status'}] * 3
+    assert {arrival['route'] for arrival in first['arrivals']} == {'A'}
+    assert len(arrivals) == 9
+    assert all(set(arrival) == {'stop_id', 'trip_id', 'arrival_time', 'status'} for arrival in arrivals)
+
+
+def test_query_strings_do_not_change_the_resource(serve):
+    port = serve()
+    status, headers, body = get(port, '/api/status')
+    assert status == 200
+    assert get(port, '/api/status?_=1700000000')[2] == body
+    # the same payload, so the same ETag
+    assert get(port, '/api/status?_=1', {'If-None-Match': headers['ETag']})[0] == 304
+    assert get(port, '/api/other?_=1')[0] == 404
+
+
+def test_requests_past_their_deadline_get_504(serve):
+    port = serve(request_timeout=0)
+    status, _, body = get(port, '/api/status')
+    assert status == 504
+    assert b'Request timed out' in body
+
+
+def test_connections_beyond_the_workers_and_backlog_get_503(serve):
+    port = serve(workers=1, backlog=0)
+    # holds the only worker: connected, request never sent
+    idle = socket.create_connection(('127.0.0.1', port))
+    try:
+        time.sleep(0.2)
+        status, headers, _ = get(port, '/api/status')
+        assert status == 503
+        assert headers['Retry-After'] == '1'
+    finally:
+        idle.close()
+    time.sleep(0.2)
+    assert get(port, '/api/status')[0] == 200
+
+
+def test_query_deadline_interrupts_running_statements(app):
+    slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+    with pytest.raises(OperationalError, match='interrupted'):
+        with query_deadline(time.monotonic() + 0.05):
+            db.session.execute(slow)
+    db.session.rollback()
+    with query_deadline(time.monotonic() + 5):
+        assert db.session.execute("SELECT 1").scalar() == 1
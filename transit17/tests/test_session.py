@@ -0,0 +1,48 @@
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from backend.services.mta.session import connection_stats, create_session, get_session
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """keep-alive server answering every GET with a gzipped body when the client accepts it"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'feed ' * 100
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GzipHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_reuses_connections_and_decompresses(server):
+    session = create_session()
+    connection_stats.reset()
+    responses = [session.get(f"{server}/feed/{index}", timeout=5) for index in range(3)]
+
+    assert [response.content for response in responses] == [b'feed ' * 100] * 3
+    assert responses[0].headers['Content-Encoding'] == 'gzip'
+    stats = connection_stats.snapshot()
+    assert (stats['requests'], stats['new_connections'], stats['reused_connections']) == (3, 1, 2)
+    session.close()
+
+
+def test_services_share_one_session():
+    assert get_session() is get_session()
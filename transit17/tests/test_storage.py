@@ -0,0 +1,34 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from backend import create_app, db
+from backend.services.data.storage import engine_options
+
+
+def test_writers_run_in_wal_mode_with_the_pragmas(app):
+    assert db.session.execute("PRAGMA journal_mode").scalar() == 'wal'
+    assert db.session.execute("PRAGMA synchronous").scalar() == 1  # NORMAL
+    assert db.session.execute("PRAGMA busy_timeout").scalar() == 10000
+    assert db.engine.pool.size() == 1
+
+
+def test_readers_see_committed_writes_and_cannot_write(app):
+    db.session.execute("CREATE TABLE samples (value INTEGER)")
+    db.session.execute("INSERT INTO samples VALUES (1)")
+    db.session.commit()
+
+    reader = create_app({'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI']}, readonly=True)
+    with reader.app_context():
+        engine = db.get_engine()
+    assert engine.pool.size() == 8
+    with engine.connect() as connection:
+        assert connection.execute("SELECT value FROM samples").scalar() == 1
+        with pytest.raises(OperationalError, match='readonly'):
+            connection.execute("INSERT INTO samples VALUES (2)")
+    engine.dispose()
+
+
+def test_rollback_mode_and_memory_databases_keep_the_defaults(tmp_path):
+    assert engine_options(f"sqlite:///{tmp_path / 'test.db'}", mode='rollback') == {}
+    assert engine_options('sqlite://') == {}
+    with pytest.raises(ValueError):
+        engine_options(f"sqlite:///{tmp_path / 'test.db'}", mode='journal')